@@ -0,0 +1,330 @@
+# Indexed, resumable gcode programs
+# An archive is a plain .nc program (it can be sent as it is) with a seek index next to it (<program>.idx). The
+# index has a record for every layer, pattern and circuit boundary of the program (the toolpath marks, see
+# toolpath.py): its byte offset and line number in the program, and the machine state just before it: logical X
+# and Z, the feed rate in effect and the G92 offset between the logical and the machine position.
+# To restart a wind part way through (broken tow, fault...), resume() looks the boundary up in the index, writes
+# a re-entry preamble that puts the machine back in that state and carries on with the program from the
+# boundary's byte offset. Nothing is replanned and the program is not read up to that point.
+
+# The index is one numpy record array, memory mapped when opened, laid out so any boundary is found directly:
+#   - record 0: header (index version, number of layers, lines and bytes of the program it belongs to)
+#   - records 1..layers: one per layer, in layer order, with where its patterns and circuits start in the index
+#     and how many records each pattern takes (its own plus its circuits') when every pattern has as many circuits
+#   - then every pattern and circuit record, in program order
+# The program must not be edited after it was archived; resume() refuses a program whose size does not match.
+
+# Re-entry preamble: G20, G28 and G92 X0 Z0 as at the start of the program, the feed rate, a move to the machine
+# position of the boundary and a G92 back to its logical position. The mandrel only has to be at the same angle,
+# so Z goes to the angle of the boundary within a turn instead of unwinding everything wound so far.
+
+# Usage:
+#   archive.writeArchive(machine.getToolpath(), 'windGcode.nc')       # writes windGcode.nc and windGcode.nc.idx
+#   archive.resume('windGcode.nc', 'resumeGcode.nc', layer=3, pattern=17)
+#   grbl.stream(archive.resumeLines('windGcode.nc', layer=3, pattern=17))   # straight to the machine (sender.py)
+# or from the command line:
+#   python archive.py write TEST.wind windGcode.nc
+#   python archive.py list windGcode.nc
+#   python archive.py resume windGcode.nc --layer 3 --pattern 17 --out resumeGcode.nc
+#   python archive.py resume windGcode.nc --line 5120 --out resumeGcode.nc     # last boundary before line 5120
+
+import argparse
+import os
+import shutil
+import sys
+
+import numpy as np
+
+import config
+import toolpath
+from toolpath import Toolpath
+
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+# Kind of the header record (the others are toolpath.LAYER, PATTERN and CIRCUIT)
+HEADER = 255
+
+RECORD = np.dtype([('kind', np.uint8), ('layer', np.int32), ('pattern', np.int32), ('circuit', np.int32),
+                   ('row', np.int64), ('line', np.int64), ('offset', np.int64),
+                   ('x', np.float64), ('z', np.float64), ('feed', np.float64),
+                   ('offsetX', np.float64), ('offsetZ', np.float64),
+                   ('first', np.int64), ('count', np.int64), ('stride', np.int64)])
+
+# Bytes copied at a time when streaming the rest of the program
+COPY_SIZE = 1 << 20
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def indexPath(path) -> str:
+    return path + INDEX_SUFFIX
+
+
+# Writes the toolpath as a gcode program to path and its index next to it
+# Returns the index records
+def writeArchive(path: Toolpath, file):
+    lineBytes = []
+    with open(file, 'wb') as f:
+        for lines in path.iterChunks():
+            text = '\n'.join(lines) + '\n'
+            data = text.encode('utf-8')
+            f.write(data)
+            if len(data) == len(text):
+                lineBytes.append(np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)) + 1)
+            else:
+                lineBytes.append(np.array([len(line.encode('utf-8')) + 1 for line in lines], dtype=np.int64))
+    lineBytes = np.concatenate(lineBytes) if lineBytes else np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lineBytes)))
+
+    records = buildIndex(path, offsets)
+    with open(indexPath(file), 'wb') as f:
+        np.save(f, records)
+    return records
+
+
+# Index records of a toolpath, given the byte offset of every row (and the end of the program)
+def buildIndex(path: Toolpath, offsets):
+    marks = path.marks()
+    order = np.lexsort((marks['kind'], marks['row']))
+    rows = marks['row'][order]
+    kinds = marks['kind'][order]
+
+    # State before each boundary is the state after the row before it
+    cols = path.arrays()
+    machineX, machineZ = path.machinePositions()
+    before = np.maximum(rows - 1, 0)
+    hasBefore = rows > 0
+
+    found = np.zeros(rows.size, dtype=RECORD)
+    found['kind'] = kinds
+    found['layer'] = marks['layer'][order]
+    found['pattern'] = np.where(kinds == toolpath.LAYER, -1, marks['pattern'][order])
+    found['circuit'] = np.where(kinds == toolpath.CIRCUIT, marks['circuit'][order], -1)
+    found['row'] = rows
+    found['line'] = rows + 1
+    found['offset'] = offsets[rows]
+    if rows.size:
+        found['x'] = np.where(hasBefore, cols['x'][before], 0.0)
+        found['z'] = np.where(hasBefore, cols['z'][before], 0.0)
+        found['feed'] = np.where(hasBefore, cols['feed'][before], 0.0)
+        found['offsetX'] = np.where(hasBefore, machineX[before], 0.0) - found['x']
+        found['offsetZ'] = np.where(hasBefore, machineZ[before], 0.0) - found['z']
+
+    # Layers go up front, in layer order, each pointing at its patterns and circuits
+    isLayer = kinds == toolpath.LAYER
+    layers = found[isLayer]
+    layers = layers[np.argsort(layers['layer'], kind='stable')]
+    rest = found[~isLayer]
+
+    header = np.zeros(1, dtype=RECORD)
+    header['kind'] = HEADER
+    header['layer'] = INDEX_VERSION
+    header['pattern'] = layers.size
+    header['row'] = len(offsets) - 1
+    header['line'] = len(offsets) - 1
+    header['offset'] = offsets[-1]
+
+    base = 1 + layers.size
+    starts = np.searchsorted(rest['layer'], layers['layer'], side='left') if rest.size else np.zeros(layers.size, dtype=np.int64)
+    ends = np.searchsorted(rest['layer'], layers['layer'], side='right') if rest.size else np.zeros(layers.size, dtype=np.int64)
+    layers['first'] = base + starts
+    layers['count'] = ends - starts
+    layers['stride'] = [patternStride(rest[start:end]) for start, end in zip(starts, ends)]
+    return np.concatenate((header, layers, rest))
+
+
+# Records per pattern when every pattern of a layer is a pattern record followed by circuits 0..m-1, else 0
+def patternStride(span):
+    numPatterns = int(np.count_nonzero(span['kind'] == toolpath.PATTERN))
+    if numPatterns == 0 or span.size % numPatterns:
+        return 0
+    stride = span.size // numPatterns
+    grid = span.reshape(numPatterns, stride)
+    regular = ((grid['kind'][:, 0] == toolpath.PATTERN).all()
+               and (grid['kind'][:, 1:] == toolpath.CIRCUIT).all()
+               and (grid['pattern'] == np.arange(numPatterns)[:, None]).all()
+               and (grid['circuit'][:, 1:] == np.arange(stride - 1)).all())
+    return stride if regular else 0
+
+
+# Opens the index of a program, memory mapped
+def openIndex(file):
+    try:
+        records = np.load(indexPath(file), mmap_mode='r')
+    except (OSError, ValueError) as e:
+        raise ArchiveError(f"No usable index for {file}: {e}")
+    if records.dtype != RECORD or records.size == 0 or records[0]['kind'] != HEADER:
+        raise ArchiveError(f"{indexPath(file)} is not an archive index")
+    if records[0]['layer'] != INDEX_VERSION:
+        raise ArchiveError(f"{indexPath(file)} has index version {records[0]['layer']}, expected {INDEX_VERSION}")
+    return records
+
+
+# Index record of a layer, pattern or circuit boundary (pattern/circuit -1 for the start of the layer/pattern)
+def find(records, layer, pattern=-1, circuit=-1):
+    numLayers = int(records[0]['pattern'])
+    if not 0 <= layer < numLayers or records[1 + layer]['layer'] != layer:
+        raise ArchiveError(f"No layer {layer} in the archive ({numLayers} layers)")
+    layerRecord = records[1 + layer]
+    if pattern < 0:
+        if circuit >= 0:
+            raise ArchiveError("A circuit needs a pattern")
+        return layerRecord
+
+    kind = toolpath.CIRCUIT if circuit >= 0 else toolpath.PATTERN
+    first, count, stride = int(layerRecord['first']), int(layerRecord['count']), int(layerRecord['stride'])
+    if stride and pattern < count // stride and circuit < stride - 1:
+        record = records[first + pattern * stride + circuit + 1]
+        if record['kind'] == kind and record['pattern'] == pattern and record['circuit'] == circuit:
+            return record
+
+    # Patterns of different sizes: look through the records of this layer only
+    span = records[first:first + count]
+    match = np.flatnonzero((span['kind'] == kind) & (span['pattern'] == pattern) & (span['circuit'] == circuit))
+    if match.size == 0:
+        where = f"pattern {pattern}" + (f" circuit {circuit}" if circuit >= 0 else "")
+        raise ArchiveError(f"No {where} in layer {layer}")
+    return span[match[0]]
+
+
+# Last boundary at or before a line of the program (1-based), e.g. the line the machine stopped at
+def findLine(records, line):
+    numLayers = int(records[0]['pattern'])
+    layers = records[1:1 + numLayers]
+    i = int(np.searchsorted(layers['line'], line, side='right')) - 1
+    if i < 0:
+        raise ArchiveError(f"Line {line} comes before the first layer")
+    layerRecord = layers[i]
+    first, count = int(layerRecord['first']), int(layerRecord['count'])
+    span = records[first:first + count]
+    j = int(np.searchsorted(span['line'], line, side='right')) - 1
+    return span[j] if j >= 0 else layerRecord
+
+
+def describe(record) -> str:
+    where = f"layer {record['layer']}"
+    if record['pattern'] >= 0:
+        where += f" pattern {record['pattern']}"
+    if record['circuit'] >= 0:
+        where += f" circuit {record['circuit']}"
+    return where
+
+
+# Gcode that puts the machine in the state it was in just before the boundary
+def preamble(record):
+    number = toolpath.formatNumber
+    machineX = float(record['x'] + record['offsetX'])
+    angle = float(record['z'] + record['offsetZ']) % 360
+    return [f"(Resume at {describe(record)}, line {record['line']})",
+            "G20",
+            "G28",
+            "G92 X0 Z0",
+            "G01 F" + number(float(record['feed'])),
+            "G01 X" + number(round(machineX, 3)) + " Z" + number(round(angle, 3)),
+            "G92 X" + number(float(record['x'])) + " Z" + number(float(record['z']))]
+
+
+# Index record to resume from: a line, or a layer with optional pattern and circuit
+def lookup(file, layer=None, pattern=-1, circuit=-1, line=None):
+    records = openIndex(file)
+    size = os.path.getsize(file)
+    if size != records[0]['offset']:
+        raise ArchiveError(f"{file} is {size} bytes but was archived at {records[0]['offset']}; it has been changed")
+    if line is not None:
+        return findLine(records, line)
+    if layer is None:
+        raise ArchiveError("Give a layer or a line to resume from")
+    return find(records, layer, pattern, circuit)
+
+
+# Writes the re-entry preamble and the rest of the program from the boundary to out
+# Returns the index record it resumed from
+def resume(file, out, layer=None, pattern=-1, circuit=-1, line=None):
+    record = lookup(file, layer, pattern, circuit, line)
+    with open(file, 'rb') as source, open(out, 'wb') as target:
+        target.write(('\n'.join(preamble(record)) + '\n').encode('utf-8'))
+        source.seek(int(record['offset']))
+        shutil.copyfileobj(source, target, COPY_SIZE)
+    return record
+
+
+# The same as lines, for streaming straight to the machine
+def resumeLines(file, layer=None, pattern=-1, circuit=-1, line=None):
+    record = lookup(file, layer, pattern, circuit, line)
+    yield from preamble(record)
+    with open(file, 'r', encoding='utf-8', newline='\n') as source:
+        source.seek(int(record['offset']))
+        for text in source:
+            yield text.rstrip('\n')
+
+
+def printIndex(records, printFn=print):
+    header = records[0]
+    numLayers = int(header['pattern'])
+    printFn(f"{header['line']} lines, {header['offset']} bytes, {records.size - 1} boundaries in {numLayers} layers")
+    for layerRecord in records[1:1 + numLayers]:
+        span = records[int(layerRecord['first']):int(layerRecord['first'] + layerRecord['count'])]
+        patterns = int(np.count_nonzero(span['kind'] == toolpath.PATTERN))
+        circuits = int(np.count_nonzero(span['kind'] == toolpath.CIRCUIT))
+        printFn(f"\tLayer {layerRecord['layer']}: line {layerRecord['line']}, byte {layerRecord['offset']}, "
+                f"{patterns} patterns, {circuits} circuits")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write indexed gcode programs and resume them part way through")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    write = commands.add_parser('write', help="plan a wind file (or read a gcode file) and write it with its index")
+    write.add_argument('source', help="wind file, or gcode file with pattern comments")
+    write.add_argument('out', help="gcode file to write; the index goes next to it")
+    write.add_argument('--config', default=config.DEFAULT_CONFIG, help="machine config file or profile")
+    write.add_argument('--workers', '-j', type=int, default=1, help="worker processes for planning (0: all cores)")
+
+    show = commands.add_parser('list', help="show the layers in an archive's index")
+    show.add_argument('file', help="archived gcode file")
+
+    again = commands.add_parser('resume', help="write a program that carries on from a boundary")
+    again.add_argument('file', help="archived gcode file")
+    again.add_argument('--layer', type=int, default=None)
+    again.add_argument('--pattern', type=int, default=-1)
+    again.add_argument('--circuit', type=int, default=-1)
+    again.add_argument('--line', type=int, default=None, help="resume from the last boundary at or before this line")
+    again.add_argument('--out', default='resumeGcode.nc', help="gcode file to write")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'write':
+            if args.source.lower().endswith(('.nc', '.gcode')):
+                import reader
+                path = reader.readGcode(args.source)
+            else:
+                import helper
+                import load
+                import planner
+                import winder
+                [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(args.source))
+                machine = winder.Winder(defaultFeedRate, machineConfig=args.config)
+                machine.setFeedRate(defaultFeedRate, force=True)
+                planner.planWind(schedule, machine, workers=args.workers)
+                path = machine.getToolpath()
+            records = writeArchive(path, args.out)
+            print(f"Written {args.out} with {records.size - 1} boundaries indexed in {indexPath(args.out)}")
+
+        elif args.command == 'list':
+            printIndex(openIndex(args.file))
+
+        else:
+            record = resume(args.file, args.out, args.layer, args.pattern, args.circuit, args.line)
+            print(f"Resuming at {describe(record)} (line {record['line']}), written to {args.out}")
+    except (OSError, ArchiveError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
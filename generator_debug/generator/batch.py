@@ -0,0 +1,149 @@
+# Headless batch generation
+# Plans many wind files at once without any dialogs, spreading the work over a process pool.
+# Writes one .nc per input and prints a summary line per file.
+
+# Usage:
+#   python batch.py layups/*.wind --config machine_config.json --jobs 8 --out ../testouts
+#   python batch.py layups/*.wind --cache layer_cache     # only replan layers that changed since the last run
+#   python batch.py big.wind --jobs 8                      # a single file has its layers planned in parallel
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+import helper
+import layercache
+import load
+import optimizer
+import planner
+import sinks
+import winder
+
+
+# Plans a single wind file and writes it next to the input (or into outDir)
+# Runs in a worker process, so everything it reports comes back in the returned dict
+# cacheDir, if given, keeps planned layers on disk so unchanged layers are not planned again (see layercache.py)
+# workers plans the file's layers in that many processes (0 for all cores, see parallel.py)
+def planFile(windFile, machineConfig, outDir=None, feedRate=None, optimize=False, stripComments=False, cacheDir=None,
+             workers=1):
+    summary = {'input': windFile, 'output': None, 'lines': 0, 'seconds': 0.0, 'messages': [], 'error': None}
+
+    base = os.path.splitext(os.path.basename(windFile))[0] + '.nc'
+    output = os.path.join(outDir if outDir else os.path.dirname(windFile), base)
+
+    start = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(windFile))
+            if feedRate is not None:
+                defaultFeedRate = feedRate
+
+            cache = layercache.LayerCache(cacheDir) if cacheDir else None
+            try:
+                with sinks.FileSink(output) as sink:
+                    if optimize:
+                        # The optimizer needs the whole toolpath, so this plans in memory before writing
+                        machine = winder.Winder(defaultFeedRate, machineConfig=machineConfig)
+                        machine.setFeedRate(defaultFeedRate, force=True)
+                        planner.planWind(schedule, machine, cache=cache, workers=workers)
+                        optimized, report = optimizer.optimize(machine.getToolpath(), stripComments)
+                        for lines in optimized.iterChunks():
+                            sink.pushLines(lines)
+                        print(f"Optimized: saved {report['linesSaved']} lines, {report['bytesSaved']} bytes")
+                    else:
+                        planner.planWindTo(schedule, defaultFeedRate, sink, machineConfig, cache, workers)
+            except BaseException:
+                # No partial program is left behind
+                with contextlib.suppress(OSError):
+                    os.remove(output)
+                raise
+
+        summary['output'] = output
+        summary['lines'] = sink.lineCount
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+
+    summary['seconds'] = time.perf_counter() - start
+    summary['messages'] = [line.strip() for line in log.getvalue().splitlines() if line.strip()]
+    return summary
+
+
+# Expands the given files/glob patterns into a sorted list of unique paths
+def expandInputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        files.extend(matches)
+    return sorted(set(files))
+
+
+# The machine config is loaded and validated once here and shipped to the workers as is
+# A single file has its layers spread over the workers instead, if jobs is given (one process otherwise)
+def planFiles(windFiles, machineConfig, outDir=None, feedRate=None, jobs=None, optimize=False, stripComments=False, cacheDir=None):
+    machineConfig = config.getConfig(machineConfig)
+    if outDir:
+        os.makedirs(outDir, exist_ok=True)
+
+    if jobs == 1 or len(windFiles) <= 1:
+        workers = jobs if jobs is not None and len(windFiles) == 1 else 1
+        return [planFile(f, machineConfig, outDir, feedRate, optimize, stripComments, cacheDir, workers) for f in windFiles]
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(planFile, f, machineConfig, outDir, feedRate, optimize, stripComments, cacheDir) for f in windFiles]
+        return [future.result() for future in futures]
+
+
+def printSummary(results):
+    print("=================================================================")
+    for result in results:
+        if result['error'] is None:
+            print(f"OK    {result['input']} -> {result['output']}: {result['lines']} lines in {result['seconds']:.3f} s")
+        else:
+            print(f"FAIL  {result['input']}: {result['error']}")
+        for message in result['messages']:
+            print(f"\t{message}")
+    failed = sum(1 for result in results if result['error'] is not None)
+    print("-----------------------------------------------------------------")
+    print(f"{len(results) - failed} generated, {failed} failed")
+    print("=================================================================")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate gcode for many wind files without the GUI")
+    parser.add_argument('inputs', nargs='+', help="wind files or glob patterns")
+    parser.add_argument('--config', default=config.DEFAULT_CONFIG, help="machine config file or profile name")
+    parser.add_argument('--out', default=None, help="output directory (default: next to each input)")
+    parser.add_argument('--feed', type=float, default=None, help="override the default feed rate of every file")
+    parser.add_argument('--jobs', '-j', type=int, default=None, help="number of worker processes (default: all cores; one for a single file)")
+    parser.add_argument('--optimize', action='store_true', help="shrink the output with optimizer.py")
+    parser.add_argument('--strip-comments', action='store_true', help="drop comments when optimizing")
+    parser.add_argument('--cache', default=None, help="directory to keep planned layers in between runs")
+    args = parser.parse_args(argv)
+
+    windFiles = expandInputs(args.inputs)
+    if not windFiles:
+        print("No wind files matched.")
+        return 1
+
+    try:
+        machineConfig = config.getConfig(args.config)
+    except (OSError, ValueError) as e:
+        print(f"Could not load machine config: {e}")
+        return 1
+
+    results = planFiles(windFiles, machineConfig, args.out, args.feed, args.jobs, args.optimize, args.strip_comments, args.cache)
+    printSummary(results)
+    return 0 if all(result['error'] is None for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
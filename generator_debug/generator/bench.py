@@ -0,0 +1,244 @@
+# Benchmarks of the generator
+# Builds synthetic schedules that scale one thing at a time, starting from a base case:
+#   - layers: number of helical layers
+#   - towWidth: narrower tow means more circuits per layer
+#   - windLength: longer mandrel (and X limit)
+# and times on each of them:
+#   - plan: planner.planWind as the generator runs it (vectorized helical layers)
+#   - planLoop: the same through Winder.moveBy one move at a time
+#   - planParallel: the same with the layers spread over a process pool (parallel.py), pool start-up included
+#   - render: formatting the toolpath into gcode text
+#   - write: planning straight into a .nc file (planner.writeWind)
+#   - parse: reading that file back (reader.readGcode)
+# Each result has the best time over a few repeats, moves per second and the peak memory of a separate run
+# under tracemalloc (numpy reports its allocations to it too). Results are written as JSON, and a baseline
+# file can be given to flag anything that got slower (or bigger) by more than a threshold.
+
+# Usage:
+#   python bench.py --out bench.json
+#   python bench.py --quick --baseline bench.json --threshold 0.15
+#   python bench.py --compare old.json new.json
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import config
+import definitions
+import planner
+import reader
+import toolpath
+import winder
+
+
+# Base case and what each scale goes through
+BASE = {'layers': 20, 'towWidth': 0.05, 'windLength': 54.0}
+SCALES = {'layers': (5, 20, 80),
+          'towWidth': (0.2, 0.05, 0.0125),
+          'windLength': (18.0, 54.0, 162.0)}
+
+# --quick divides the number of layers by this
+QUICK_FACTOR = 4
+
+MANDREL_DIAMETER = 6.0
+WIND_ANGLE = 30.0
+FEED_RATE = 3000.0
+
+BENCHMARKS = ('plan', 'planLoop', 'planParallel', 'render', 'write', 'parse')
+
+# Fraction a result may get worse by before it counts as a regression
+THRESHOLD = 0.10
+
+
+# Helical layers of the given tow width over the given length; one start, so every tow width is valid
+# Returns (schedule, machine config)
+def syntheticSchedule(layers=BASE['layers'], towWidth=BASE['towWidth'], windLength=BASE['windLength'],
+                      mandrelDiameter=MANDREL_DIAMETER, windAngle=WIND_ANGLE):
+    machineConfig = config.parseConfig({'mandrel_diameter': mandrelDiameter,
+                                        'mandrel_length': windLength,
+                                        'x_limit': windLength}, '<synthetic>')
+    schedule = [definitions.HelicalWind(windLength, towWidth, 0.01, windAngle, 1, 0, 720, 0, 0, i > 0)
+                for i in range(int(layers))]
+    return schedule, machineConfig
+
+
+# Distinct cases: the base case and every step of every scale
+def cases(quick=False):
+    found = {}
+    for name, values in SCALES.items():
+        for value in values:
+            params = dict(BASE, **{name: value})
+            if quick:
+                params['layers'] = max(1, params['layers'] // QUICK_FACTOR)
+            key = caseName(params)
+            found.setdefault(key, params)
+    return found
+
+
+def caseName(params) -> str:
+    return f"layers={params['layers']:g} tow={params['towWidth']:g} length={params['windLength']:g}"
+
+
+# ---------------- benchmarks ----------------
+def planMachine(schedule, machineConfig, vectorized=True, workers=1):
+    machine = winder.Winder(FEED_RATE, machineConfig=machineConfig)
+    machine.setFeedRate(FEED_RATE, force=True)
+    planner.planWind(schedule, machine, vectorized, workers=workers)
+    return machine
+
+
+# Each benchmark is set up outside the timing and returns a function to time
+def setUp(benchmark, schedule, machineConfig, directory):
+    nc = os.path.join(directory, 'bench.nc')
+
+    if benchmark == 'plan':
+        return lambda: planMachine(schedule, machineConfig)
+    if benchmark == 'planLoop':
+        return lambda: planMachine(schedule, machineConfig, vectorized=False)
+    if benchmark == 'planParallel':
+        return lambda: planMachine(schedule, machineConfig, workers=0)
+    if benchmark == 'render':
+        path = planMachine(schedule, machineConfig).getToolpath()
+        return path.render
+    if benchmark == 'write':
+        return lambda: planner.writeWind(schedule, FEED_RATE, nc, machineConfig)
+    if benchmark == 'parse':
+        planner.writeWind(schedule, FEED_RATE, nc, machineConfig)
+        return lambda: reader.readGcode(nc)
+    raise ValueError(f"unknown benchmark {benchmark!r}")
+
+
+# Best wall time over the repeats, then the peak memory of one more run
+def measure(run, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def runCase(name, params, benchmarks=BENCHMARKS, repeats=3, log=print):
+    schedule, machineConfig = syntheticSchedule(**params)
+
+    # Size of the job, for throughput
+    path = planMachine(schedule, machineConfig).getToolpath()
+    moves = int(np.count_nonzero(path.arrays()['op'] == toolpath.MOVE))
+    lines = len(path)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for benchmark in benchmarks:
+            run = setUp(benchmark, schedule, machineConfig, directory)
+            seconds, peak = measure(run, repeats)
+            result = {'case': name, 'benchmark': benchmark, 'params': params, 'moves': moves, 'lines': lines,
+                      'seconds': seconds, 'movesPerSecond': moves / seconds if seconds > 0 else 0.0,
+                      'peakBytes': peak}
+            if benchmark == 'write':
+                result['bytes'] = os.path.getsize(os.path.join(directory, 'bench.nc'))
+            results.append(result)
+            log(f"{name:<40} {benchmark:<12} {seconds * 1000:10.1f} ms {result['movesPerSecond']:14,.0f} moves/s "
+                f"{peak / 2 ** 20:8.1f} MB")
+    return results
+
+
+def runAll(quick=False, benchmarks=BENCHMARKS, repeats=3, log=print):
+    results = []
+    for name, params in cases(quick).items():
+        results.extend(runCase(name, params, benchmarks, repeats, log))
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'quick': quick,
+            'results': results}
+
+
+# ---------------- comparison ----------------
+# Results of the same case and benchmark in both runs where moves per second dropped, or peak memory grew,
+# by more than the threshold
+# Returns a list of dicts with case, benchmark, metric, old, new and change (as a fraction)
+def compare(old, new, threshold=THRESHOLD):
+    before = {(r['case'], r['benchmark']): r for r in old['results']}
+    regressions = []
+    for result in new['results']:
+        previous = before.get((result['case'], result['benchmark']))
+        if previous is None:
+            continue
+        for metric, worse in (('movesPerSecond', -1), ('peakBytes', 1)):
+            if not previous[metric]:
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric]
+            if change * worse > threshold:
+                regressions.append({'case': result['case'], 'benchmark': result['benchmark'], 'metric': metric,
+                                    'old': previous[metric], 'new': result[metric], 'change': change})
+    return regressions
+
+
+def printRegressions(regressions, threshold):
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%}")
+        return
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}:")
+    for r in regressions:
+        print(f"\t{r['case']} {r['benchmark']}: {r['metric']} {r['old']:,.0f} -> {r['new']:,.0f} ({r['change']:+.1%})")
+
+
+def readResults(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def writeResults(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark planning, formatting and file I/O")
+    parser.add_argument('--out', default=None, help="write the results to this JSON file")
+    parser.add_argument('--quick', action='store_true', help=f"{QUICK_FACTOR}x fewer layers in every case")
+    parser.add_argument('--repeats', type=int, default=3, help="runs per benchmark, the best one counts")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help="benchmarks to run")
+    parser.add_argument('--baseline', default=None, help="results file to check this run against")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), default=None,
+                        help="compare two results files without running anything")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="allowed slowdown/growth, as a fraction")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare(readResults(args.compare[0]), readResults(args.compare[1]), args.threshold)
+        printRegressions(regressions, args.threshold)
+        return 1 if regressions else 0
+
+    results = runAll(args.quick, args.only, args.repeats)
+    if args.out:
+        writeResults(results, args.out)
+        print(f"Results written to {args.out}")
+
+    if args.baseline:
+        regressions = compare(readResults(args.baseline), results, args.threshold)
+        printRegressions(regressions, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
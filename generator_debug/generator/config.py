@@ -0,0 +1,122 @@
+# Machine configuration registry
+# Each machine config file is read, validated and turned into an immutable MachineConfig once.
+# Later lookups are served from a cache that is refreshed only when the file changes on disk,
+# so repeated or batch generations do not re-read and re-parse the file.
+
+# Configs can be looked up by path, or by a profile name registered with registerProfile(),
+# which lets several machines (or mandrels) be kept side by side:
+#   config.registerProfile('small', 'configs/small_mandrel.json')
+#   machine = winder.Winder(30, machineConfig='small')
+
+import json
+import math
+import os
+from dataclasses import dataclass
+
+
+# The machine_config.json next to this file, so the scripts find it from any directory
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'machine_config.json')
+
+
+class ConfigError(ValueError):
+    pass
+
+
+# Units follow the gcode (G20): inches for X, degrees for Z, feed rates per minute, accelerations per second squared
+@dataclass(frozen=True)
+class MachineConfig:
+    mandrelDiameter: float
+    mandrelLength: float
+    xLimit: float
+    maxFeedX: float
+    maxFeedZ: float
+    accelX: float
+    accelZ: float
+    junctionDeviation: float
+    path: str = ''
+
+    # Highest mandrel speed the Z feed limit allows, in revolutions per minute
+    def maxRpm(self) -> float:
+        return self.maxFeedZ / 360
+
+    # Length of one turn around the mandrel [in]
+    def mandrelCircumference(self) -> float:
+        return math.pi * self.mandrelDiameter
+
+
+# Schema of the config file: json key -> (MachineConfig field, default or None if required)
+SCHEMA = {
+    'mandrel_diameter': ('mandrelDiameter', None),
+    'mandrel_length': ('mandrelLength', None),
+    'x_limit': ('xLimit', None),
+    'max_feed_x': ('maxFeedX', 200.0),
+    'max_feed_z': ('maxFeedZ', 36000.0),
+    'accel_x': ('accelX', 10.0),
+    'accel_z': ('accelZ', 3600.0),
+    'junction_deviation': ('junctionDeviation', 0.0004),
+}
+
+
+# path -> (modification time, MachineConfig)
+_cache = {}
+
+# profile name -> path
+_profiles = {}
+
+
+def registerProfile(name, path):
+    _profiles[name] = path
+
+
+def profiles():
+    return dict(_profiles)
+
+
+# Returns the MachineConfig for a profile name, a path, or an existing MachineConfig
+def getConfig(source=DEFAULT_CONFIG) -> MachineConfig:
+    if isinstance(source, MachineConfig):
+        return source
+
+    path = os.path.abspath(_profiles.get(source, source))
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    machineConfig = parseConfig(data, path)
+    _cache[path] = (mtime, machineConfig)
+    return machineConfig
+
+
+def clearCache():
+    _cache.clear()
+
+
+# Validates the contents of a config file against SCHEMA, reporting every problem at once
+def parseConfig(data, path='') -> MachineConfig:
+    if not isinstance(data, dict):
+        raise ConfigError(f"{path}: machine config must be a JSON object")
+
+    values = {}
+    problems = []
+    for key, (field, default) in SCHEMA.items():
+        value = data.get(key, default)
+        if value is None:
+            problems.append(f"missing '{key}'")
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            problems.append(f"'{key}' must be a number, got {value!r}")
+            continue
+        if value <= 0:
+            problems.append(f"'{key}' must be positive, got {value}")
+            continue
+        values[field] = float(value)
+
+    if problems:
+        raise ConfigError(f"{path}: invalid machine config: " + "; ".join(problems))
+
+    return MachineConfig(path=path, **values)
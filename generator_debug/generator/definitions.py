@@ -1,4 +1,8 @@
+import math
+from dataclasses import dataclass, fields
 from enum import Enum
+from functools import lru_cache
+from typing import ClassVar
 
 # Wind type can be used to identify what kind of wind something is
 class WindType(Enum):
@@ -7,70 +11,134 @@ class WindType(Enum):
     # Add further wind types as needed
 
 
+# Classes of moves a layer can give its own feed rate to (see Ply.feedRates)
+#   - pass: laying tow along the mandrel (helical passes, hoop traverses)
+#   - lock: turning the mandrel at the end of a pass, carriage standing still
+#   - step: turning the mandrel to the next start or pattern position
+FEED_CLASSES = ('pass', 'lock', 'step')
+
+# Derived geometry kept per (layer, mandrel diameter); a schedule only has a handful of distinct layers
+GEOMETRY_CACHE_SIZE = 1024
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+# Gives a (frozen) dataclass __slots__ for its fields, as dataclass(slots=True) does from Python 3.10 on: the class
+# is made again without the field defaults as class attributes (the generated __init__ keeps them)
+# Frozen instances can't be restored attribute by attribute, so they are pickled as a list of field values
+def slotted(cls):
+    inherited = {f.name for base in cls.__mro__[1:] if hasattr(base, '__dataclass_fields__') for f in fields(base)}
+    names = tuple(f.name for f in fields(cls) if f.name not in inherited)
+    body = {key: value for key, value in cls.__dict__.items() if key not in names + ('__dict__', '__weakref__')}
+    body['__slots__'] = names
+    body.setdefault('__getstate__', getState)
+    body.setdefault('__setstate__', setState)
+    return type(cls)(cls.__name__, cls.__bases__, body)
+
+
+def getState(self):
+    return [getattr(self, f.name) for f in fields(self)]
+
+
+def setState(self, state):
+    for f, value in zip(fields(self), state):
+        object.__setattr__(self, f.name, value)
+
+
 # All winds inherit from ply so that they can be stored in one list, but information specific to a hoop vs helical wind can be extracted.
+# Layers are immutable and compare (and hash) by value, so equal layers share their derived geometry (see geometry())
+# and can be used as keys. Fields are converted to their annotated type on construction.
+
+# Every wind type ends with a feedRates field: the feed rate per class of move (FEED_CLASSES) as (class, feed rate)
+# pairs, given as a dict or pairs; classes left out run at the default feed rate. Empty keeps the whole layer at
+# whatever feed rate is in effect, as before there were profiles
 
+@slotted
+@dataclass(frozen=True)
 class Ply():
+    # Specify either a hoop or helical wind (set by each wind type)
+    windType: ClassVar[WindType] = None
 
-    def __init__(self, windType, windLength, towWidth, towThickness):
-        # Specify either a hoop or helical wind
-        self.windType = windType
-        self.windLength = float(windLength)
-        self.towWidth = float(towWidth)
-        self.towThickness = float(towThickness)
+    windLength: float
+    towWidth: float
+    towThickness: float
+
+    def __post_init__(self):
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if f.name == 'feedRates':
+                rates = dict(value or ())
+                value = tuple((moveClass, float(rates[moveClass])) for moveClass in FEED_CLASSES if moveClass in rates)
+            else:
+                value = f.type(value)
+            object.__setattr__(self, f.name, value)
 
     def getType(self) -> WindType:
         return self.windType
-    
+
     def getWindLength(self) -> float:
         return self.windLength
-    
+
     def getWidth(self) -> float:
         return self.towWidth
-    
+
     def getThickness(self) -> float:
         return self.towThickness
 
+    def getFeedRates(self) -> dict:
+        return dict(self.feedRates)
+
 
+@slotted
+@dataclass(frozen=True)
 class HoopWind(Ply):
+    windType: ClassVar[WindType] = WindType.HOOP
 
-    def __init__(self, windLength, towWidth, towThickness, isSinglePass):
-        super().__init__(WindType.HOOP, windLength, towWidth, towThickness)
+    # Specify if this should be a single pass, as in the case of taping
+    isSinglePass: bool
 
-        # Specify if this should be a single pass, as in the case of taping
-        self.isSinglePass = isSinglePass
+    feedRates: tuple = ()
 
+    # Derived geometry on the given machine config (a HoopGeometry), None if the tow width can't be wound
+    def geometry(self, machineConfig):
+        return hoopGeometry(self, machineConfig.mandrelDiameter)
 
+
+@slotted
+@dataclass(frozen=True)
 class HelicalWind(Ply):
-    
-    def __init__(self, windLength, towWidth, towThickness, windAngle, numStarts, skipIndex, lockAngle, leadInLength, leadOutLength, skipInitialLock):
-        super().__init__(WindType.HELICAL, windLength, towWidth, towThickness)
+    windType: ClassVar[WindType] = WindType.HELICAL
+
+    # Angle of the helical wind
+    # Defined as the angle between the mandrel axis and the wind tow
+    # i.e., a length of tow running straight from one end of the mandrel to the other would have an angle of zero degrees
+    windAngle: float
 
-        # Angle of the helical wind
-        # Defined as the angle between the mandrel axis and the wind tow
-        # i.e., a length of tow running straight from one end of the mandrel to the other would have an angle of zero degrees
-        self.windAngle = float(windAngle)
+    # Each circuit will perform a pass going down the mandrel and coming back. The next pass will not be started immediately adjacent
+    # to the previous pass, and will instead start at a new start position some angle off from the previous start position.
+    # Once a pass has been completed at each start position, a "pattern" is completed. Subsequent patterns will be completed
+    # to cover the mandrel completely (the number of patterns required is determined by tow width).
+    # This parameter determines the number of start positions
+    numStarts: int
 
-        # Each circuit will perform a pass going down the mandrel and coming back. The next pass will not be started immediately adjacent 
-        # to the previous pass, and will instead start at a new start position some angle off from the previous start position.
-        # Once a pass has been completed at each start position, a "pattern" is completed. Subsequent patterns will be completed
-        # to cover the mandrel completely (the number of patterns required is determined by tow width).
-        # This parameter determines the number of start positions
-        self.numStarts = int(numStarts)
+    # The number of start positions to skip to find the next start position
+    # Currently unused
+    skipIndex: int
 
-        # The number of start positions to skip to find the next start position
-        # Currently unused
-        self.skipIndex = int(skipIndex)
+    # The angle through which to turn the mandrel at the end of each pass. Usually 720 degrees
+    lockAngle: int
 
-        # The angle through which to turn the mandrel at the end of each pass. Usually 720 degrees
-        self.lockAngle = int(lockAngle)
+    # If some intermediate lead-in or lead-out length is desired, it is specified here
+    # Currently unused
+    leadInLength: float
+    leadOutLength: float
 
-        # If some intermediate lead-in or lead-out length is desired, it is specified here
-        # Currently unused
-        self.leadInLength = float(leadInLength)
-        self.leadOutLength = float(leadOutLength)
+    # If this helical layer follows a previous helical layer, skip the lock wind at the beginning
+    skipInitialLock: bool
 
-        # If this helical layer follows a previous helical layer, skip the lock wind at the beginning
-        self.skipInitialLock = bool(skipInitialLock)
+    feedRates: tuple = ()
 
 
     def getWindAngle(self) -> float:
@@ -83,9 +151,194 @@ class HelicalWind(Ply):
 
     def getLockAngle(self) -> float:
         return self.lockAngle
-    
+
 
     def doSkipInitialLock(self) -> bool:
         return self.skipInitialLock
-        
 
+
+    # Derived geometry on the given machine config (a HelicalGeometry)
+    def geometry(self, machineConfig):
+        return helicalGeometry(self, machineConfig.mandrelDiameter)
+
+
+# ---------------- derived geometry ----------------
+# Worked out once per layer and mandrel diameter and shared by the planner, the calculators and the sweep
+
+# Circuits of tow at an angle needed to cover the mandrel once
+@slotted
+@dataclass(frozen=True)
+class CircuitGeometry():
+    mandrelCircumference: float     # [inches]
+    effectiveTowWidth: float        # [inches] tow width measured around the mandrel
+    numCircuits: int
+
+
+@slotted
+@dataclass(frozen=True)
+class HelicalGeometry():
+    mandrelCircumference: float     # [inches]
+    effectiveTowWidth: float        # [inches]
+    numCircuits: int
+    passStepAngle: float            # DEGREES between neighbouring circuits
+    passAngle: float                # DEGREES the mandrel turns during one pass
+    numPatterns: int
+
+
+# The tow advances by one pitch per revolution; the pitch is chosen so neighbouring wraps just touch, i.e. the
+# tow (towWidth measured across it) spans exactly one pitch along the mandrel at its slight helix angle
+@slotted
+@dataclass(frozen=True)
+class HoopGeometry():
+    mandrelCircumference: float     # [inches]
+    pitch: float                    # [inches] per revolution
+    traverseAngle: float            # DEGREES per traverse
+    numPasses: int
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def circuitGeometry(mandrelDiameter, towWidth, windAngle) -> CircuitGeometry:
+    mandrelCircumference = math.pi * mandrelDiameter
+    effectiveTowWidth = towWidth / math.cos(math.radians(windAngle))
+    return CircuitGeometry(mandrelCircumference, effectiveTowWidth, math.ceil(mandrelCircumference / effectiveTowWidth))
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def helicalGeometry(layer: HelicalWind, mandrelDiameter) -> HelicalGeometry:
+    circuits = circuitGeometry(mandrelDiameter, layer.towWidth, layer.windAngle)
+    numCircuits = circuits.numCircuits
+
+    passStepAngle = 360 / numCircuits
+    passAngle = (layer.windLength * math.tan(math.radians(layer.windAngle))) * (360 / circuits.mandrelCircumference)
+    numPatterns = int(numCircuits / layer.numStarts)
+
+    return HelicalGeometry(circuits.mandrelCircumference, circuits.effectiveTowWidth, numCircuits,
+                           passStepAngle, passAngle, numPatterns)
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def hoopGeometry(layer: HoopWind, mandrelDiameter):
+    mandrelCircumference = math.pi * mandrelDiameter
+    towWidth = layer.towWidth
+
+    if (towWidth <= 0 or towWidth >= mandrelCircumference):
+        return None
+
+    pitch = towWidth * mandrelCircumference / math.sqrt(mandrelCircumference ** 2 - towWidth ** 2)
+    return HoopGeometry(mandrelCircumference, pitch, layer.windLength / pitch * 360, 1 if layer.isSinglePass else 2)
+
+
+# ---------------- wind file schema ----------------
+# Wind types a wind file can use: "windType" -> (layer class, schema)
+# A schema maps the json keys of a layer to (layer field, default or None if required); the wind length and the
+# feed rates come from the file, not the layer
+WIND_TYPES = {}
+
+# Range each field has to be in: field -> (check, what it has to be)
+LIMITS = {'towWidth': (lambda value: value > 0, "positive"),
+          'towThickness': (lambda value: value >= 0, "zero or more"),
+          'windAngle': (lambda value: 0 <= value < 90, "at least 0 and below 90 degrees"),
+          'numStarts': (lambda value: value >= 1, "at least 1"),
+          'skipIndex': (lambda value: value >= 0, "zero or more")}
+
+
+def registerWindType(name, layerClass, schema):
+    WIND_TYPES[name] = (layerClass, schema)
+
+
+registerWindType('hoop', HoopWind, {'towWidth': ('towWidth', None),
+                                    'towThickness': ('towThickness', None),
+                                    'terminal': ('isSinglePass', None)})
+
+registerWindType('helical', HelicalWind, {'towWidth': ('towWidth', None),
+                                          'towThickness': ('towThickness', None),
+                                          'windAngle': ('windAngle', None),
+                                          'numStarts': ('numStarts', None),
+                                          'skipIndex': ('skipIndex', 0),
+                                          'lockAngle': ('lockAngle', None),
+                                          'leadInLength': ('leadInLength', 0),
+                                          'leadOutLength': ('leadOutLength', 0),
+                                          'skipInitialLock': ('skipInitialLock', None)})
+
+
+# Problems with a value read for a field of the given type, as a list of messages
+def checkValue(key, name, value, kind) -> list:
+    if kind is bool:
+        # 0 and 1 are taken as false and true, the layer turns them into bools
+        if isinstance(value, str) or not isinstance(value, (bool, int, float)) or value not in (0, 1):
+            return [f"'{key}' must be true or false, got {value!r}"]
+        return []
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return [f"'{key}' must be a number, got {value!r}"]
+    if name in LIMITS and not LIMITS[name][0](value):
+        return [f"'{key}' must be {LIMITS[name][1]}, got {value}"]
+    return []
+
+
+# Problems with a feed rate profile ({class: feed rate}), as a list of messages
+def checkFeedRates(feedRates) -> list:
+    if not isinstance(feedRates, dict):
+        return [f"'feedRates' must be an object, got {feedRates!r}"]
+    problems = []
+    for moveClass, feedRate in feedRates.items():
+        if moveClass not in FEED_CLASSES:
+            problems.append(f"invalid feed rate class '{moveClass}'")
+        elif isinstance(feedRate, bool) or not isinstance(feedRate, (int, float)) or feedRate <= 0:
+            problems.append(f"feed rate '{moveClass}' must be a positive number, got {feedRate!r}")
+    return problems
+
+
+# Builds the schedule of a wind file (its parsed json) in one pass over its layers
+# Every problem with the file is collected and reported together in a ScheduleError
+# Returns (list of layers, default feed rate)
+def parseSchedule(data, path=''):
+    if not isinstance(data, dict):
+        raise ScheduleError(f"{path}: wind file must be a JSON object")
+
+    problems = []
+    for key in ('length', 'defaultFeedRate'):
+        value = data.get(key)
+        if value is None:
+            problems.append(f"missing '{key}'")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            problems.append(f"'{key}' must be a positive number, got {value!r}")
+
+    feedRates = data.get('feedRates', {})
+    problems.extend(checkFeedRates(feedRates))
+    layers = data.get('layers')
+    if not isinstance(layers, list):
+        problems.append(f"'layers' must be a list, got {layers!r}")
+        layers = []
+
+    schedule = []
+    for i, layer in enumerate(layers):
+        where = f"layer {i}: "
+        if not isinstance(layer, dict):
+            problems.append(where + "must be an object")
+            continue
+        if layer.get('windType') not in WIND_TYPES:
+            problems.append(where + f"invalid wind type {layer.get('windType')!r}")
+            continue
+        layerClass, schema = WIND_TYPES[layer['windType']]
+        kinds = {f.name: f.type for f in fields(layerClass)}
+
+        values = {}
+        layerProblems = []
+        for key, (name, default) in schema.items():
+            value = layer.get(key, default)
+            if value is None:
+                layerProblems.append(f"missing '{key}'")
+                continue
+            layerProblems.extend(checkValue(key, name, value, kinds[name]))
+            values[name] = value
+
+        layerFeedRates = layer.get('feedRates', {})
+        layerProblems.extend(checkFeedRates(layerFeedRates))
+        problems.extend(where + problem for problem in layerProblems)
+        if not problems:
+            schedule.append(layerClass(windLength=data['length'], feedRates=dict(feedRates, **layerFeedRates), **values))
+
+    if problems:
+        raise ScheduleError(f"{path}: invalid wind file: " + "; ".join(problems))
+
+    return schedule, float(data['defaultFeedRate'])
@@ -0,0 +1,210 @@
+# Wind time estimator
+# Walks a planned toolpath the way GRBL's planner would and adds up how long the machine takes:
+#   - every move runs at its feed rate, capped so neither axis goes over its max feed
+#   - acceleration is capped per axis as well, giving trapezoidal (or triangular) speed profiles
+#   - the speed through a corner is limited by GRBL's junction deviation
+#   - the machine is at rest at the start, at the end and around every G28 (which runs at max feed)
+# Feed rates are treated like GRBL does, as the speed along the combined X (in) / Z (deg) vector.
+# Everything runs on the toolpath arrays, so a job of a million moves takes a fraction of a second.
+
+# Usage:
+#   report = estimator.estimate(machine.getToolpath(), machine.getConfig())
+#   print(estimator.formatTime(report['seconds']))
+# or from the command line:
+#   python estimator.py TEST.wind --config machine_config.json
+
+import argparse
+import sys
+
+import numpy as np
+
+import config
+import toolpath
+from toolpath import Toolpath
+
+
+# Junctions turning by less than this (cos of the angle between the moves) are treated as straight
+STRAIGHT = 0.999999
+
+
+# Time each move takes, in seconds
+# Returns (rows, seconds): the toolpath row of every move that makes the machine travel, and its time
+# G28 rows are included as the move back to the machine origin
+def moveTimes(path: Toolpath, machineConfig=config.DEFAULT_CONFIG):
+    machineConfig = config.getConfig(machineConfig)
+    cols = path.arrays()
+    ops = cols['op']
+    if ops.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    isMove = ops == toolpath.MOVE
+    isHome = ops == toolpath.HOME
+
+    # Travel of every row; G92 changes the coordinates but not where the machine is,
+    # and homing travels back from wherever the machine was
+    machineX, machineZ = path.machinePositions()
+    dx = np.diff(machineX, prepend=0.0)
+    dz = np.diff(machineZ, prepend=0.0)
+
+    # Moves that go nowhere are dropped by GRBL, and do not slow down the junction around them
+    length = np.hypot(dx, dz)
+    rows = np.flatnonzero((isMove | isHome) & (length > 0))
+    dx = dx[rows]
+    dz = dz[rows]
+    length = length[rows]
+    home = isHome[rows]
+
+    # Unit vectors, and the limits each axis puts on a move in that direction
+    ux = dx / length
+    uz = dz / length
+    maxFeed = np.minimum(axisLimit(machineConfig.maxFeedX, ux), axisLimit(machineConfig.maxFeedZ, uz))
+    feed = np.where(home, maxFeed, np.minimum(cols['feed'][rows], maxFeed)) / 60
+    accel = np.minimum(axisLimit(machineConfig.accelX, ux), axisLimit(machineConfig.accelZ, uz))
+
+    # Highest speed squared at each junction (entry of each move, plus the end of the program)
+    entry = np.zeros(rows.size + 1)
+    if rows.size > 1:
+        entry[1:-1] = junctionSpeedSq(ux, uz, machineConfig)
+        entry[1:-1] = np.minimum(entry[1:-1], np.minimum(feed[:-1], feed[1:]) ** 2)
+        # GRBL comes to a stop around homing
+        stop = home[:-1] | home[1:]
+        entry[1:-1][stop] = 0.0
+
+    # Limit by what acceleration can reach, going forward and then backward over the moves:
+    # entry[k] <= entry[j] + 2 * sum(accel * length) between j and k, for every j
+    reach = np.concatenate(([0.0], np.cumsum(2 * accel * length)))
+    entry = reach + np.minimum.accumulate(entry - reach)
+    entry = np.minimum.accumulate((entry + reach)[::-1])[::-1] - reach
+
+    return rows, trapezoidTime(length, feed, accel, entry[:-1], entry[1:])
+
+
+# Total time, and time per layer and per pattern, of a planned toolpath
+def estimate(path: Toolpath, machineConfig=config.DEFAULT_CONFIG):
+    rows, seconds = moveTimes(path, machineConfig)
+    layers, patterns, circuits = path.locate(rows)
+
+    # Time spent outside of any layer (homing and setup)
+    outside = layers < 0
+    report = {'seconds': float(seconds.sum()),
+              'setupSeconds': float(seconds[outside].sum()),
+              'moves': int(rows.size),
+              'layers': [],
+              'patterns': {'layer': [], 'pattern': [], 'seconds': [], 'moves': []}}
+
+    inside = ~outside
+    if inside.any():
+        layerSeconds, layerMoves, layerIds = groupSum(layers[inside], seconds[inside])
+        report['layers'] = [{'layer': l, 'seconds': s, 'moves': n}
+                            for l, s, n in zip(layerIds.tolist(), layerSeconds.tolist(), layerMoves.tolist())]
+
+    # There can be many thousands of patterns, so they are kept as columns rather than one dict each
+    inPattern = patterns >= 0
+    if inPattern.any():
+        stride = int(patterns.max()) + 1
+        keys = layers[inPattern].astype(np.int64) * stride + patterns[inPattern]
+        patternSeconds, patternMoves, patternIds = groupSum(keys, seconds[inPattern])
+        report['patterns'] = {'layer': (patternIds // stride).tolist(),
+                              'pattern': (patternIds % stride).tolist(),
+                              'seconds': patternSeconds.tolist(),
+                              'moves': patternMoves.tolist()}
+
+    return report
+
+
+# Sums values per (small, non-negative) integer key, returns the sums, counts and keys that occur
+def groupSum(keys, values):
+    counts = np.bincount(keys)
+    sums = np.bincount(keys, weights=values)
+    present = np.flatnonzero(counts)
+    return sums[present], counts[present], present
+
+
+# The largest value along a direction that keeps one axis within its limit
+def axisLimit(limit, component):
+    component = np.abs(component)
+    with np.errstate(divide='ignore'):
+        return np.where(component > 0, limit / component, np.inf)
+
+
+# GRBL's junction deviation speed (squared) between consecutive moves given by their unit vectors
+def junctionSpeedSq(ux, uz, machineConfig):
+    cosTheta = -(ux[:-1] * ux[1:] + uz[:-1] * uz[1:])
+
+    # Acceleration along the direction the tool changes in
+    jx = ux[1:] - ux[:-1]
+    jz = uz[1:] - uz[:-1]
+    jLength = np.hypot(jx, jz)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jx = jx / jLength
+        jz = jz / jLength
+    accel = np.minimum(axisLimit(machineConfig.accelX, jx), axisLimit(machineConfig.accelZ, jz))
+
+    sinHalf = np.sqrt(np.clip(0.5 * (1 - cosTheta), 0.0, 1.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speedSq = accel * machineConfig.junctionDeviation * sinHalf / (1 - sinHalf)
+    speedSq = np.where(cosTheta < -STRAIGHT, np.inf, speedSq)
+    speedSq = np.where(cosTheta > STRAIGHT, 0.0, speedSq)
+    return speedSq
+
+
+# Time of moves accelerating from entry to the feed rate, cruising and slowing down to exit
+# entry and exit are speeds squared, as the planner works in those
+def trapezoidTime(length, feed, accel, entry, exit):
+    peak = np.minimum(feed ** 2, accel * length + (entry + exit) / 2)
+    peakSpeed = np.sqrt(peak)
+    entrySpeed = np.sqrt(entry)
+    exitSpeed = np.sqrt(exit)
+
+    accelDistance = (peak - entry) / (2 * accel)
+    decelDistance = (peak - exit) / (2 * accel)
+    cruise = np.maximum(length - accelDistance - decelDistance, 0.0)
+
+    return (peakSpeed - entrySpeed) / accel + (peakSpeed - exitSpeed) / accel + cruise / peakSpeed
+
+
+# Formats seconds as h:mm:ss
+def formatTime(seconds) -> str:
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def main(argv=None):
+    import helper
+    import load
+    import planner
+    import winder
+
+    parser = argparse.ArgumentParser(description="Estimate how long a wind takes")
+    parser.add_argument('file', help="wind file to plan")
+    parser.add_argument('--config', default=config.DEFAULT_CONFIG, help="machine config file or profile")
+    parser.add_argument('--feed', type=float, default=None, help="override the default feed rate")
+    parser.add_argument('--patterns', action='store_true', help="also print the time of every pattern")
+    args = parser.parse_args(argv)
+
+    [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(args.file))
+    if args.feed is not None:
+        defaultFeedRate = args.feed
+
+    machine = winder.Winder(defaultFeedRate, machineConfig=args.config)
+    machine.setFeedRate(defaultFeedRate, force=True)
+    planner.planWind(schedule, machine)
+
+    report = estimate(machine.getToolpath(), machine.getConfig())
+    printReport(report, args.patterns)
+    return 0
+
+
+def printReport(report, patterns=False):
+    print(f"Total: {formatTime(report['seconds'])} ({report['seconds']:.1f} s, {report['moves']} moves)")
+    for layer in report['layers']:
+        print(f"\tLayer {layer['layer']}: {formatTime(layer['seconds'])} ({layer['moves']} moves)")
+        if patterns:
+            columns = report['patterns']
+            for l, p, s in zip(columns['layer'], columns['pattern'], columns['seconds']):
+                if l == layer['layer']:
+                    print(f"\t\tPattern {p}: {s:.1f} s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
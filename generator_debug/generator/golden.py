@@ -0,0 +1,259 @@
+# Golden output regression checks
+# Every sample in the manifest (testouts/golden.json) is regenerated from its .wind input and compared with its
+# golden .nc file by a semantic diff, so a change to the planner, winder or formatter can be shown to still
+# produce the same machine motion:
+#   - comments, blank lines, number formatting ("X0" / "X0.0") and where the F words sit do not matter
+#   - moves are compared by the machine position they go to (G92 offsets and G28 accounted for), so Z can be
+#     renormalized differently, and by the feed rate they run at; moves that go nowhere are left out
+#   - coordinates and feed rates only have to agree within a tolerance
+# The first move that differs is reported with its line in both files and the layer, pattern and circuit it is
+# in (from the pattern comments). Both files are streamed in blocks (reader.iterBlocks) and compared a block at
+# a time with numpy, so programs of any size are compared in flat memory.
+
+# Usage:
+#   python golden.py                                   # check every sample of ../testouts/golden.json
+#   python golden.py --workers 4                       # the same, planning the layers in parallel
+#   python golden.py --update                          # rewrite the golden files from the current generator
+#   python golden.py --diff old.nc new.nc --tolerance 0.001
+# or from code:
+#   report = golden.diff('old.nc', 'new.nc')
+#   golden.printDiff(report)
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+
+import numpy as np
+
+import config
+import helper
+import load
+import planner
+import reader
+import toolpath
+
+
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testouts', 'golden.json')
+
+# Largest difference in a coordinate [in or deg] or feed rate that still counts as the same
+TOLERANCE = 1e-3
+
+# Added to the tolerance for the rounding in summing up positions
+SLACK = 1e-9
+
+# Lines shown around a divergence
+CONTEXT_LINES = 2
+
+MOVE_FIELDS = ('line', 'x', 'z', 'feed', 'layer', 'pattern', 'circuit')
+
+
+# Yields the moves of a gcode file a block at a time, as a dict of numpy arrays (MOVE_FIELDS): the line of each
+# move, the machine position it goes to, its feed rate and where in the schedule it is
+def iterMoves(path, tolerance=TOLERANCE, chunkSize=reader.CHUNK_SIZE):
+    gcode = reader.GcodeReader(lineNumbers=True)
+
+    # Carried from one block to the next: logical and machine position, and the layer/pattern/circuit
+    logicalX = logicalZ = machineX = machineZ = 0.0
+    context = (-1, -1, -1)
+
+    for block in reader.iterBlocks(path, chunkSize):
+        gcode.parse(block)
+        parsed = gcode.toolpath
+        if len(parsed) == 0:
+            continue
+        cols = parsed.arrays()
+        ops = cols['op']
+        lines = np.frombuffer(gcode.rowLines, dtype=np.int64)
+
+        isMove = ops == toolpath.MOVE
+        isHome = ops == toolpath.HOME
+        dx = np.where(isMove, np.diff(cols['x'], prepend=logicalX), 0.0)
+        dz = np.where(isMove, np.diff(cols['z'], prepend=logicalZ), 0.0)
+        travelX = np.cumsum(dx)
+        travelZ = np.cumsum(dz)
+
+        # Travel counts from the last G28 in the block, or from where the block started
+        lastHome = np.maximum.accumulate(np.where(isHome, np.arange(ops.size), -1))
+        homed = lastHome >= 0
+        start = np.maximum(lastHome, 0)
+        atX = travelX + np.where(homed, -travelX[start], machineX)
+        atZ = travelZ + np.where(homed, -travelZ[start], machineZ)
+
+        stepX = np.diff(atX, prepend=machineX)
+        stepZ = np.diff(atZ, prepend=machineZ)
+        moving = (isMove | isHome) & ((np.abs(stepX) > tolerance) | (np.abs(stepZ) > tolerance))
+        rows = np.flatnonzero(moving)
+
+        # Each row is where the last mark at or before it puts it in the schedule (marks are sorted by row, then
+        # layer, pattern, circuit, so the last one is the most specific and has -1 for whatever it is not)
+        marks = parsed.marks()
+        if marks['row'].size:
+            index = np.searchsorted(marks['row'], rows, side='right') - 1
+            where = [np.where(index >= 0, marks[name][np.maximum(index, 0)], carried)
+                     for name, carried in zip(('layer', 'pattern', 'circuit'), context)]
+            context = (int(marks['layer'][-1]), int(marks['pattern'][-1]), int(marks['circuit'][-1]))
+        else:
+            where = [np.full(rows.size, carried) for carried in context]
+
+        yield {'line': lines[rows].copy(), 'x': atX[rows], 'z': atZ[rows], 'feed': cols['feed'][rows].copy(),
+               'layer': where[0], 'pattern': where[1], 'circuit': where[2]}
+
+        logicalX, logicalZ = float(cols['x'][-1]), float(cols['z'][-1])
+        machineX, machineZ = float(atX[-1]), float(atZ[-1])
+
+        # The views above may still be around, so the reader gets new arrays rather than emptying these
+        gcode.toolpath = toolpath.Toolpath()
+        gcode.rowLines = array('q')
+
+
+# Compares the moves of two gcode files, streaming both
+# Returns a dict: equal, moves (compared before the first difference or the end) and divergence, None or a dict
+# with move (its index), reason ('position', 'feed' or 'length') and the move in each file (None past its end)
+def diff(golden, new, tolerance=TOLERANCE, chunkSize=reader.CHUNK_SIZE):
+    streams = (iterMoves(golden, tolerance, chunkSize), iterMoves(new, tolerance, chunkSize))
+    buffers = [None, None]
+    done = [False, False]
+    compared = 0
+
+    while True:
+        # Keep at least one move of each file at hand, unless it has ended
+        for i in (0, 1):
+            while not done[i] and (buffers[i] is None or buffers[i]['line'].size == 0):
+                block = next(streams[i], None)
+                if block is None:
+                    done[i] = True
+                elif buffers[i] is None or buffers[i]['line'].size == 0:
+                    buffers[i] = block
+                else:
+                    buffers[i] = {name: np.concatenate((buffers[i][name], block[name])) for name in MOVE_FIELDS}
+
+        a, b = buffers
+        sizes = [0 if buffer is None else buffer['line'].size for buffer in buffers]
+        n = min(sizes)
+        if n == 0:
+            if sizes[0] == sizes[1]:
+                return {'equal': True, 'moves': compared, 'divergence': None}
+            return {'equal': False, 'moves': compared,
+                    'divergence': {'move': compared, 'reason': 'length', 'golden': moveAt(a, 0), 'new': moveAt(b, 0)}}
+
+        limit = tolerance + SLACK
+        samePosition = (np.abs(a['x'][:n] - b['x'][:n]) <= limit) & (np.abs(a['z'][:n] - b['z'][:n]) <= limit)
+        sameFeed = np.abs(a['feed'][:n] - b['feed'][:n]) <= limit
+        different = np.flatnonzero(~(samePosition & sameFeed))
+        if different.size:
+            i = int(different[0])
+            return {'equal': False, 'moves': compared + i,
+                    'divergence': {'move': compared + i, 'reason': 'position' if not samePosition[i] else 'feed',
+                                   'golden': moveAt(a, i), 'new': moveAt(b, i)}}
+
+        compared += n
+        buffers = [{name: buffer[name][n:] for name in MOVE_FIELDS} for buffer in buffers]
+
+
+# One move of a block as plain numbers, None past the end
+def moveAt(moves, i):
+    if moves is None or i >= moves['line'].size:
+        return None
+    return {name: moves[name][i].item() for name in MOVE_FIELDS}
+
+
+# Lines around a line of a file (1-based), read up to there and no further
+def linesAround(path, line, context=CONTEXT_LINES):
+    first = max(1, line - context)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return [(first + i, text.rstrip('\r\n')) for i, text in enumerate(itertools.islice(f, first - 1, line + context))]
+
+
+def describeMove(move) -> str:
+    if move is None:
+        return "(no more moves)"
+    where = f"layer {move['layer']}"
+    if move['pattern'] >= 0:
+        where += f" pattern {move['pattern']}"
+    if move['circuit'] >= 0:
+        where += f" circuit {move['circuit']}"
+    return f"line {move['line']} ({where}): X {move['x']:.4f} Z {move['z']:.4f} F {move['feed']:g}"
+
+
+def printDiff(report, goldenPath=None, newPath=None, printFn=print):
+    if report['equal']:
+        printFn(f"Same motion, {report['moves']} moves")
+        return
+    divergence = report['divergence']
+    printFn(f"Differs at move {divergence['move']} ({divergence['reason']}):")
+    for name, path in (('golden', goldenPath), ('new', newPath)):
+        move = divergence[name]
+        printFn(f"\t{name}: {describeMove(move)}")
+        if path is not None and move is not None:
+            for number, text in linesAround(path, move['line']):
+                printFn(f"\t\t{'>' if number == move['line'] else ' '} {number:6d}  {text}")
+
+
+# ---------------- samples ----------------
+# Regenerates every sample of the manifest and compares it with its golden file
+# The manifest has the machine config the samples were made on ("machine", as in a machine config file), an
+# optional "tolerance" and the "samples", each a "golden" .nc file and the "wind" file it comes from (paths are
+# relative to the manifest)
+# update=True writes the regenerated programs over the golden files instead of comparing
+# Returns a list of dicts: golden, wind and the diff report (None when updating)
+def checkSamples(manifestPath=MANIFEST, tolerance=None, workers=1, update=False, log=print):
+    with open(manifestPath, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(os.path.abspath(manifestPath))
+    machineConfig = config.parseConfig(manifest['machine'], manifestPath)
+    if tolerance is None:
+        tolerance = manifest.get('tolerance', TOLERANCE)
+
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for sample in manifest['samples']:
+            goldenPath = os.path.join(directory, sample['golden'])
+            windPath = os.path.join(directory, sample['wind'])
+            newPath = os.path.join(scratch, os.path.basename(goldenPath))
+
+            [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(windPath))
+            planner.writeWind(schedule, defaultFeedRate, newPath, machineConfig, workers=workers)
+
+            if update:
+                shutil.copyfile(newPath, goldenPath)
+                log(f"{sample['golden']}: updated from {sample['wind']}")
+                results.append({'golden': sample['golden'], 'wind': sample['wind'], 'report': None})
+                continue
+
+            report = diff(goldenPath, newPath, tolerance)
+            log(f"{sample['golden']}: {'ok' if report['equal'] else 'DIFFERENT'} ({report['moves']} moves compared)")
+            if not report['equal']:
+                printDiff(report, goldenPath, newPath, log)
+            results.append({'golden': sample['golden'], 'wind': sample['wind'], 'report': report})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the generator against golden gcode files")
+    parser.add_argument('--manifest', default=MANIFEST, help="samples to check")
+    parser.add_argument('--tolerance', type=float, default=None, help=f"allowed difference (default: manifest's or {TOLERANCE})")
+    parser.add_argument('--workers', '-j', type=int, default=1, help="worker processes for planning (0: all cores)")
+    parser.add_argument('--update', action='store_true', help="rewrite the golden files from the current generator")
+    parser.add_argument('--diff', nargs=2, metavar=('GOLDEN', 'NEW'), default=None, help="compare two gcode files")
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        report = diff(args.diff[0], args.diff[1], TOLERANCE if args.tolerance is None else args.tolerance)
+        printDiff(report, args.diff[0], args.diff[1])
+        return 0 if report['equal'] else 1
+
+    results = checkSamples(args.manifest, args.tolerance, args.workers, args.update)
+    failed = [result['golden'] for result in results if result['report'] is not None and not result['report']['equal']]
+    if failed:
+        print(f"{len(failed)} of {len(results)} samples differ: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+# Stand-in for a GRBL controller, so the sender can be tested and benchmarked without the winder
+# Behaves like GRBL over serial as far as a sender can tell:
+#   - a 128 byte serial RX buffer (overflowing it is recorded, like the corrupted lines real GRBL would see)
+#   - a 15 block planner buffer: a line is answered with 'ok' once it has been parsed into the planner
+#   - blocks are executed one after another, taking (distance / feed) scaled by timeScale
+#   - realtime commands: '?' status report, '!' feed hold, '~' cycle start, ctrl-x reset
+#   - optionally a serial round trip latency before each response can be read
+# The simulator has the read/write interface of a pyserial port, or can be exposed on a pty for other programs.
+
+import math
+import os
+import threading
+import time
+from collections import deque
+
+
+RX_BUFFER_SIZE = 128
+PLANNER_BLOCKS = 15
+
+
+class GrblSimulator():
+
+    # timeScale multiplies the real execution time of every move (0 executes instantly)
+    # lineTime is a fixed extra time per block, latency the delay before a response reaches the sender, in seconds
+    def __init__(self, rxBufferSize=RX_BUFFER_SIZE, plannerBlocks=PLANNER_BLOCKS, timeScale=0.0, lineTime=0.0, latency=0.0):
+        self.rxBufferSize = rxBufferSize
+        self.plannerBlocks = plannerBlocks
+        self.timeScale = timeScale
+        self.lineTime = lineTime
+        self.latency = latency
+        self.timeout = 1.0
+
+        self.rx = bytearray()
+        self.responses = deque()
+        self.planner = deque()
+        self.cond = threading.Condition()
+
+        # Machine state
+        self.position = [0.0, 0.0]   # machine coordinates X, Z
+        self.offset = [0.0, 0.0]     # G92 offset
+        self.feed = 0.0
+        self.held = False
+        self.blockEnd = None
+
+        # Statistics
+        self.linesReceived = 0
+        self.blocksExecuted = 0
+        self.maxRxUsed = 0
+        self.overflowed = False
+        self.errors = 0
+
+        self.running = True
+        with self.cond:
+            self.respond(b"Grbl 1.1h ['$' for help]")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    # ---------------- serial port interface ----------------
+    def write(self, data):
+        with self.cond:
+            for byte in bytes(data):
+                char = chr(byte)
+                if char == '?':
+                    self.respond(self.statusReport().encode())
+                elif char == '!':
+                    self.held = True
+                elif char == '~':
+                    self.held = False
+                elif byte == 0x18:
+                    self.reset()
+                else:
+                    self.rx.append(byte)
+            self.maxRxUsed = max(self.maxRxUsed, len(self.rx))
+            if len(self.rx) > self.rxBufferSize:
+                self.overflowed = True
+            self.cond.notify_all()
+        return len(data)
+
+
+    # Returns one response line, or b'' if nothing arrived within the timeout
+    def readline(self):
+        deadline = time.monotonic() + self.timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.responses and self.responses[0][0] <= now:
+                    return self.responses.popleft()[1]
+                if now >= deadline or not self.running:
+                    return b''
+                wake = deadline if not self.responses else min(deadline, self.responses[0][0])
+                self.cond.wait(wake - now)
+
+
+    @property
+    def in_waiting(self):
+        with self.cond:
+            now = time.monotonic()
+            return sum(len(r) for ready, r in self.responses if ready <= now)
+
+
+    def flush(self):
+        pass
+
+
+    def reset_input_buffer(self):
+        with self.cond:
+            self.responses.clear()
+
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=1.0)
+
+
+    # ---------------- controller ----------------
+    # Queues a response line, readable once the latency has passed (called with the lock held)
+    def respond(self, line):
+        self.responses.append((time.monotonic() + self.latency, line + b"\r\n"))
+        self.cond.notify_all()
+
+
+    def reset(self):
+        self.rx.clear()
+        self.planner.clear()
+        self.blockEnd = None
+        self.held = False
+        self.respond(b"Grbl 1.1h ['$' for help]")
+
+
+    def statusReport(self):
+        if self.held:
+            state = 'Hold'
+        elif self.planner:
+            state = 'Run'
+        else:
+            state = 'Idle'
+        x, z = self.position
+        return f"<{state}|MPos:{x:.3f},0.000,{z:.3f}|Bf:{self.plannerBlocks - len(self.planner)},{self.rxBufferSize - len(self.rx)}|FS:{self.feed:g},0>"
+
+
+    def run(self):
+        with self.cond:
+            while self.running:
+                self.parseLines()
+                wait = self.executeBlocks()
+                self.cond.wait(wait)
+
+
+    # Moves complete lines from the RX buffer into the planner while there is room, answering each one
+    def parseLines(self):
+        while len(self.planner) < self.plannerBlocks:
+            end = self.rx.find(b'\n')
+            if end < 0:
+                return
+            line = self.rx[:end].decode(errors='replace').strip()
+            del self.rx[:end + 1]
+            self.linesReceived += 1
+
+            response = self.parse(line)
+            if response != 'ok':
+                self.errors += 1
+            self.respond(response.encode())
+
+
+    # Runs the block at the head of the planner, returns how long to wait before checking again
+    def executeBlocks(self):
+        while self.planner and not self.held:
+            now = time.monotonic()
+            if self.blockEnd is None:
+                self.blockEnd = now + self.planner[0]
+            if now < self.blockEnd:
+                return self.blockEnd - now
+            self.planner.popleft()
+            self.blockEnd = None
+            self.blocksExecuted += 1
+        return 0.05
+
+
+    # Interprets one line of gcode, queues a block for motion and returns the response
+    def parse(self, line):
+        # Strip comments
+        while '(' in line:
+            start = line.index('(')
+            end = line.find(')', start)
+            if end < 0:
+                return 'error:1'
+            line = line[:start] + line[end + 1:]
+        line = line.split(';')[0].replace(' ', '').upper()
+        if not line or line.startswith('$'):
+            return 'ok'
+
+        words = {}
+        gcodes = []
+        i = 0
+        while i < len(line):
+            letter = line[i]
+            j = i + 1
+            while j < len(line) and (line[j].isdigit() or line[j] in '.-+'):
+                j += 1
+            try:
+                value = float(line[i + 1:j])
+            except ValueError:
+                return 'error:2'
+            if letter == 'G':
+                gcodes.append(value)
+            else:
+                words[letter] = value
+            i = j
+
+        if 'F' in words:
+            self.feed = words['F']
+
+        if 28 in gcodes:
+            self.queueMove(0.0, 0.0)
+        elif 92 in gcodes:
+            logical = self.logical()
+            target = [words.get('X', logical[0]), words.get('Z', logical[1])]
+            self.offset = [self.position[0] - target[0], self.position[1] - target[1]]
+        elif 'X' in words or 'Z' in words:
+            logical = self.logical()
+            target = [words.get('X', logical[0]), words.get('Z', logical[1])]
+            self.queueMove(target[0] + self.offset[0], target[1] + self.offset[1])
+        return 'ok'
+
+
+    def logical(self):
+        return [self.position[0] - self.offset[0], self.position[1] - self.offset[1]]
+
+
+    def queueMove(self, x, z):
+        distance = math.hypot(x - self.position[0], z - self.position[1])
+        duration = self.lineTime
+        if self.feed > 0:
+            duration += distance / self.feed * 60 * self.timeScale
+        self.position = [x, z]
+        self.planner.append(duration)
+
+
+    # ---------------- pty ----------------
+    # Exposes the simulator on a pseudo-terminal so any serial sender can connect to it (Linux/macOS)
+    # Returns the path of the device to open
+    def openPty(self):
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self.ptyMaster = master
+
+        def pump():
+            while self.running:
+                try:
+                    data = os.read(master, 1024)
+                except OSError:
+                    return
+                self.write(data)
+
+        def reply():
+            while self.running:
+                line = self.readline()
+                if line:
+                    try:
+                        os.write(master, line)
+                    except OSError:
+                        return
+
+        threading.Thread(target=pump, daemon=True).start()
+        threading.Thread(target=reply, daemon=True).start()
+        return os.ttyname(slave)
@@ -1,22 +1,58 @@
 # gui_main_with_calculator.py
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
-import math
+from tkinter import filedialog, messagebox, scrolledtext, ttk
+import queue
 import sys
+import threading
 import helper
 import winder
 import planner
+import optimizer
+import estimator
+import validator
+import instrument
+import layercache
+import sinks
+import sweep
+import definitions
+
+# How often the log and the background worker are checked on [ms]
+POLL_INTERVAL = 100
+
+# Oldest lines are dropped from the log past this many
+MAX_LOG_LINES = 5000
+
+
+# Raised inside a background task once Cancel has been pressed
+class Cancelled(Exception):
+    pass
+
 
 # ---------------- Stdout redirector ----------------
+# Printed text is collected (from any thread) and inserted into the widget in one go by flush_to_widget,
+# which the GUI calls every POLL_INTERVAL, instead of one insert per print
 class StdoutRedirector:
-    def __init__(self, text_widget):
+    def __init__(self, text_widget, max_lines=MAX_LOG_LINES):
         self.text_widget = text_widget
+        self.max_lines = max_lines
+        self.pending = []
+        self.lock = threading.Lock()
     def write(self, s):
         if s.strip():  # ignore empty strings
-            self.text_widget.insert(tk.END, s + "\n")
-            self.text_widget.see(tk.END)
+            with self.lock:
+                self.pending.append(s)
     def flush(self):
         pass
+    def flush_to_widget(self):
+        with self.lock:
+            lines, self.pending = self.pending, []
+        if not lines:
+            return
+        self.text_widget.insert(tk.END, "\n".join(lines) + "\n")
+        excess = int(self.text_widget.index("end-1c").split(".")[0]) - 1 - self.max_lines
+        if excess > 0:
+            self.text_widget.delete("1.0", f"{excess + 1}.0")
+        self.text_widget.see(tk.END)
 
 # ---------------- Main GUI Class ----------------
 class WinderGUI:
@@ -28,6 +64,14 @@ class WinderGUI:
         self.gcode = []
         self.machine = None
 
+        # Layers planned so far, so generating again only replans the layers that changed (see layercache.py)
+        self.layer_cache = layercache.LayerCache()
+
+        # Load, generate and save run on a worker thread; it reports back through this queue
+        self.worker = None
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+
         # Feed Rate Entry (at the top of gui window)
         tk.Label(root, text="Feed Rate:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
         self.feed_rate_var = tk.StringVar(value=str(self.defaultFeedRate))
@@ -38,47 +82,168 @@ class WinderGUI:
         tk.Button(root, text="Generate G-code", command=self.generate_gcode).grid(row=1, column=1, sticky="ew", padx=5, pady=2)
         tk.Button(root, text="Save G-code", command=self.save_gcode).grid(row=2, column=0, sticky="ew", padx=5, pady=2)
         tk.Button(root, text="Calculator", command=self.open_calculator).grid(row=2, column=1, sticky="ew", padx=5, pady=2)
-        tk.Button(root, text="Quit", command=self.quit_program).grid(row=3, column=0, columnspan=2, sticky="ew", padx=5, pady=2)
+
+        # Output options (see optimizer.py)
+        self.optimize_var = tk.BooleanVar(value=False)
+        self.strip_comments_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(root, text="Optimize output", variable=self.optimize_var).grid(row=3, column=0, sticky="w", padx=5, pady=2)
+        tk.Checkbutton(root, text="Strip comments", variable=self.strip_comments_var).grid(row=3, column=1, sticky="w", padx=5, pady=2)
+
+        tk.Button(root, text="Plot Toolpath", command=self.open_plot).grid(row=4, column=0, sticky="ew", padx=5, pady=2)
+        tk.Button(root, text="Coverage Map", command=self.open_coverage).grid(row=4, column=1, sticky="ew", padx=5, pady=2)
+        # Runs generation under cProfile/tracemalloc and logs where the time went (see instrument.py)
+        self.profile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(root, text="Profile generation", variable=self.profile_var).grid(row=5, column=0, sticky="w", padx=5, pady=2)
+        tk.Button(root, text="Quit", command=self.quit_program).grid(row=5, column=1, sticky="ew", padx=5, pady=2)
+
+        # Progress of the background task
+        self.progress = ttk.Progressbar(root, mode="determinate")
+        self.progress.grid(row=6, column=0, sticky="ew", padx=5, pady=2)
+        self.cancel_button = tk.Button(root, text="Cancel", command=self.cancel_task, state=tk.DISABLED)
+        self.cancel_button.grid(row=6, column=1, sticky="ew", padx=5, pady=2)
 
         # Output Text
-        tk.Label(root, text="Output / Debug Log:").grid(row=4, column=0, columnspan=2, sticky="w", padx=5)
+        tk.Label(root, text="Output / Debug Log:").grid(row=7, column=0, columnspan=2, sticky="w", padx=5)
         self.log_text = scrolledtext.ScrolledText(root, width=60, height=20)
-        self.log_text.grid(row=5, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.log_text.grid(row=8, column=0, columnspan=2, sticky="nsew", padx=5, pady=5)
+        self.log_writer = StdoutRedirector(self.log_text)
 
         # Grid Setup ()
         self.root.columnconfigure(0, weight=1)
         self.root.columnconfigure(1, weight=1)
-        self.root.rowconfigure(5, weight=1) 
+        self.root.rowconfigure(8, weight=1) 
+
+        self.root.after(POLL_INTERVAL, self.poll)
 
-    # Logging 
+    # Logging (safe from the worker thread too, the text shows up on the next poll)
     def log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
+        self.log_writer.write(message)
+
+    # ---------------- Background tasks ----------------
+    # Runs work() on a worker thread; on_done(result) is then called back on the Tk thread
+    # Anything printed meanwhile goes to the log
+    def run_task(self, name, work, on_done):
+        if self.worker is not None and self.worker.is_alive():
+            messagebox.showwarning("Warning", "Still busy, wait for it to finish or press Cancel.")
+            return
+
+        self.cancel_event.clear()
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress.config(value=0, maximum=1)
+        self.old_stdout = sys.stdout
+        sys.stdout = self.log_writer
+
+        def target():
+            try:
+                self.events.put(("done", on_done, work()))
+            except Cancelled:
+                self.events.put(("cancelled", name))
+            except Exception as e:
+                self.events.put(("error", name, e))
+
+        self.worker = threading.Thread(target=target, name=name, daemon=True)
+        self.worker.start()
+
+    # Called from the worker: reports progress and stops the task if Cancel was pressed
+    def report_progress(self, done, total):
+        self.events.put(("progress", done, total))
+        if self.cancel_event.is_set():
+            raise Cancelled()
+
+    def cancel_task(self):
+        self.cancel_event.set()
+        self.log("Cancelling...")
+
+    # Handles what the worker reported and writes out the log, every POLL_INTERVAL
+    def poll(self):
+        try:
+            while True:
+                event = self.events.get_nowait()
+                if event[0] == "progress":
+                    self.progress.config(value=event[1], maximum=max(event[2], 1))
+                    continue
+
+                sys.stdout = self.old_stdout
+                self.cancel_button.config(state=tk.DISABLED)
+                if event[0] == "done":
+                    self.progress.config(value=self.progress.cget("maximum"))
+                    try:
+                        event[1](event[2])
+                    except Exception as e:
+                        messagebox.showerror("Error", str(e))
+                elif event[0] == "cancelled":
+                    self.progress.config(value=0)
+                    self.log(f"{event[1].capitalize()} cancelled.")
+                else:
+                    self.progress.config(value=0)
+                    messagebox.showerror("Error", str(event[2]))
+        except queue.Empty:
+            pass
+
+        self.log_writer.flush_to_widget()
+        self.root.after(POLL_INTERVAL, self.poll)
 
     # Old Commands 
+    # The file dialogs stay on the Tk thread, only the reading/planning/writing runs in the background
     def load_schedule(self):
-        try:
-            old_stdout = sys.stdout
-            sys.stdout = StdoutRedirector(self.log_text)
-            self.schedule, self.defaultFeedRate = helper.loadWindFile()
+        file_path = filedialog.askopenfilename(title="Select JSON/Wind file",
+                                               filetypes=[("JSON/Wind files", "*.json *.wind"), ("All files", "*.*")])
+        if not file_path:
+            return
+
+        def done(result):
+            schedule, defaultFeedRate = result
+            if schedule is None:
+                return
+            self.schedule, self.defaultFeedRate = schedule, defaultFeedRate
             self.feed_rate_var.set(str(self.defaultFeedRate))
             self.log(f"Schedule loaded. Layers: {len(self.schedule)}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            sys.stdout = old_stdout
+
+        self.run_task("load", lambda: helper.loadWindFile(file_path=file_path), done)
 
     def generate_gcode(self):
         try:
-            self.defaultFeedRate = float(self.feed_rate_var.get())
-            self.machine = winder.Winder(self.defaultFeedRate)
-            self.machine.setFeedRate(self.defaultFeedRate, force=True)
-            self.gcode = planner.planWind(self.schedule, self.machine)
-            self.log(f"G-code generated. Lines: {len(self.gcode)}")
-            for i, layer in enumerate(self.schedule):
-                self.log(f"\tLayer {i}: type {layer.getType()}")
-        except Exception as e:
+            feed_rate = float(self.feed_rate_var.get())
+        except ValueError as e:
             messagebox.showerror("Error", str(e))
+            return
+        schedule = list(self.schedule)
+        optimize = self.optimize_var.get()
+        strip_comments = self.strip_comments_var.get()
+        profile = self.profile_var.get()
+
+        def work():
+            metrics = instrument.Metrics()
+            misses = self.layer_cache.misses
+            with instrument.Profiler(memory=True, enabled=profile) as profiler:
+                machine = winder.Winder(feed_rate, observers=[metrics])
+                machine.setFeedRate(feed_rate, force=True)
+                gcode = planner.planWind(schedule, machine, cache=self.layer_cache, onLayer=self.report_progress)
+            self.report_progress(len(schedule), len(schedule))
+            self.log(f"G-code generated. Lines: {len(gcode)} "
+                     f"({self.layer_cache.misses - misses} of {len(schedule)} layers planned, the rest cached)")
+            metrics.printReport(self.log)
+            if profile:
+                self.log(profiler.report())
+            if optimize:
+                optimized, report = optimizer.optimize(machine.getToolpath(), stripComments=strip_comments)
+                machine.loadToolpath(optimized)
+                gcode = optimized.render()
+                self.log(f"G-code optimized. Lines: {report['linesAfter']} "
+                         f"(saved {report['linesSaved']} lines, {report['bytesSaved']} bytes)")
+                self.report_progress(len(schedule), len(schedule))
+            for i, layer in enumerate(schedule):
+                self.log(f"\tLayer {i}: type {layer.getType()}")
+            report = estimator.estimate(machine.getToolpath(), machine.getConfig())
+            self.log(f"Estimated wind time: {estimator.formatTime(report['seconds'])}")
+            validator.printReport(validator.validate(machine.getToolpath(), machine.getConfig(), schedule), 5, self.log)
+            return machine, gcode
+
+        def done(result):
+            self.defaultFeedRate = feed_rate
+            self.machine, self.gcode = result
+
+        self.run_task("generate", work, done)
 
     def save_gcode(self):
         if not self.gcode:
@@ -86,17 +251,87 @@ class WinderGUI:
             return
         file_path = filedialog.asksaveasfilename(defaultextension=".nc", filetypes=[("G-code files", "*.nc")])
         if file_path:
-            with open(file_path, 'w') as f:
-                for line in self.gcode:
-                    f.write(line + "\n")
-            self.log(f"G-code saved to {file_path}")
+            gcode = self.gcode
+            self.run_task("save", lambda: sinks.writeGcode(gcode, file_path),
+                          lambda path: self.log(f"G-code saved to {path}"))
 
 
     def quit_program(self):
         if messagebox.askyesno("Confirm Quit", "Are you sure you want to quit? Any unsaved data will be lost."):
+            self.cancel_event.set()
+            sys.stdout = sys.__stdout__
             self.root.destroy()
             sys.exit(print("Program has closed!"))
 
+    # ---------------- Plot window ----------------
+    # matplotlib is only imported once a plot is opened (see plotter.py for the level of detail)
+    def open_plot(self):
+        if self.machine is None:
+            messagebox.showwarning("Warning", "No G-code generated yet!")
+            return
+
+        import plotter
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+        plot_win = tk.Toplevel(self.root)
+        plot_win.title("Toolpath")
+
+        figure = Figure(figsize=(12, 5))
+        canvas = FigureCanvasTkAgg(figure, master=plot_win)
+        toolbar = NavigationToolbar2Tk(canvas, plot_win, pack_toolbar=False)
+
+        color_var = tk.StringVar(value="layer")
+
+        def redraw(*args):
+            try:
+                plotter.plotToolpath(self.machine.getToolpath(), self.machine.getConfig(), colorBy=color_var.get(), figure=figure)
+                canvas.draw_idle()
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+
+        tk.Label(plot_win, text="Color by:").grid(row=0, column=0, sticky="w", padx=5)
+        tk.OptionMenu(plot_win, color_var, "layer", "pattern", command=redraw).grid(row=0, column=1, sticky="w", padx=5)
+        canvas.get_tk_widget().grid(row=1, column=0, columnspan=2, sticky="nsew")
+        toolbar.grid(row=2, column=0, columnspan=2, sticky="ew")
+
+        plot_win.columnconfigure(1, weight=1)
+        plot_win.rowconfigure(1, weight=1)
+        redraw()
+
+    # Heatmaps of how many layers and tow bands cover each cell of the mandrel (see coverage.py)
+    def open_coverage(self):
+        if self.machine is None or not self.schedule:
+            messagebox.showwarning("Warning", "No G-code generated yet!")
+            return
+
+        import coverage
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+        try:
+            report = coverage.coverageMap(self.machine.getToolpath(), [layer.getWidth() for layer in self.schedule], self.machine.getConfig())
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
+        for layer in report['layers']:
+            self.log(f"Coverage layer {layer['layer']}: gap {coverage.formatFraction(layer['gap'])}, "
+                     f"overlap {coverage.formatFraction(layer['overlap'])}")
+
+        cov_win = tk.Toplevel(self.root)
+        cov_win.title("Coverage")
+
+        figure = Figure(figsize=(12, 5))
+        canvas = FigureCanvasTkAgg(figure, master=cov_win)
+        toolbar = NavigationToolbar2Tk(canvas, cov_win, pack_toolbar=False)
+        coverage.plotCoverage(report, figure=figure)
+
+        canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew")
+        toolbar.grid(row=1, column=0, sticky="ew")
+        cov_win.columnconfigure(0, weight=1)
+        cov_win.rowconfigure(0, weight=1)
+        canvas.draw_idle()
+
     # ---------------- Calculator GUI ----------------
     def open_calculator(self):
         calc_win = tk.Toplevel(self.root)
@@ -123,26 +358,25 @@ class WinderGUI:
         calc_win.rowconfigure(4, weight=1)
 
         def compute():
+            redirector = StdoutRedirector(output_text)
             try:
                 old_stdout = sys.stdout
-                sys.stdout = StdoutRedirector(output_text)
+                sys.stdout = redirector
                 mandrel = float(mandrel_var.get())
                 tow = float(tow_var.get())
                 angle = float(angle_var.get())
 
-                mandrelCircumference = math.pi * mandrel
-                effectiveTowWidth = tow / math.cos(math.radians(angle))
-                numCircuits = math.ceil(mandrelCircumference / effectiveTowWidth)
+                numCircuits = definitions.circuitGeometry(mandrel, tow, angle).numCircuits
 
                 print(f"Number of circuits: {numCircuits}")
                 print("Valid start position quantities:")
-                for i in range(1, numCircuits + 1):
-                    if numCircuits % i == 0:
-                        print(f"  {i}")
+                for i in sweep.divisors(numCircuits):
+                    print(f"  {i}")
             except Exception as e:
                 messagebox.showerror("Error", str(e))
             finally:
-                sys.stdout = sys.__stdout__
+                sys.stdout = old_stdout
+                redirector.flush_to_widget()
 
         tk.Button(calc_win, text="Compute", command=compute).grid(row=3, column=0, columnspan=2, sticky="ew", pady=2)
 
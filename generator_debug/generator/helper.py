@@ -1,7 +1,5 @@
 # Helper functions for top-level functionality
 
-import math
-
 import definitions
 import winder
 import load
@@ -15,38 +13,40 @@ def printHelpMenu():
     print(" load - load a wind file")
     print(" loadg - load a gcode file")
     print(" generate - generate gcode from a wind file")
-    print(" plot - plot a gcode file")
+    print(" profile - generate under the profiler and print where the time went")
+    print(" metrics - show what the last generation did (moves, timing, rejected moves)")
+    print(" optimize - shrink the generated gcode")
+    print(" estimate - estimate how long the generated wind takes")
+    print(" validate - check the generated wind against the machine limits")
+    print(" plot - plot the generated or loaded gcode")
+    print(" coverage - map the tow coverage of the generated wind")
     print(" write - save a gcode file")
+    print(" archive - save the generated gcode with an index of resume points")
+    print(" resume - write a program that restarts an archived wind at a layer/pattern/circuit")
     print(" calculator - run wind parameter utility")
     print(" quit - terminate this session")
     print("=================================================================")
 
 
 # Loads the wind file that specifies the layup schedule
-def loadWindFile(log_fn=print):
+# Asks for the file with a dialog unless a path is given
+def loadWindFile(log_fn=print, file_path=None):
     log_fn("Loading from file...")
-    data, file_path = load.get_data()
+    if file_path is None:
+        data, file_path = load.get_data()
+    else:
+        data = load.read_data(file_path)
     if data is None:
         return None, None  # prevents unpack error
 
     print("Loading from", file_path)
     print("---")
 
-    length = float(data["length"])
-    defaultFeedRate = float(data["defaultFeedRate"])
-
-    schedule = []
-    for layer in data["layers"]:
-        if layer["windType"] == "hoop":
-            schedule.append(definitions.HoopWind(
-                length, layer["towWidth"], layer["towThickness"], layer["terminal"]))
-        elif layer["windType"] == "helical":
-            schedule.append(definitions.HelicalWind(
-                length, layer["towWidth"], layer["towThickness"], layer["windAngle"],
-                layer["numStarts"], layer["skipIndex"], layer["lockAngle"],
-                layer["leadInLength"], layer["leadOutLength"], layer["skipInitialLock"]))
-        else:
-            print("\tInvalid wind type:", layer["windType"])
+    try:
+        [schedule, defaultFeedRate] = buildSchedule(data, file_path)
+    except definitions.ScheduleError as e:
+        log_fn(str(e))
+        return None, None
 
 
     print("Layer Information:")
@@ -64,6 +64,16 @@ def loadWindFile(log_fn=print):
     return [schedule, defaultFeedRate]
 
 
+# Builds the schedule (list of plies) and default feed rate from the contents of a wind file
+# Optional "feedRates" ({"pass": .., "lock": .., "step": ..}) at the top apply to every layer, a layer's own
+# "feedRates" override them
+# Layers are built from the wind types registered in definitions.WIND_TYPES; raises definitions.ScheduleError
+# listing every problem with the file
+def buildSchedule(data, path=''):
+    schedule, defaultFeedRate = definitions.parseSchedule(data, path)
+    return [schedule, defaultFeedRate]
+
+
 def generateWind(schedule, defaultFeedRate):
     machine = winder.Winder()
 
@@ -73,21 +83,21 @@ def calculator():
     print("Note: units must match if not specified.")
     print("-----------------------------------------------------------------------------------------------")
 
+    # Only needed here for the divisors, and it pulls in numpy
+    import sweep
+
     mandrelDiameter = float(input("Mandrel diameter: "))
     towWidth = float(input("Tow width: "))
     windAngle = float(input("Wind angle [deg]: "))
 
-    mandrelCircumference = math.pi * mandrelDiameter
-    effectiveTowWidth = towWidth / math.cos(math.radians(windAngle))
-    numCircuits = math.ceil(mandrelCircumference / effectiveTowWidth)
+    numCircuits = definitions.circuitGeometry(mandrelDiameter, towWidth, windAngle).numCircuits
 
     print("-----------------------------------------------------------------------------------------------")
     print("Number of circuits: " + str(numCircuits))
     print("Valid start position quantities:")
 
-    for i in range(1, numCircuits+1):
-        if (numCircuits % i == 0):
-            print("     " + str(i))
+    for i in sweep.divisors(numCircuits):
+        print("     " + str(i))
 
     print("===============================================================================================")
 
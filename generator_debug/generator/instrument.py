@@ -0,0 +1,260 @@
+# Instrumentation of the planner and winder
+# A Winder tells its observers about a few events while it plans; nothing is called per move, so
+# observers can stay attached in production:
+#   - layerStarted / layerFinished: around every layer of the schedule
+#   - moveRejected: a move that would leave the machine envelope and was dropped
+#   - flushing / emitted: rows about to be rendered into the sink, and the lines that came out
+#   - rendered: the whole program was rendered (no sink)
+# Observers subclass Observer and override what they need. Metrics is the one that comes with the generator:
+# per layer wall time, moves and rejections, lines and bytes emitted and the peak size of the toolpath in
+# memory, exportable as JSON. Profiler wraps any code in cProfile and/or tracemalloc.
+
+# Usage:
+#   metrics = instrument.Metrics()
+#   machine = winder.Winder(30, observers=[metrics])
+#   planner.planWind(schedule, machine)
+#   metrics.printReport()
+#   metrics.writeJson('windMetrics.json')
+# or from the command line:
+#   python instrument.py TEST.wind --json windMetrics.json --profile --memory
+
+import argparse
+import io
+import json
+import sys
+import time
+
+import toolpath
+
+
+# Moves kept as examples of what was rejected
+MAX_REJECTIONS = 100
+
+
+# Base class with every event; the machine sending the event is always the first argument
+class Observer():
+
+    def layerStarted(self, machine, index):
+        pass
+
+    def layerFinished(self, machine, index):
+        pass
+
+    def moveRejected(self, machine, x, z):
+        pass
+
+    def flushing(self, machine):
+        pass
+
+    def emitted(self, machine, lines):
+        pass
+
+    def rendered(self, machine, lines):
+        pass
+
+
+class Metrics(Observer):
+
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.endTime = self.startTime
+        self.layers = {}
+        self.currentLayer = None
+        self.layerStart = 0.0
+
+        self.moves = 0
+        self.setupMoves = 0
+        self.rejectedMoves = 0
+        self.rejections = []
+        self.lines = 0
+        self.bytes = 0
+        self.peakRows = 0
+        self.peakBytes = 0
+
+        # Rows of the machine's toolpath already counted (the toolpath is cleared on every flush)
+        self.counted = 0
+
+
+    # Counts the moves added to the toolpath since the last look, for the layer being planned
+    def countMoves(self, machine):
+        path = machine.getToolpath()
+        rows = len(path)
+        if rows > self.counted:
+            moves = path.op[self.counted:rows].count(toolpath.MOVE)
+            self.moves += moves
+            if self.currentLayer is None:
+                self.setupMoves += moves
+            else:
+                self.layers[self.currentLayer]['moves'] += moves
+        self.counted = rows
+        self.peakRows = max(self.peakRows, rows)
+        self.peakBytes = max(self.peakBytes, path.nbytes())
+        self.endTime = time.perf_counter()
+
+
+    def layerStarted(self, machine, index):
+        self.countMoves(machine)
+        self.currentLayer = index
+        self.layers[index] = {'layer': index, 'seconds': 0.0, 'moves': 0, 'rejectedMoves': 0}
+        self.layerStart = time.perf_counter()
+
+
+    def layerFinished(self, machine, index):
+        self.countMoves(machine)
+        if index in self.layers:
+            self.layers[index]['seconds'] = time.perf_counter() - self.layerStart
+        self.currentLayer = None
+
+
+    def moveRejected(self, machine, x, z):
+        self.rejectedMoves += 1
+        if self.currentLayer is not None:
+            self.layers[self.currentLayer]['rejectedMoves'] += 1
+        if len(self.rejections) < MAX_REJECTIONS:
+            self.rejections.append({'layer': self.currentLayer, 'x': float(x), 'z': float(z)})
+
+
+    # The toolpath is cleared right after a flush
+    def flushing(self, machine):
+        self.countMoves(machine)
+        self.counted = 0
+
+
+    def emitted(self, machine, lines):
+        self.lines += len(lines)
+        self.bytes += sum(map(len, lines)) + len(lines)
+
+
+    # Rendering the whole program replaces what was counted before
+    def rendered(self, machine, lines):
+        self.countMoves(machine)
+        self.lines = len(lines)
+        self.bytes = sum(map(len, lines)) + len(lines)
+
+
+    def toDict(self):
+        return {'seconds': self.endTime - self.startTime,
+                'moves': self.moves,
+                'setupMoves': self.setupMoves,
+                'rejectedMoves': self.rejectedMoves,
+                'rejections': list(self.rejections),
+                'lines': self.lines,
+                'bytes': self.bytes,
+                'peakRows': self.peakRows,
+                'peakBytes': self.peakBytes,
+                'layers': [self.layers[i] for i in sorted(self.layers)]}
+
+
+    def writeJson(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.toDict(), f, indent=2)
+        return path
+
+
+    def printReport(self, printFn=print):
+        printFn(f"Planned {self.moves} moves in {self.endTime - self.startTime:.3f} s, "
+                f"{self.lines} lines / {self.bytes} bytes emitted")
+        printFn(f"Peak toolpath: {self.peakRows} rows ({self.peakBytes / 2 ** 20:.1f} MB), "
+                f"rejected moves: {self.rejectedMoves}")
+        for i in sorted(self.layers):
+            layer = self.layers[i]
+            printFn(f"\tLayer {i}: {layer['moves']} moves in {layer['seconds'] * 1000:.1f} ms"
+                    + (f", {layer['rejectedMoves']} rejected" if layer['rejectedMoves'] else ""))
+
+
+# Runs code under cProfile (cpu) and/or tracemalloc (memory)
+#   with instrument.Profiler(memory=True) as profiler:
+#       planner.planWind(schedule, machine)
+#   print(profiler.report())
+# cProfile only sees the thread the profiler was entered on. enabled=False makes it do nothing.
+class Profiler():
+
+    def __init__(self, cpu=True, memory=False, enabled=True):
+        self.cpu = cpu and enabled
+        self.memory = memory and enabled
+        self.profile = None
+        self.snapshot = None
+        self.peakBytes = 0
+        self.seconds = 0.0
+
+
+    def __enter__(self):
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cpu:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+        if self.memory:
+            import tracemalloc
+            self.peakBytes = tracemalloc.get_traced_memory()[1]
+            self.snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        return False
+
+
+    # Top functions by cumulative time and top allocation sites, as text
+    def report(self, limit=15):
+        out = io.StringIO()
+        out.write(f"Wall time: {self.seconds:.3f} s\n")
+        if self.profile is not None:
+            import pstats
+            pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(limit)
+        if self.snapshot is not None:
+            out.write(f"Peak traced memory: {self.peakBytes / 2 ** 20:.1f} MB\n")
+            for stat in self.snapshot.statistics('lineno')[:limit]:
+                out.write(f"\t{stat}\n")
+        return out.getvalue()
+
+
+    # Saves the cProfile stats for snakeviz, pstats etc.
+    def dump(self, path):
+        if self.profile is not None:
+            self.profile.dump_stats(path)
+        return path
+
+
+def main(argv=None):
+    import config
+    import helper
+    import load
+    import planner
+    import winder
+
+    parser = argparse.ArgumentParser(description="Plan a wind and report what happened")
+    parser.add_argument('file', help="wind file to plan")
+    parser.add_argument('--config', default=config.DEFAULT_CONFIG, help="machine config file or profile")
+    parser.add_argument('--json', default=None, help="write the metrics to this JSON file")
+    parser.add_argument('--profile', action='store_true', help="run under cProfile and print the top functions")
+    parser.add_argument('--memory', action='store_true', help="run under tracemalloc and print the top allocations")
+    parser.add_argument('--stats', default=None, help="save the cProfile stats to this file")
+    args = parser.parse_args(argv)
+
+    [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(args.file))
+    metrics = Metrics()
+    with Profiler(cpu=args.profile or args.stats is not None, memory=args.memory) as profiler:
+        machine = winder.Winder(defaultFeedRate, machineConfig=args.config, observers=[metrics])
+        machine.setFeedRate(defaultFeedRate, force=True)
+        planner.planWind(schedule, machine)
+
+    metrics.printReport()
+    if args.profile or args.memory:
+        print(profiler.report())
+    if args.stats:
+        profiler.dump(args.stats)
+    if args.json:
+        metrics.writeJson(args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
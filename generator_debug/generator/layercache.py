@@ -0,0 +1,198 @@
+# Per-layer cache of planned toolpaths
+# Planning a layer only depends on the layer's parameters, the machine config and the state the machine
+# starts the layer in (both axes, down to the fraction of a step they carry, and the feed rate). Each planned layer is kept under a hash of those, so when a
+# schedule is generated again only the layers that changed (and the ones after them, if they now start
+# somewhere else) are planned again; the rest are stitched in from the cache.
+# With a directory the cache is also kept on disk (one .npz per layer) and survives restarts. The key
+# includes a fingerprint of the planner sources, so entries from an older planner are never reused.
+
+# Usage:
+#   cache = layercache.LayerCache()                      # or LayerCache('layer_cache') to keep it on disk
+#   planner.planWind(schedule, machine, cache=cache)
+#   print(cache.hits, cache.misses)
+
+import dataclasses
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+
+import config
+import definitions
+import parallel
+import planner
+import toolpath
+import winder
+from toolpath import Toolpath
+
+
+# Layers kept in memory, least recently used ones are dropped first
+MAX_ENTRIES = 256
+
+# Bump when the format of a cached layer changes
+CACHE_VERSION = 4
+
+# Modules whose source decides what a layer plans into
+PLANNER_MODULES = (planner, winder, toolpath, definitions)
+
+_fingerprint = None
+
+
+# Hash of the planner sources, computed once
+def plannerFingerprint() -> str:
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha1()
+        for module in PLANNER_MODULES:
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+# Key of a layer planned on a machine from its current state
+def layerKey(layer, machine: winder.Winder, vectorized=True) -> str:
+    machineConfig = machine.getConfig()
+    x, z, feed = machine.state()
+    settings = [getattr(machineConfig, field.name) for field in dataclasses.fields(machineConfig) if field.name != 'path']
+
+    digest = hashlib.sha1()
+    for part in (CACHE_VERSION, plannerFingerprint(), type(layer).__name__, dataclasses.astuple(layer),
+                 settings, axisKey(x), axisKey(z), feed, machine.defaultFeedrate, bool(vectorized)):
+        digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# Axis state with plain numbers, so equal states always hash the same
+def axisKey(axis):
+    units, ref, run, shift = axis
+    return (int(units), float(ref), float(run), int(shift))
+
+
+class LayerCache():
+
+    # directory: where to keep layers on disk, or None to only keep them in memory
+    def __init__(self, directory=None, maxEntries=MAX_ENTRIES):
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+
+    # Plans a layer on the machine, from the cache if it was planned before from the same state
+    # The layer has to be started on the machine already (machine.startLayer)
+    # Whatever planning the layer printed is printed again on a hit, so skipped layers still say so, and the
+    # moves it rejected are passed on to the machine's observers
+    # Returns True if the layer came from the cache
+    def plan(self, layer, machine: winder.Winder, vectorized=True) -> bool:
+        key, entry = self.lookup(layer, machine, vectorized)
+        hit = entry is not None
+        if not hit:
+            entry = parallel.planFragment(layer, machine.getConfig(), machine.defaultFeedrate, machine.state(),
+                                          vectorized, machine.layerIndex)
+            self.put(key, entry)
+
+        path, state, output, rejected = entry
+        sys.stdout.write(output)
+        for x, z in rejected:
+            machine.notify('moveRejected', x, z)
+        machine.appendToolpath(path, state)
+        return hit
+
+
+    # Key of a layer planned from the machine's current state, and its cache entry (or None), counted as a hit or miss
+    def lookup(self, layer, machine: winder.Winder, vectorized=True):
+        key = layerKey(layer, machine, vectorized)
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return key, entry
+
+
+    # (toolpath, machine state at the end, printed output, rejected moves as (x, z)) of a cached layer, or None
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+
+        if self.directory is not None:
+            entry = self.load(key)
+            if entry is not None:
+                self.remember(key, entry)
+        return entry
+
+
+    def put(self, key, entry):
+        self.remember(key, entry)
+        if self.directory is not None:
+            self.save(key, entry)
+
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+
+    # Forgets everything, on disk too
+    def clear(self):
+        self.entries.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.directory, name))
+
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+    # ---------------- disk ----------------
+    def fileName(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+
+    # Written to a temporary file first, so a crash (or another process) never sees half a layer
+    def save(self, key, entry):
+        import numpy as np
+
+        path, (x, z, feed), output, rejected = entry
+        cols = path.arrays()
+        marks = path.marks()
+        temporary = f"{self.fileName(key)}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            np.savez(f, op=cols['op'], x=cols['x'], z=cols['z'], feed=cols['feed'],
+                     strings=np.array(path.strings, dtype=str),
+                     markRow=marks['row'], markKind=marks['kind'], markPattern=marks['pattern'],
+                     markCircuit=marks['circuit'],
+                     state=np.array([*x, *z, np.nan if feed is None else feed]),
+                     output=np.array(output, dtype=str),
+                     rejected=np.array(rejected, dtype=np.float64).reshape(-1, 2))
+        os.replace(temporary, self.fileName(key))
+
+
+    # A damaged or unreadable file is treated as a miss
+    def load(self, key):
+        import numpy as np
+
+        try:
+            with np.load(self.fileName(key), allow_pickle=False) as data:
+                path = Toolpath()
+                path.appendMarks(data['markRow'], data['markKind'], -1, data['markPattern'], data['markCircuit'])
+                path.appendRows(data['op'], data['x'], data['z'], data['feed'], data['strings'].tolist())
+                state = data['state'].tolist()
+                x, z, feed = axisKey(state[0:4]), axisKey(state[4:8]), state[8]
+                output = str(data['output'])
+                rejected = [tuple(move) for move in data['rejected'].tolist()]
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        return path, (x, z, None if feed != feed else feed), output, rejected
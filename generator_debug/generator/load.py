@@ -1,11 +1,35 @@
+# tkinter is only imported once a dialog is actually needed, so everything else
+# (planning, batch generation) starts quickly and works on machines without a display
+
 import json
-import tkinter as tk
-from tkinter import filedialog
 
-def get_data():
-    root = tk.Tk()
+# Reads a JSON/wind file from a known path, no dialog involved
+# Raises OSError or json.JSONDecodeError if the file cannot be read
+def read_data(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Asks for a file with a dialog, returns the chosen path or an empty string
+# Falls back to typing the path in when there is no display (or no tkinter)
+def ask_open_path(title, filetypes):
+    try:
+        import tkinter as tk
+        from tkinter import filedialog
+
+        root = tk.Tk()
+    except Exception:
+        return input(title + " (path): ").strip()
+
     root.withdraw()
-    file_path = filedialog.askopenfilename(
+    try:
+        return filedialog.askopenfilename(title=title, filetypes=filetypes)
+    finally:
+        root.destroy()
+
+
+def get_data():
+    file_path = ask_open_path(
         title="Select JSON/Wind file",
         filetypes=[("JSON/Wind files", "*.json *.wind"), ("All files", "*.*")]
     )
@@ -15,8 +39,7 @@ def get_data():
         return None, None
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = read_data(file_path)
     except (OSError, json.JSONDecodeError) as e:
         print(f"Error reading file: {e}")
         return None, None
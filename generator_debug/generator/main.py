@@ -3,6 +3,9 @@ import winder
 import definitions
 import load
 import planner
+import layercache
+import instrument
+import sinks
 
 
 def main():
@@ -17,6 +20,8 @@ def main():
     defaultFeedRate = 0.005
     machine = None
     gcode = []
+    layerCache = layercache.LayerCache()
+    metrics = None
 
     # Take user input until quit
     userInput = ""
@@ -33,27 +38,120 @@ def main():
                 [schedule, defaultFeedRate] = helper.loadWindFile()
 
             elif (userInput == "loadg"):
-                print("loadg selected")
-                # TODO: implement loadg
+                import reader
+                filePath = load.ask_open_path("Select gcode file", [("G-code files", "*.nc *.gcode"), ("All files", "*.*")])
+                if not filePath:
+                    print("No file selected.")
+                else:
+                    try:
+                        path = reader.readGcode(filePath)
+                    except (OSError, reader.GcodeError) as e:
+                        print(f"Error reading file: {e}")
+                    else:
+                        machine = winder.Winder(defaultFeedRate)
+                        machine.loadToolpath(path)
+                        gcode = machine.getGcode()
+                        print("Lines loaded =", len(gcode))
 
-            elif (userInput == "generate"):
+            elif (userInput == "generate" or userInput == "profile"):
                 print("DEBUG: Layers in schedule =", len(schedule))
                 for layer in schedule:
                     print("\tLayer type:", layer.getType())
 
-                machine = winder.Winder(defaultFeedRate)
-                gcode = planner.planWind(schedule, machine)
-                machine.setFeedRate(defaultFeedRate, force=True)  # <-- ensure F line is added
+                # "profile" runs the same generation under cProfile and tracemalloc
+                metrics = instrument.Metrics()
+                with instrument.Profiler(memory=True, enabled=(userInput == "profile")) as profiler:
+                    machine = winder.Winder(defaultFeedRate, observers=[metrics])
+                    machine.setFeedRate(defaultFeedRate, force=True)  # <-- ensure F line is added before any move
+                    planner.planWind(schedule, machine, cache=layerCache)
+                    gcode = machine.getGcode()
                 print("DEBUG: G-code lines generated =", len(gcode))
+                if (userInput == "profile"):
+                    print(profiler.report())
+
+            elif (userInput == "metrics"):
+                if metrics is None:
+                    print("No metrics yet, generate gcode first.")
+                else:
+                    metrics.printReport()
+                    if input("Save as JSON? (y/n) ") == "y":
+                        print("Saved to", metrics.writeJson('windMetrics.json'))
+
+            elif (userInput == "optimize"):
+                if machine is None:
+                    print("Nothing to optimize, generate gcode first.")
+                else:
+                    import optimizer
+                    stripComments = input("Strip comments? (y/n) ") == "y"
+                    optimized, report = optimizer.optimize(machine.getToolpath(), stripComments)
+                    # Later commands (save, estimate, validate, plot...) work on the optimized program
+                    machine.loadToolpath(optimized)
+                    gcode = optimized.render()
+                    print("Lines:", report['linesBefore'], "->", report['linesAfter'],
+                          "| Bytes:", report['bytesBefore'], "->", report['bytesAfter'])
+
+            elif (userInput == "estimate"):
+                if machine is None:
+                    print("Nothing to estimate, generate gcode first.")
+                else:
+                    import estimator
+                    report = estimator.estimate(machine.getToolpath(), machine.getConfig())
+                    estimator.printReport(report)
+
+            elif (userInput == "validate"):
+                if machine is None:
+                    print("Nothing to validate, generate gcode first.")
+                else:
+                    import validator
+                    report = validator.validate(machine.getToolpath(), machine.getConfig(), schedule)
+                    validator.printReport(report)
 
             elif (userInput == "plot"):
-                print("plot selected")
-                # TODO: implement plot
+                if machine is None:
+                    print("Nothing to plot, generate or load gcode first.")
+                else:
+                    import plotter
+                    colorBy = "pattern" if input("Color by layer or pattern? ") == "pattern" else "layer"
+                    plotter.plotToolpath(machine.getToolpath(), machine.getConfig(), colorBy)
+                    plotter.show()
+
+            elif (userInput == "coverage"):
+                if machine is None or not schedule:
+                    print("Nothing to map, load a wind file and generate gcode first.")
+                else:
+                    import coverage
+                    import plotter
+                    report = coverage.coverageMap(machine.getToolpath(), [layer.getWidth() for layer in schedule], machine.getConfig())
+                    coverage.printReport(report)
+                    coverage.plotCoverage(report)
+                    plotter.show()
 
             elif (userInput == "write"):
-                with open('windGcode.nc', 'w') as writeFile:
-                    for line in gcode:
-                        writeFile.write(line + '\n')
+                sinks.writeGcode(gcode, 'windGcode.nc')
+
+            elif (userInput == "archive"):
+                if machine is None:
+                    print("Nothing to archive, generate gcode first.")
+                else:
+                    import archive
+                    records = archive.writeArchive(machine.getToolpath(), 'windGcode.nc')
+                    print("Written windGcode.nc,", records.size - 1, "resume points in", archive.indexPath('windGcode.nc'))
+
+            elif (userInput == "resume"):
+                import archive
+                filePath = load.ask_open_path("Select archived gcode file", [("G-code files", "*.nc"), ("All files", "*.*")])
+                if not filePath:
+                    print("No file selected.")
+                else:
+                    try:
+                        layer = int(input("Layer: "))
+                        pattern = int(input("Pattern (blank for the start of the layer): ") or -1)
+                        circuit = int(input("Circuit (blank for the start of the pattern): ") or -1) if pattern >= 0 else -1
+                        record = archive.resume(filePath, 'resumeGcode.nc', layer, pattern, circuit)
+                    except (ValueError, OSError) as e:
+                        print(f"Cannot resume: {e}")
+                    else:
+                        print(f"Resuming at {archive.describe(record)} (line {record['line']}), written to resumeGcode.nc")
 
             elif (userInput == "calculator"):
                 helper.calculator()
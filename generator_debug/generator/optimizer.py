@@ -0,0 +1,168 @@
+# Post-processing pass that shrinks a planned toolpath before it is written
+# Every line costs a serial round trip when streaming to GRBL, so this removes what the machine does not need:
+#   - consecutive collinear moves at the same feed rate are merged into one (e.g. lock, lock, start step)
+#   - moves that do not go anywhere are dropped
+#   - G92 resets that do not change the coordinates, and repeated feed rate lines, are dropped
+#   - comments are dropped too if asked
+# The final machine position (both the logical coordinates and the actual travel) is checked to be unchanged.
+# Layer, pattern and circuit marks are carried over to the rows that are left.
+
+# Usage:
+#   optimized, report = optimizer.optimize(machine.getToolpath(), stripComments=True)
+#   machine.loadToolpath(optimized)
+#   gcode = optimized.render()
+
+import numpy as np
+
+import toolpath
+from toolpath import Toolpath
+
+
+# Positions closer than this are treated as the same point
+TOLERANCE = 1e-9
+
+
+class OptimizationError(RuntimeError):
+    pass
+
+
+def optimize(path: Toolpath, stripComments=False):
+    cols = path.arrays()
+    ops = cols['op']
+    xs = cols['x']
+    zs = cols['z']
+    feeds = cols['feed']
+
+    keep = np.ones(len(path), dtype=bool)
+    counts = {'mergedMoves': 0, 'noopMoves': 0, 'redundantSets': 0, 'redundantFeeds': 0, 'comments': 0}
+
+    # Position before the current row, unknown at the start and after a home or raw command
+    px, pz = 0.0, 0.0
+    known = False
+    # Last kept move that the next move may be merged into, and where that (merged) segment starts
+    lastMove = -1
+    segX, segZ = 0.0, 0.0
+    # Last kept G92, as long as nothing has moved since
+    lastSet = -1
+    currentFeed = None
+
+    for i, (op, x, z, f) in enumerate(zip(ops.tolist(), xs.tolist(), zs.tolist(), feeds.tolist())):
+        if op == toolpath.MOVE:
+            if known and abs(x - px) <= TOLERANCE and abs(z - pz) <= TOLERANCE:
+                keep[i] = False
+                counts['noopMoves'] += 1
+            elif lastMove >= 0 and feeds[lastMove] == f and collinear(segX, segZ, px, pz, x, z):
+                keep[lastMove] = False
+                counts['mergedMoves'] += 1
+                lastMove = i
+            else:
+                lastMove = i
+                segX, segZ = px, pz
+            lastSet = -1
+            known = True
+
+        elif op == toolpath.COMMENT:
+            if stripComments:
+                keep[i] = False
+                counts['comments'] += 1
+            else:
+                lastMove = -1
+
+        elif op == toolpath.SET:
+            if known and abs(x - px) <= TOLERANCE and abs(z - pz) <= TOLERANCE:
+                keep[i] = False
+                counts['redundantSets'] += 1
+            else:
+                # Two resets in a row: only the second one matters
+                if lastSet >= 0:
+                    keep[lastSet] = False
+                    counts['redundantSets'] += 1
+                lastSet = i
+            lastMove = -1
+            known = True
+
+        elif op == toolpath.FEED:
+            if currentFeed is not None and f == currentFeed:
+                keep[i] = False
+                counts['redundantFeeds'] += 1
+            else:
+                currentFeed = f
+                lastMove = -1
+
+        else:
+            lastMove = -1
+            lastSet = -1
+            if op in (toolpath.HOME, toolpath.RAW):
+                known = False
+
+        px, pz = x, z
+
+    optimized = Toolpath()
+
+    # A mark moves to the first row left at or after the one it was on
+    marks = path.marks()
+    newRows = np.concatenate(([0], np.cumsum(keep)))
+    optimized.appendMarks(newRows[marks['row']], marks['kind'], marks['layer'], marks['pattern'], marks['circuit'])
+
+    texts = [path.strings[t] for t in cols['text'][keep].tolist() if t >= 0]
+    optimized.appendRows(ops[keep], xs[keep], zs[keep], feeds[keep], texts)
+
+    before = finalState(path)
+    after = finalState(optimized)
+    if not sameState(before, after):
+        raise OptimizationError(f"Optimization changed the final machine state: {before} -> {after}")
+
+    bytesBefore = sum(len(line) + 1 for lines in path.iterChunks() for line in lines)
+    bytesAfter = sum(len(line) + 1 for lines in optimized.iterChunks() for line in lines)
+
+    report = {'linesBefore': len(path),
+              'linesAfter': len(optimized),
+              'linesSaved': len(path) - len(optimized),
+              'bytesBefore': bytesBefore,
+              'bytesAfter': bytesAfter,
+              'bytesSaved': bytesBefore - bytesAfter,
+              'finalState': after}
+    report.update(counts)
+    return optimized, report
+
+
+# True if the move (bx, bz) -> (cx, cz) carries on in the same direction as (ax, az) -> (bx, bz)
+def collinear(ax, az, bx, bz, cx, cz) -> bool:
+    ux, uz = bx - ax, bz - az
+    vx, vz = cx - bx, cz - bz
+    cross = ux * vz - uz * vx
+    dot = ux * vx + uz * vz
+    return dot > 0 and abs(cross) <= TOLERANCE * (abs(ux) + abs(uz)) * (abs(vx) + abs(vz))
+
+
+# Logical coordinates, total travel since the last G28 and feed rate at the end of a toolpath
+def finalState(path: Toolpath):
+    cols = path.arrays()
+    ops = cols['op']
+    if ops.size == 0:
+        return {'x': 0.0, 'z': 0.0, 'travelX': 0.0, 'travelZ': 0.0, 'feed': None}
+
+    # Travel is the sum of the move deltas, starting over at the last home command
+    homes = np.flatnonzero(ops == toolpath.HOME)
+    start = int(homes[-1]) if homes.size else 0
+
+    x = cols['x'][start:]
+    z = cols['z'][start:]
+    isMove = ops[start:] == toolpath.MOVE
+    prevX = np.concatenate(([0.0], x[:-1]))
+    prevZ = np.concatenate(([0.0], z[:-1]))
+
+    feedRows = np.flatnonzero(ops == toolpath.FEED)
+
+    return {'x': float(cols['x'][-1]),
+            'z': float(cols['z'][-1]),
+            'travelX': float(np.sum((x - prevX)[isMove])),
+            'travelZ': float(np.sum((z - prevZ)[isMove])),
+            'feed': float(cols['feed'][feedRows[-1]]) if feedRows.size else None}
+
+
+def sameState(a, b) -> bool:
+    for key in ('x', 'z', 'travelX', 'travelZ'):
+        if abs(a[key] - b[key]) > 1e-6 * max(1.0, abs(a[key])):
+            return False
+    return a['feed'] == b['feed']
@@ -0,0 +1,170 @@
+# Parallel planning of a schedule
+# A layer's rows only depend on the layer and the state the machine starts it in (Winder.state), and
+# planner.layerEndState works out the state a helical layer ends in without planning it. So the state every
+# layer starts in is known up front, the layers are planned at the same time in worker processes and their
+# rows are stitched back in schedule order. Layers whose end state can't be worked out that way (hoops, moves
+# that would leave the envelope) are quick to plan and are planned right away while walking the schedule.
+# Workers send their rows back as packed column bytes (Toolpath.pack), not gcode text; the gcode is rendered
+# from the stitched rows as usual and is byte-identical to planning one layer after another. Whatever the
+# planner prints for a layer and the moves it rejects are passed on in schedule order too.
+
+# Usage:
+#   planner.planWind(schedule, machine, workers=4)
+# or from the command line, checking the result against planning one layer after another:
+#   python parallel.py TEST.wind --workers 4 --out windGcode.nc --check
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+import planner
+import toolpath
+import winder
+
+
+# Keeps the moves a machine rejected, to be passed on to the machine the layer ends up on
+class Rejections(instrument.Observer):
+
+    def __init__(self):
+        self.moves = []
+
+    def moveRejected(self, machine, x, z):
+        self.moves.append((x, z))
+
+
+# Plans a layer on a scratch machine that starts in the given state, as layer number layerIndex
+# Returns (toolpath, end state, printed output, rejected moves as (x, z)); none of it is passed on yet
+def planFragment(layer, machineConfig, defaultFeedrate, state, vectorized=True, layerIndex=-1):
+    rejections = Rejections()
+    scratch = winder.Winder(defaultFeedrate, machineConfig=machineConfig, observers=[rejections])
+    scratch.getToolpath().clear()
+    scratch.setState(state)
+    scratch.layerIndex = layerIndex
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        planner.planLayer(layer, scratch, vectorized)
+    return scratch.getToolpath(), scratch.state(), output.getvalue(), rejections.moves
+
+
+# Runs in a worker process: the same, with the toolpath packed
+def planPacked(layer, machineConfig, defaultFeedrate, state, vectorized=True, layerIndex=-1):
+    path, end, output, rejected = planFragment(layer, machineConfig, defaultFeedrate, state, vectorized, layerIndex)
+    return path.pack(), end, output, rejected
+
+
+# Plans every layer of the schedule on the machine, using up to workers processes (all cores if None)
+# Same arguments as planner.planWind, which calls this when given more than one worker
+def planLayers(schedule, machine: winder.Winder, vectorized=True, cache=None, onLayer=None, workers=None):
+    machineConfig = machine.getConfig()
+    defaultFeedrate = machine.defaultFeedrate
+
+    # Walk the schedule for the state each layer starts in; layers that have to be planned to know where they
+    # end (or are cached) are done here, the rest is left to the workers
+    cursor = winder.Winder(defaultFeedrate, machineConfig=machineConfig)
+    cursor.getToolpath().clear()
+    cursor.setState(machine.state())
+    entries, keys, done, hits = [], {}, {}, set()
+    for i, layer in enumerate(schedule):
+        entries.append(cursor.state())
+        if cache is not None:
+            keys[i], entry = cache.lookup(layer, cursor, vectorized)
+            if entry is not None:
+                done[i] = entry
+                hits.add(i)
+                cursor.setState(entry[1])
+                continue
+
+        end = planner.layerEndState(layer, cursor)
+        if end is None:
+            done[i] = planFragment(layer, machineConfig, defaultFeedrate, entries[i], vectorized, i)
+            end = done[i][1]
+        cursor.setState(end)
+
+    todo = [i for i in range(len(schedule)) if i not in done]
+    pool = ProcessPoolExecutor(max_workers=workers) if len(todo) > 1 else None
+    try:
+        futures = {}
+        if pool is not None:
+            futures = {i: pool.submit(planPacked, schedule[i], machineConfig, defaultFeedrate, entries[i], vectorized, i)
+                       for i in todo}
+
+        for i, layer in enumerate(schedule):
+            if onLayer is not None:
+                onLayer(i, len(schedule))
+            machine.startLayer(i)
+
+            # Should a predicted state ever be off, the layer is planned from where the machine really is
+            if machine.state() != entries[i]:
+                planner.planLayer(layer, machine, vectorized)
+                machine.endLayer()
+                continue
+
+            if i in futures:
+                packed, end, output, rejected = futures.pop(i).result()
+                path = toolpath.unpack(packed)
+            elif i in done:
+                path, end, output, rejected = done.pop(i)
+            else:
+                path, end, output, rejected = planFragment(layer, machineConfig, defaultFeedrate, entries[i], vectorized, i)
+            if cache is not None and i not in hits:
+                cache.put(keys[i], (path, end, output, rejected))
+
+            sys.stdout.write(output)
+            for x, z in rejected:
+                machine.notify('moveRejected', x, z)
+            machine.appendToolpath(path, end)
+            machine.endLayer()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    import config
+    import helper
+    import load
+    import sinks
+
+    parser = argparse.ArgumentParser(description="Plan a wind with its layers spread over worker processes")
+    parser.add_argument('file', help="wind file to plan")
+    parser.add_argument('--config', default=config.DEFAULT_CONFIG, help="machine config file or profile")
+    parser.add_argument('--workers', '-j', type=int, default=0, help="number of worker processes (default: all cores)")
+    parser.add_argument('--out', default=None, help="write the gcode to this file")
+    parser.add_argument('--check', action='store_true', help="also plan one layer after another and compare")
+    args = parser.parse_args(argv)
+
+    [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(args.file))
+    machineConfig = config.getConfig(args.config)
+
+    def plan(workers):
+        start = time.perf_counter()
+        sink = sinks.FileSink(args.out) if args.out and workers != 1 else None
+        machine = winder.Winder(defaultFeedRate, sink, machineConfig=machineConfig)
+        machine.setFeedRate(defaultFeedRate, force=True)
+        planner.planWind(schedule, machine, workers=workers)
+        return machine.finish(), time.perf_counter() - start
+
+    result, seconds = plan(args.workers)
+    print(f"Planned {len(schedule)} layers with {args.workers or os.cpu_count()} workers in {seconds:.3f} s")
+    if args.out:
+        print(f"Written to {args.out}")
+
+    if args.check:
+        serial, serialSeconds = plan(1)
+        if args.out:
+            with open(args.out, 'r', encoding='utf-8') as f:
+                result = f.read().splitlines()
+        same = list(result) == list(serial)
+        print(f"One layer after another: {serialSeconds:.3f} s, output {'identical' if same else 'DIFFERENT'}")
+        return 0 if same else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
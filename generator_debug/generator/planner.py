@@ -1,13 +1,20 @@
 # Computes required mandrel and carriage positions to execute winds
 
-import math
-
+import config
 import definitions
+import sinks
+import toolpath
 import winder
 
 
 
-def planWind(schedule, machine: winder.Winder):
+# Plans every layer of the schedule on the given machine
+# Returns whatever the machine's sink produced (the list of gcode commands by default)
+# vectorized=False plans helical layers with the plain Python loop instead of numpy
+# cache, if given (a layercache.LayerCache), reuses layers already planned from the same starting state
+# onLayer, if given, is called with (layer index, number of layers) before each layer; it may raise to stop planning
+# workers, if more than one (or 0 for all cores), plans the layers in that many processes (see parallel.py)
+def planWind(schedule, machine: winder.Winder, vectorized=True, cache=None, onLayer=None, workers=1):
 
     machine.moveHome()
     # Set location as zero
@@ -15,78 +22,366 @@ def planWind(schedule, machine: winder.Winder):
     # Set default feed rate
     #machine.setFeedRate(0.5)
 
-    for layer in schedule:
-        if (layer.getType() == definitions.WindType.HOOP):
-            planHoopWind(layer, machine)
-        elif (layer.getType() == definitions.WindType.HELICAL):
-            planHelicalWind(layer, machine)
+    if (workers != 1 and len(schedule) > 1):
+        import parallel
+        parallel.planLayers(schedule, machine, vectorized, cache, onLayer, workers or None)
+        return machine.getGcode()
+
+    for i, layer in enumerate(schedule):
+        if onLayer is not None:
+            onLayer(i, len(schedule))
+        machine.startLayer(i)
+        if cache is None:
+            planLayer(layer, machine, vectorized)
         else:
-            print('Error: layer not recognized as a valid type')
+            cache.plan(layer, machine, vectorized)
+        machine.endLayer()
 
     return machine.getGcode()            
 
 
-def planHoopWind(layer, machine):
-    # TODO: implement logic for a hoop wind
-    return
+# Plans a single layer from wherever the machine is
+def planLayer(layer, machine: winder.Winder, vectorized=True):
+    if (layer.getType() == definitions.WindType.HOOP):
+        planHoopWind(layer, machine)
+    elif (layer.getType() == definitions.WindType.HELICAL):
+        planHelicalWind(layer, machine, vectorized)
+    else:
+        print('Error: layer not recognized as a valid type')
 
-def planHelicalWind(layer: definitions.HelicalWind, machine: winder.Winder):
-    # --- Retrieve basic properties ---
-    mandrelCircumference = math.pi * machine.getDiameter()   # [inches]
-    windLength = layer.getWindLength()                       # [inches]
-    towWidth = layer.getWidth()                              # [inches]
-    windAngleDeg = layer.getWindAngle()                     # DEGREES (from JSON)
-    numStarts = layer.getNumStarts()                        # integer
-    lockAngleDeg = layer.getLockAngle()                     # DEGREES (used directly in G-code)
-    skipInitialLock = layer.doSkipInitialLock()             # boolean
 
+# Plans the schedule straight into a sink instead of building the whole program in memory
+# e.g. planWindTo(schedule, 30, sinks.FileSink('windGcode.nc'))
+def planWindTo(schedule, defaultFeedRate, sink, machineConfig=config.DEFAULT_CONFIG, cache=None, workers=1):
+    machine = winder.Winder(defaultFeedRate, sink, machineConfig=machineConfig)
+    machine.setFeedRate(defaultFeedRate, force=True)
+    planWind(schedule, machine, cache=cache, workers=workers)
+    return machine.finish()
 
-    effectiveTowWidth = towWidth / math.cos(math.radians(windAngleDeg))
 
+# Plans the schedule and streams it to a gcode file, returns the path
+def writeWind(schedule, defaultFeedRate, path, machineConfig=config.DEFAULT_CONFIG, workers=1):
+    return planWindTo(schedule, defaultFeedRate, sinks.FileSink(path), machineConfig, workers=workers)
 
-    numCircuits = math.ceil(mandrelCircumference / effectiveTowWidth)
 
-  
-    passStepAngle = 360 / numCircuits 
+# Feed rate of each class of move in a layer (see definitions.FEED_CLASSES), None for all of them if the layer
+# has no feed rates of its own (every move then runs at the feed rate in effect)
+def feedRates(layer: definitions.Ply, machine: winder.Winder):
+    profile = layer.getFeedRates()
+    if (not profile):
+        return dict.fromkeys(definitions.FEED_CLASSES)
+    return {moveClass: profile.get(moveClass, machine.defaultFeedrate) for moveClass in definitions.FEED_CLASSES}
 
-    passAngle = (windLength * math.tan(math.radians(windAngleDeg))) * (360 / mandrelCircumference)
-   
-    numPatterns = int(numCircuits / numStarts)
 
-    # --- Validation ---
-    if (numCircuits % numStarts != 0):
+# Each traverse along the mandrel is one coordinated X/Z move, so GRBL runs the whole layer at full feed
+# A layer goes to the far end and back, or only there for a single pass (taping)
+def planHoopWind(layer: definitions.HoopWind, machine: winder.Winder):
+    geometry = layer.geometry(machine.getConfig())
+    if (geometry is None):
+        print('Invalid tow width for a hoop layer, it must be positive and smaller than the mandrel circumference.')
+        print('This layer will be skipped.')
+        return
+
+    windLength = layer.getWindLength()
+    numPasses = geometry.numPasses
+    traverseAngle = geometry.traverseAngle
+    feeds = feedRates(layer, machine)
+
+    # Start from whichever end the carriage is closer to
+    direction = 1 if machine.X < windLength / 2 else -1
+
+    machine.startPattern(0)
+    machine.setAxes(x=machine.X, z=0)  # reset Z like a helical pattern does
+    for j in range(numPasses):
+        machine.renormalize()
+        machine.startCircuit(j)
+        machine.pushComment(f"Hoop pass: {j}/{numPasses}")
+        target = windLength if direction > 0 else 0
+        machine.moveBy(dx=target - machine.X, dz=abs(target - machine.X) / windLength * traverseAngle, feed=feeds['pass'])
+        direction = -direction
+
+
+# Checks the layer can actually be wound, prints why not otherwise
+def checkHelical(layer: definitions.HelicalWind, geometry) -> bool:
+    if (geometry.numCircuits % layer.getNumStarts() != 0):
         print('Invalid combination of number of circuits and number of starts.')
         print('Please use the calculator to compute valid start numbers for your wind angle and tow.')
         print('-------------------------------------------------------------------------------------')
         print('This layer will be skipped.')
+        return False
+    return True
+
+
+def planHelicalWind(layer: definitions.HelicalWind, machine: winder.Winder, vectorized=True):
+    # --- Retrieve basic properties ---
+    windLength = layer.getWindLength()                       # [inches]
+    numStarts = layer.getNumStarts()                        # integer
+    lockAngleDeg = layer.getLockAngle()                     # DEGREES (used directly in G-code)
+    skipInitialLock = layer.doSkipInitialLock()             # boolean
+
+    geometry = layer.geometry(machine.getConfig())
+    numCircuits = geometry.numCircuits
+    passStepAngle = geometry.passStepAngle
+    passAngle = geometry.passAngle
+    numPatterns = geometry.numPatterns
+    feeds = feedRates(layer, machine)
+
+    # --- Validation ---
+    if (not checkHelical(layer, geometry)):
         return
 
 
     if (not skipInitialLock):
-        machine.moveBy(dx=0, dz=lockAngleDeg)  
+        machine.moveBy(dx=0, dz=lockAngleDeg, feed=feeds['lock'])  
+
+    if (vectorized and planHelicalPatterns(layer, machine, geometry)):
+        return
 
     # --- Loop over patterns and starts ---
     for i in range(numPatterns):
+        machine.startPattern(i)
         machine.setAxes(x=machine.X, z=0)  # reset Z for each pattern
         for j in range(numStarts):
+            machine.renormalize()  # keep Z short, the carriage is at the end of the mandrel here
+            machine.startCircuit(j)
             machine.pushComment(f"Pattern: {i}/{numPatterns} Circuit: {j}/{numStarts}")
             
             # Wind down the mandrel
-            machine.moveBy(dx=windLength, dz=passAngle)  # passAngle in DEGREES
+            machine.moveBy(dx=windLength, dz=passAngle, feed=feeds['pass'])  # passAngle in DEGREES
 
             # Perform lock wind
-            machine.moveBy(dx=0, dz=(lockAngleDeg - (passAngle % 360)))
+            machine.moveBy(dx=0, dz=(lockAngleDeg - (passAngle % 360)), feed=feeds['lock'])
 
             # Wind up the mandrel
-            machine.moveBy(dx=-windLength, dz=passAngle)
+            machine.moveBy(dx=-windLength, dz=passAngle, feed=feeds['pass'])
 
             # Perform another lock wind
-            machine.moveBy(dx=0, dz=(lockAngleDeg - (passAngle % 360)))
+            machine.moveBy(dx=0, dz=(lockAngleDeg - (passAngle % 360)), feed=feeds['lock'])
 
             # Move to next start position
-            machine.moveBy(dx=0, dz=(passStepAngle * numCircuits / numStarts))
+            machine.moveBy(dx=0, dz=(passStepAngle * numCircuits / numStarts), feed=feeds['step'])
 
         # Move to the next pattern location
-        machine.moveBy(dx=0, dz=passStepAngle)
+        machine.moveBy(dx=0, dz=passStepAngle, feed=feeds['step'])
+
+
+# Vectorized version of the pattern loop in planHelicalWind
+# The motion is periodic (pass, lock, return pass, lock, step), so the whole layer is built with numpy
+# cumulative sums and handed to the winder in one go. The rows are identical to the ones the loop produces:
+# the fixed point arithmetic of winder.FixedAxis is done the same way (unrounded running sums since the
+# pattern's G92, rounded to steps), only the fraction of a step carried from one pattern to the next is
+# worked out pattern by pattern.
+# Returns False without touching the machine if numpy is unavailable or a move would leave the envelope,
+# in which case the loop is used so out of bounds moves are handled the same way as always.
+def planHelicalPatterns(layer: definitions.HelicalWind, machine: winder.Winder, geometry) -> bool:
+    try:
+        import numpy as np
+    except ImportError:
+        return False
+
+    numStarts = layer.getNumStarts()
+    numPatterns = geometry.numPatterns
+
+    if (numPatterns <= 0):
+        return True
+
+    # Running sums of one pattern's moves since its G92, in steps; the same for every pattern
+    runX, runZ = helicalRuns(layer, geometry)
+
+    # Where each pattern's G92 leaves the axes (the fraction of a step carried over differs between patterns)
+    axisX = winder.FixedAxis()
+    axisZ = winder.FixedAxis()
+    axisX.restore(*machine.axisX.state())
+    axisZ.restore(*machine.axisZ.state())
+    refX, refZ, startX = patternStarts(axisX, axisZ, runX, runZ, numPatterns)
+
+    # Positions after every move (patterns x moves), in steps; Z before renormalizing
+    moveX = np.rint(refX[:, None] + runX[None, :]).astype(np.int64)
+    moveZ = np.rint(refZ[:, None] + runZ[None, :]).astype(np.int64)
+
+    if (np.any(moveX < 0) or np.any(moveX / toolpath.SCALE > machine.xLimit)):
+        return False
+
+    shift, renormalized = circuitShifts(moveZ, numStarts, machine.renormalizeLimit)
+
+    # Row layout of one pattern: G92, then (comment + five moves) per circuit, then the pattern step
+    rowsPerPattern = 1 + 6 * numStarts + 1
+
+    ops = np.full((numPatterns, rowsPerPattern), toolpath.MOVE, dtype=np.uint8)
+    ops[:, 0] = toolpath.SET
+    ops[:, 1:-1:6] = toolpath.COMMENT
+
+    # Which move each row has just completed (comments and G92 keep the previous position), and which circuit
+    # it belongs to (0 for the G92, j + 1 for circuit j)
+    isMove = ops[0] == toolpath.MOVE
+    rowMove = np.cumsum(isMove)
+    rowCircuit = np.minimum((np.arange(rowsPerPattern) + 5) // 6, numStarts)
+
+    positionsX = np.concatenate((startX[:, None], moveX), axis=1)
+    positionsZ = np.concatenate((np.zeros((numPatterns, 1), dtype=np.int64), moveZ), axis=1)
+    xs = positionsX[:, rowMove]
+    zs = positionsZ[:, rowMove] - np.concatenate((np.zeros((numPatterns, 1), dtype=np.int64), shift), axis=1)[:, rowCircuit]
+
+    comments = [f"Pattern: {i}/{numPatterns} Circuit: {j}/{numStarts}"
+                for i in range(numPatterns) for j in range(numStarts)]
+
+    # Each pattern starts at its G92, each circuit at its comment
+    patternRows = np.arange(numPatterns) * rowsPerPattern
+    circuitRows = patternRows[:, None] + 1 + 6 * np.arange(numStarts)[None, :]
+    markRows = np.concatenate((patternRows[:, None], circuitRows), axis=1).ravel()
+    markKinds = np.tile(np.concatenate(([toolpath.PATTERN], np.full(numStarts, toolpath.CIRCUIT))), numPatterns)
+    markPatterns = np.repeat(np.arange(numPatterns), numStarts + 1)
+    markCircuits = np.tile(np.concatenate(([-1], np.arange(numStarts))), numPatterns)
+
+    # Renormalizing G92s go right before the comment of their circuit, at the position the comment has
+    ops, xs, zs = ops.ravel(), xs.ravel(), zs.ravel()
+    inserted = circuitRows[renormalized]
+    insertedOps = np.full(inserted.size, toolpath.SET, dtype=np.uint8)
+    insertedXs, insertedZs = xs[inserted], zs[inserted]
+
+    # With feed rates per class of move, an F line goes right before every move whose feed rate differs from the
+    # one before it, at the position of the row before it
+    rowFeeds = insertedFeeds = None
+    feeds = feedRates(layer, machine)
+    if (feeds['pass'] is not None):
+        moveFeeds = np.append(np.tile([feeds['pass'], feeds['lock'], feeds['pass'], feeds['lock'], feeds['step']], numStarts),
+                              feeds['step'])
+        previous = np.full(numPatterns, moveFeeds[-1])
+        previous[0] = machine.currentFeedRate if machine.currentFeedRate is not None else machine.defaultFeedrate
+        changed = np.empty((numPatterns, moveFeeds.size), dtype=bool)
+        changed[:, 0] = moveFeeds[0] != previous
+        changed[0, 0] |= machine.currentFeedRate is None
+        changed[:, 1:] = moveFeeds[1:] != moveFeeds[:-1]
+
+        # Feed rate after every row: the one of the last move, or the one the pattern started with
+        rowFeeds = np.where(rowMove > 0, moveFeeds[np.maximum(rowMove - 1, 0)], previous[:, None]).ravel()
+        feedRows = (patternRows[:, None] + np.flatnonzero(isMove)[None, :])[changed]
+        inserted = np.concatenate((inserted, feedRows))
+        insertedOps = np.concatenate((insertedOps, np.full(feedRows.size, toolpath.FEED, dtype=np.uint8)))
+        insertedXs = np.concatenate((insertedXs, xs[feedRows - 1]))
+        insertedZs = np.concatenate((insertedZs, zs[feedRows - 1]))
+        insertedFeeds = np.concatenate((rowFeeds[inserted[:inserted.size - feedRows.size]],
+                                        np.broadcast_to(moveFeeds, changed.shape)[changed]))
+
+    if (inserted.size):
+        ops = np.insert(ops, inserted, insertedOps)
+        xs = np.insert(xs, inserted, insertedXs)
+        zs = np.insert(zs, inserted, insertedZs)
+        if (rowFeeds is not None):
+            rowFeeds = np.insert(rowFeeds, inserted, insertedFeeds)
+        markRows = markRows + np.searchsorted(np.sort(inserted), markRows, side='right')
+
+    axisZ.shift = int(shift[-1, -1])
+    axisZ.units = int(zs[-1])
+    machine.recordRows(ops, xs / toolpath.SCALE, zs / toolpath.SCALE, comments,
+                       (markRows, markKinds, markPatterns, markCircuits), (axisX.state(), axisZ.state()), rowFeeds)
+    return True
+
+
+# Running sums (in steps) of the moves in one pattern of a helical layer: five per circuit (pass, lock, return
+# pass, lock, step to the next start), then the step to the next pattern
+def helicalRuns(layer: definitions.HelicalWind, geometry):
+    import numpy as np
+
+    windLength = layer.getWindLength()
+    numStarts = layer.getNumStarts()
+    passAngle = geometry.passAngle
+    passStepAngle = geometry.passStepAngle
+    lockMove = layer.getLockAngle() - (passAngle % 360)
+    startStep = passStepAngle * geometry.numCircuits / numStarts
+
+    dx = np.tile(np.array([windLength, 0, -windLength, 0, 0], dtype=np.float64), numStarts)
+    dz = np.tile(np.array([passAngle, lockMove, passAngle, lockMove, startStep], dtype=np.float64), numStarts)
+    dx = np.append(dx, 0.0)
+    dz = np.append(dz, passStepAngle)
+    return np.cumsum(dx * toolpath.SCALE), np.cumsum(dz * toolpath.SCALE)
+
+
+# Steps the axes through the G92 (X kept, Z zeroed) and the moves of every pattern, as the loop does
+# Returns where each pattern's G92 leaves the axes: (refX, refZ, startX) arrays, one entry per pattern
+# The axes end up at the end of the last pattern, before any renormalizing
+def patternStarts(axisX: winder.FixedAxis, axisZ: winder.FixedAxis, runX, runZ, numPatterns):
+    import numpy as np
+
+    endX, endZ = float(runX[-1]), float(runZ[-1])
+    refX, refZ, startX = [], [], []
+    for i in range(numPatterns):
+        axisX.set(axisX.value())
+        axisZ.set(0)
+        refX.append(axisX.ref)
+        refZ.append(axisZ.ref)
+        startX.append(axisX.units)
+        axisX.commit(endX, round(axisX.ref + endX))
+        axisZ.commit(endZ, round(axisZ.ref + endZ))
+    return np.array(refX), np.array(refZ), np.array(startX, dtype=np.int64)
+
+
+# Renormalizing at the start of each circuit (circuit 0 starts right after the pattern's G92, at zero)
+# moveZ: Z after every move of each pattern (patterns x moves, in steps, before renormalizing)
+# Returns shift, the steps taken off Z during each circuit, and renormalized, the circuits that start with
+# a G92 (both patterns x circuits)
+def circuitShifts(moveZ, numStarts, limit):
+    import numpy as np
+
+    numPatterns = moveZ.shape[0]
+    shift = np.zeros((numPatterns, numStarts), dtype=np.int64)
+    renormalized = np.zeros((numPatterns, numStarts), dtype=bool)
+    for j in range(1, numStarts):
+        z = moveZ[:, 5 * j - 1] - shift[:, j - 1]
+        renormalized[:, j] = np.abs(z) >= limit
+        shift[:, j] = shift[:, j - 1] + np.where(renormalized[:, j], z // winder.TURN, 0) * winder.TURN
+    return shift, renormalized
+
+
+# State a layer leaves the machine in (see Winder.state), worked out without planning the layer
+# Helical layers are worked out pattern by pattern with the same arithmetic as planHelicalPatterns, without
+# building any rows. Returns None for other layers, when numpy is unavailable or when a move would leave the
+# envelope; the layer has to be planned to know then.
+def layerEndState(layer, machine: winder.Winder):
+    if (layer.getType() != definitions.WindType.HELICAL):
+        return None
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+
+    geometry = layer.geometry(machine.getConfig())
+    numStarts = layer.getNumStarts()
+    numPatterns = geometry.numPatterns
+    if (geometry.numCircuits % numStarts != 0):
+        return machine.state()
+
+    axisX = winder.FixedAxis()
+    axisZ = winder.FixedAxis()
+    axisX.restore(*machine.axisX.state())
+    axisZ.restore(*machine.axisZ.state())
+
+    # The layer ends on a step if it has patterns, on its initial lock otherwise
+    feeds = feedRates(layer, machine)
+    feed = machine.currentFeedRate
+    if (feeds['step'] is not None and numPatterns > 0):
+        feed = feeds['step']
+    elif (feeds['lock'] is not None and not layer.doSkipInitialLock()):
+        feed = feeds['lock']
+
+    if (not layer.doSkipInitialLock()):
+        run, units = axisZ.advance(layer.getLockAngle())
+        if (machine.outOfBounds(axisX.value(), units / toolpath.SCALE)):
+            return None
+        axisZ.commit(run, units)
+
+    if (numPatterns > 0):
+        runX, runZ = helicalRuns(layer, geometry)
+        refX, refZ, startX = patternStarts(axisX, axisZ, runX, runZ, numPatterns)
+
+        # Rounding is monotonic, so every pattern's extremes come from the extremes of the running sums
+        if (np.any(np.rint(refX + runX.min()) < 0) or np.any(np.rint(refX + runX.max()) / toolpath.SCALE > machine.xLimit)):
+            return None
+
+        # Only the last pattern's renormalizing is left in the state
+        moveZ = np.rint(refZ[-1] + runZ).astype(np.int64)[None, :]
+        shift, _ = circuitShifts(moveZ, numStarts, machine.renormalizeLimit)
+        axisZ.shift = int(shift[-1, -1])
+        axisZ.units = int(moveZ[-1, -1] - shift[-1, -1])
 
-    
+    return (axisX.state(), axisZ.state(), feed)
@@ -0,0 +1,198 @@
+# Plots of a toolpath on the mandrel
+# Two views: the unrolled mandrel surface (X along the mandrel against the mandrel angle, Z mod 360)
+# and the path wound on the cylinder in 3D, colored by layer or by pattern.
+# Angles come from the actual machine position, so the shift of each pattern after its G92 reset shows up.
+
+# Big jobs have hundreds of thousands of moves, far more than can be drawn interactively, so the plot is
+# reduced to a level of detail first: only every k-th circuit is drawn, with k chosen so that at most
+# maxSegments line segments reach matplotlib. Helical paths repeat circuit after circuit, so this keeps the
+# picture while drawing a fraction of it. The title says how much was left out.
+
+# Usage:
+#   figure = plotter.plotToolpath(machine.getToolpath(), machine.getConfig(), colorBy='pattern')
+#   plotter.show()
+
+import math
+
+import numpy as np
+
+import config
+import toolpath
+from toolpath import Toolpath
+
+
+# Most line segments handed to matplotlib per view
+MAX_SEGMENTS = 10000
+
+# Moves are drawn on the cylinder as curves with a point at least every this many degrees
+HELIX_STEP = 10.0
+
+
+# Every move that goes somewhere, in machine coordinates
+# Returns a dict of arrays: x0, z0, x1, z1 (start and end, Z in degrees), layer, pattern, group
+# group numbers the circuits (or patterns, or layers, whichever the toolpath marks) the moves belong to
+def moveSegments(path: Toolpath):
+    cols = path.arrays()
+    machineX, machineZ = path.machinePositions()
+
+    rows = np.flatnonzero(cols['op'] == toolpath.MOVE)
+    rows = rows[rows > 0]
+    x0, z0 = machineX[rows - 1], machineZ[rows - 1]
+    x1, z1 = machineX[rows], machineZ[rows]
+    moving = (x0 != x1) | (z0 != z1)
+    rows = rows[moving]
+
+    layers, patterns, circuits = path.locate(rows)
+
+    # Number of marks up to each move, which changes from one circuit to the next
+    marks = path.marks()
+    group = np.searchsorted(marks['row'], rows, side='right')
+
+    return {'x0': x0[moving], 'z0': z0[moving], 'x1': x1[moving], 'z1': z1[moving],
+            'layer': layers, 'pattern': patterns, 'group': group}
+
+
+# Picks every k-th group of segments so that the total cost (segments drawn per move) stays under maxSegments
+# Returns the mask of moves to draw and k
+def levelOfDetail(group, cost, maxSegments=MAX_SEGMENTS):
+    total = float(np.sum(cost))
+    if total <= maxSegments:
+        return np.ones(group.size, dtype=bool), 1
+
+    stride = math.ceil(total / maxSegments)
+    _, index = np.unique(group, return_inverse=True)
+    keep = index % stride == 0
+
+    # A few huge groups: thin out the moves within them too
+    kept = float(np.sum(cost[keep]))
+    if kept > maxSegments:
+        keep &= np.cumsum(keep) % math.ceil(kept / maxSegments) == 0
+    return keep, stride
+
+
+# Splits moves where they cross a multiple of 360 degrees, so they can be drawn on the unrolled surface
+# Returns the pieces as (x0, a0, x1, a1) with angles in [0, 360], and the move each piece comes from
+def unroll(x0, z0, x1, z1):
+    # Draw every move from its lower to its higher angle
+    flip = z1 < z0
+    x0, x1 = np.where(flip, x1, x0), np.where(flip, x0, x1)
+    z0, z1 = np.where(flip, z1, z0), np.where(flip, z0, z1)
+
+    turn0 = np.floor(z0 / 360)
+    turn1 = np.maximum(np.ceil(z1 / 360) - 1, turn0)
+    pieces = (turn1 - turn0 + 1).astype(np.int64)
+
+    move = np.repeat(np.arange(x0.size), pieces)
+    turn = turn0[move] + np.arange(move.size) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    start = np.maximum(z0[move], turn * 360)
+    end = np.minimum(z1[move], (turn + 1) * 360)
+
+    span = z1 - z0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(span > 0, (x1 - x0) / span, 0.0)
+    xStart = x0[move] + (start - z0[move]) * slope[move]
+    xEnd = np.where(span[move] > 0, x0[move] + (end - z0[move]) * slope[move], x1[move])
+    return (xStart, start - turn * 360, xEnd, end - turn * 360), move
+
+
+# Samples moves as curves on a cylinder of the given radius, lying along the X axis
+# Returns one (n, 3) polyline per move
+def helix(x0, z0, x1, z1, radius, step=HELIX_STEP):
+    pieces = helixPieces(z0, z1, step)
+    points = pieces + 1
+    move = np.repeat(np.arange(x0.size), points)
+    t = (np.arange(move.size) - np.repeat(np.cumsum(points) - points, points)) / pieces[move]
+
+    x = x0[move] + (x1[move] - x0[move]) * t
+    angle = np.radians(z0[move] + (z1[move] - z0[move]) * t)
+    coordinates = np.stack((x, radius * np.cos(angle), radius * np.sin(angle)), axis=1)
+    return np.split(coordinates, np.cumsum(points)[:-1])
+
+
+def helixPieces(z0, z1, step=HELIX_STEP):
+    return np.maximum(np.ceil(np.abs(z1 - z0) / step), 1).astype(np.int64)
+
+
+# Colors of the selected moves by layer or pattern number
+def segmentColors(segments, colorBy, keep):
+    import matplotlib
+
+    if colorBy == 'pattern':
+        colormap = matplotlib.colormaps['tab20']
+        return colormap(np.maximum(segments['pattern'][keep], 0) % 20)
+    colormap = matplotlib.colormaps['tab10']
+    return colormap(np.maximum(segments['layer'][keep], 0) % 10)
+
+
+# Draws the unrolled mandrel surface: X against the mandrel angle
+def plotUnrolled(ax, segments, colorBy='layer', maxSegments=MAX_SEGMENTS):
+    from matplotlib.collections import LineCollection
+
+    # Count the pieces each move is split into, to pick the level of detail before splitting anything
+    lower = np.minimum(segments['z0'], segments['z1'])
+    upper = np.maximum(segments['z0'], segments['z1'])
+    cost = np.maximum(np.ceil(upper / 360) - np.floor(lower / 360), 1)
+    keep, stride = levelOfDetail(segments['group'], cost, maxSegments)
+
+    (xStart, aStart, xEnd, aEnd), move = unroll(segments['x0'][keep], segments['z0'][keep],
+                                                segments['x1'][keep], segments['z1'][keep])
+    lines = np.stack((np.stack((xStart, aStart), axis=1), np.stack((xEnd, aEnd), axis=1)), axis=1)
+    colors = segmentColors(segments, colorBy, keep)[move]
+
+    ax.add_collection(LineCollection(lines, colors=colors, linewidths=0.6))
+    ax.set_xlim(min(0.0, float(np.min(xStart, initial=0.0))), float(np.max(xEnd, initial=1.0)))
+    ax.set_ylim(0, 360)
+    ax.set_xlabel("X [in]")
+    ax.set_ylabel("Mandrel angle [deg]")
+    ax.set_title("Unrolled surface" + detailNote(stride))
+    return stride
+
+
+# Draws the path wound on the mandrel in 3D
+def plotCylinder(ax, segments, radius, colorBy='layer', maxSegments=MAX_SEGMENTS):
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+    cost = helixPieces(segments['z0'], segments['z1'])
+    keep, stride = levelOfDetail(segments['group'], cost, maxSegments)
+
+    lines = helix(segments['x0'][keep], segments['z0'][keep],
+                  segments['x1'][keep], segments['z1'][keep], radius)
+    colors = segmentColors(segments, colorBy, keep)
+
+    ax.add_collection3d(Line3DCollection(lines, colors=colors, linewidths=0.6))
+    low = min(0.0, float(np.min(segments['x0'], initial=0.0)), float(np.min(segments['x1'], initial=0.0)))
+    high = max(1.0, float(np.max(segments['x0'], initial=0.0)), float(np.max(segments['x1'], initial=0.0)))
+    ax.set_xlim(low, high)
+    ax.set_ylim(-radius, radius)
+    ax.set_zlim(-radius, radius)
+    ax.set_box_aspect((high - low, 2 * radius, 2 * radius))
+    ax.set_xlabel("X [in]")
+    ax.set_yticks([])
+    ax.set_zticks([])
+    ax.set_title("On the mandrel" + detailNote(stride))
+    return stride
+
+
+def detailNote(stride):
+    return "" if stride == 1 else f" (1 in {stride} circuits shown)"
+
+
+# Figure with both views of a toolpath
+def plotToolpath(path: Toolpath, machineConfig=config.DEFAULT_CONFIG, colorBy='layer', maxSegments=MAX_SEGMENTS, figure=None):
+    if figure is None:
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=(12, 5))
+
+    machineConfig = config.getConfig(machineConfig)
+    segments = moveSegments(path)
+
+    figure.clear()
+    plotUnrolled(figure.add_subplot(1, 2, 1), segments, colorBy, maxSegments)
+    plotCylinder(figure.add_subplot(1, 2, 2, projection='3d'), segments, machineConfig.mandrelDiameter / 2, colorBy, maxSegments)
+    figure.suptitle(f"{segments['x0'].size} moves, colored by {colorBy}")
+    return figure
+
+
+def show():
+    import matplotlib.pyplot as plt
+    plt.show()
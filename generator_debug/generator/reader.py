@@ -0,0 +1,378 @@
+# Reads gcode programs back into a Toolpath
+# Loaded programs end up in the same compact arrays the planner fills, so they can be estimated, plotted,
+# optimized or streamed again just like freshly generated ones.
+# The file is read and parsed in fixed size chunks, so memory only grows with the toolpath itself
+# (a few bytes per row) and never holds the whole text of the program.
+
+# Understands the dialect the winder writes: G20, G28, G92 X Z, G01 X Z, G01 F and comments.
+# G0/G1 are read as moves too; anything else is kept as a raw command and written back out unchanged.
+# The "Pattern: i/n Circuit: j/m" comments of helical layers and the "Hoop pass: j/n" comments of hoop layers
+# (read as pattern 0, circuit j) are turned back into toolpath marks. A new layer is assumed wherever pattern 0
+# circuit 0 starts, so the lock moves at the start of a layer count towards the one before.
+
+# Plain "G01 X.. Z.." and "G92 X.. Z.." lines, which are nearly all of a program, are parsed with numpy straight
+# from the bytes of each chunk; only the few other lines (comments, feed rates...) go through Python one by one.
+
+# Usage:
+#   path = reader.readGcode('windGcode.nc')
+#   report = estimator.estimate(path)
+
+import re
+from array import array
+
+import toolpath
+from toolpath import Toolpath
+
+
+# Bytes read from the file at a time
+CHUNK_SIZE = 1 << 22
+
+# Lines the fast path reads are shorter than this, and their numbers have at most this many digits
+MAX_LINE = 1 << 20
+MAX_DIGITS = 15
+
+# Matches every line, capturing the pattern and circuit numbers of the ones that are pattern comments, or the
+# pass number of the ones that are hoop pass comments
+PATTERN_COMMENT = re.compile(r'^(?:Pattern: (\d+)/\d+ Circuit: (\d+)/\d+$|Hoop pass: (\d+)/\d+$)?.*$', re.MULTILINE)
+
+
+# Weight of each byte in the running sum that counts, per line, characters that are not part of a number
+# (bits 0-20), Z's (bits 21-41) and opening parentheses (bits 42 and up)
+def characterWeights():
+    weights = array('q', [1]) * 256
+    for char in b'0123456789.-+':
+        weights[char] = 0
+    weights[ord('Z')] += 1 << 21
+    weights[ord('(')] += 1 << 42
+    return weights
+
+
+COUNT_MASK = (1 << 21) - 1
+
+
+class GcodeError(ValueError):
+    pass
+
+
+# Reads a gcode file into a Toolpath
+def readGcode(path, chunkSize=CHUNK_SIZE) -> Toolpath:
+    reader = GcodeReader()
+    for block in iterBlocks(path, chunkSize):
+        reader.parse(block)
+    return reader.toolpath
+
+
+# Yields the file in blocks of complete lines (bytes, without the final newline), ready for GcodeReader.parse
+def iterBlocks(path, chunkSize=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        rest = b''
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            end = chunk.rfind(b'\n')
+            if end < 0:
+                rest = chunk
+                continue
+            rest = chunk[end + 1:]
+            yield chunk[:end]
+        if rest:
+            yield rest
+
+
+# Reads gcode that is already in memory (a list of lines or one string) into a Toolpath
+def parseGcode(lines) -> Toolpath:
+    if not isinstance(lines, str):
+        lines = '\n'.join(lines)
+    reader = GcodeReader()
+    reader.parse(lines.encode('ascii', errors='replace'))
+    return reader.toolpath
+
+
+class GcodeReader():
+
+    # lineNumbers: also keep the line (1-based) every row came from, in rowLines
+    def __init__(self, lineNumbers=False):
+        self.toolpath = Toolpath()
+        self.lineNumber = 0
+        self.rowLines = array('q') if lineNumbers else None
+
+        # Modal state carried from one chunk to the next
+        self.x = 0.0
+        self.z = 0.0
+        self.feed = 0.0
+        self.layer = -1
+
+
+    # Parses a block of complete lines (bytes, without the final newline) and appends them to the toolpath
+    def parse(self, data):
+        import numpy as np
+
+        if not data:
+            self.lineNumber += 1
+            return
+
+        buf = np.frombuffer(data, dtype=np.uint8)
+        newlines = np.flatnonzero(buf == ord('\n'))
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [buf.size]))
+        ends = ends - ((ends > starts) & (buf[np.maximum(ends - 1, 0)] == ord('\r')))
+        lengths = ends - starts
+        numLines = starts.size
+
+        # Characters per line that are not part of a number, Z's and opening parentheses, all from one running sum
+        weights = np.frombuffer(characterWeights(), dtype=np.int64)
+        counts = np.concatenate(([0], np.cumsum(weights[buf])))
+        counts = counts[ends] - counts[starts]
+        others = counts & COUNT_MASK
+        zCount = (counts >> 21) & COUNT_MASK
+        parentheses = counts >> 42
+
+        first = buf[np.minimum(starts, buf.size - 1)]
+        last = buf[np.maximum(ends - 1, 0)]
+        comment = (lengths >= 2) & (lengths < MAX_LINE) & (first == ord('(')) & (last == ord(')')) & (parentheses == 1)
+        simple, isSet, values = parseSimple(buf, starts, ends, others, zCount)
+        blank = lengths == 0
+        slowLines = np.flatnonzero(~(simple | comment | blank))
+
+        # Everything else, one line at a time: [(op, x, z, feed, text), ...] per line
+        slowRows = [parseLine(data[s:e].decode('ascii', errors='replace'), self.lineNumber + line + 1)
+                    for line, s, e in zip(slowLines.tolist(), starts[slowLines].tolist(), ends[slowLines].tolist())]
+
+        # Where the rows of each line go
+        rowCounts = np.ones(numLines, dtype=np.int64)
+        rowCounts[blank] = 0
+        rowCounts[slowLines] = [len(rows) for rows in slowRows]
+        offsets = np.cumsum(rowCounts) - rowCounts
+        numRows = int(offsets[-1] + rowCounts[-1])
+
+        nan = float('nan')
+        ops = np.empty(numRows, dtype=np.uint8)
+        xs = np.full(numRows, nan)
+        zs = np.full(numRows, nan)
+        feeds = np.full(numRows, nan)
+
+        simpleRows = offsets[simple]
+        ops[simpleRows] = np.where(isSet, toolpath.SET, toolpath.MOVE)
+        xs[simpleRows] = values[:, 0]
+        zs[simpleRows] = values[:, 1]
+
+        commentRows = offsets[comment]
+        ops[commentRows] = toolpath.COMMENT
+        comments = [data[s + 1:e - 1].decode('ascii', errors='replace')
+                    for s, e in zip(starts[comment].tolist(), ends[comment].tolist())]
+        textRows = commentRows.tolist()
+        texts = list(comments)
+
+        flatRows = []
+        flatValues = []
+        for row, rows in zip(offsets[slowLines].tolist(), slowRows):
+            for op, x, z, f, text in rows:
+                flatRows.append(row)
+                flatValues.append((op, x, z, f))
+                if text is not None:
+                    textRows.append(row)
+                    texts.append(text)
+                row += 1
+        if flatRows:
+            flatValues = np.array(flatValues, dtype=np.float64)
+            ops[flatRows] = flatValues[:, 0]
+            xs[flatRows] = flatValues[:, 1]
+            zs[flatRows] = flatValues[:, 2]
+            feeds[flatRows] = flatValues[:, 3]
+            texts = [texts[i] for i in np.argsort(textRows, kind='stable').tolist()]
+
+        # Rows that do not set an axis or the feed rate carry the last value forward
+        xs = forwardFill(xs, self.x)
+        zs = forwardFill(zs, self.z)
+        feeds = forwardFill(feeds, self.feed)
+
+        self.addMarks(commentRows, comments, ops)
+        if self.rowLines is not None:
+            self.rowLines.frombytes((np.repeat(np.arange(numLines), rowCounts) + self.lineNumber + 1).astype(np.int64).tobytes())
+        if numRows:
+            self.toolpath.appendRows(ops, xs, zs, feeds, texts)
+            self.x, self.z, self.feed = float(xs[-1]), float(zs[-1]), float(feeds[-1])
+        self.lineNumber += numLines
+
+
+    # Turns the "Pattern: i/n Circuit: j/m" and "Hoop pass: j/n" comments of a chunk into marks
+    # A pattern starts at the G92 just before its first circuit, a layer where pattern 0 starts
+    def addMarks(self, commentRows, comments, ops):
+        import numpy as np
+
+        # One (pattern, circuit, hoop pass) per comment, empty for other comments
+        found = np.array(PATTERN_COMMENT.findall('\n'.join(comments)), dtype=str).reshape(-1, 3)
+        isHoop = found[:, 2] != ''
+        isPattern = (found[:, 0] != '') | isHoop
+        if not isPattern.any():
+            return
+        rows = commentRows[isPattern]
+        patterns = np.where(isHoop, '0', found[:, 0])[isPattern].astype(np.int32)
+        circuits = np.where(isHoop, found[:, 2], found[:, 1])[isPattern].astype(np.int32)
+
+        previousOp = np.where(rows > 0, ops[np.maximum(rows - 1, 0)],
+                              self.toolpath.op[-1] if len(self.toolpath) else toolpath.RAW)
+        patternStart = circuits == 0
+        layerStart = patternStart & (patterns == 0)
+        starts = np.where(previousOp == toolpath.SET, rows - 1, rows)
+        layers = self.layer + np.cumsum(layerStart, dtype=np.int32)
+        self.layer = int(layers[-1])
+
+        count = int(layerStart.sum())
+        markRows = np.concatenate((starts[layerStart], starts[patternStart], rows))
+        kinds = np.concatenate((np.full(count, toolpath.LAYER), np.full(int(patternStart.sum()), toolpath.PATTERN),
+                                np.full(rows.size, toolpath.CIRCUIT)))
+        markLayers = np.concatenate((layers[layerStart], layers[patternStart], layers))
+        markPatterns = np.concatenate((np.full(count, -1), patterns[patternStart], patterns))
+        markCircuits = np.concatenate((np.full(count + int(patternStart.sum()), -1), circuits))
+
+        order = np.lexsort((kinds, markRows))
+        self.toolpath.appendMarks(markRows[order], kinds[order], markLayers[order], markPatterns[order], markCircuits[order])
+
+
+# Finds the lines that are exactly "G01 X<number> Z<number>" or "G92 X<number> Z<number>" and reads their numbers
+# Returns which lines those are, which of them are G92, and their (X, Z) values
+def parseSimple(buf, starts, ends, others, zCount):
+    import numpy as np
+
+    lengths = ends - starts
+
+    # "G01 X" / "G92 X" prefix, and nothing but numbers apart from G, X, " Z" and the two spaces
+    prefix = buf[np.minimum(starts[:, None] + np.arange(5), buf.size - 1)]
+    prefix = np.where(lengths[:, None] >= 5, prefix, 0)
+    isMove = (prefix == np.frombuffer(b'G01 X', dtype=np.uint8)).all(axis=1)
+    isSet = (prefix == np.frombuffer(b'G92 X', dtype=np.uint8)).all(axis=1)
+    simple = (isMove | isSet) & (others == 5) & (zCount == 1) & (lengths < MAX_LINE)
+
+    zPositions = np.flatnonzero(buf == ord('Z'))
+    zAt = np.full(starts.size, -1, dtype=np.int64)
+    zAt[np.searchsorted(starts, zPositions, side='right') - 1] = zPositions
+    zAt = np.where(simple, zAt, starts + 6)
+
+    # X number between the prefix and " Z", Z number after the Z
+    xStart = starts + 5
+    xEnd = zAt - 1
+    zStart = zAt + 1
+    simple &= (xEnd > xStart) & (ends > zStart) & (buf[np.clip(xEnd, 0, buf.size - 1)] == ord(' '))
+
+    spanStart = np.stack((xStart[simple], zStart[simple]), axis=1).ravel()
+    spanLength = np.stack((xEnd[simple] - xStart[simple], ends[simple] - zStart[simple]), axis=1).ravel()
+    values = readNumbers(buf, spanStart, spanLength)
+    if values is None:
+        # Something like "1.2.3" slipped through, leave those lines to the slow path
+        simple[:] = False
+        values = np.zeros(0)
+    return simple, isSet[simple], values.reshape(-1, 2)
+
+
+# Reads the decimal numbers at the given byte spans of buf (made of digits . - + only)
+# Returns None if one of them is not a valid number
+def readNumbers(buf, spanStart, spanLength):
+    import numpy as np
+
+    if spanStart.size == 0:
+        return np.zeros(0)
+
+    # Digits are collected into an integer and divided by a power of ten once, which rounds exactly like float()
+    # Numbers are short, so this goes column by column over all of them at once
+    mantissa = np.zeros(spanStart.size, dtype=np.int64)
+    digits = np.zeros(spanStart.size, dtype=np.int64)
+    decimals = np.zeros(spanStart.size, dtype=np.int64)
+    dots = np.zeros(spanStart.size, dtype=np.int64)
+    misplacedSigns = np.zeros(spanStart.size, dtype=bool)
+    last = buf.size - 1
+    for column in range(int(spanLength.max())):
+        inside = column < spanLength
+        char = buf[np.minimum(spanStart + column, last)]
+        digit = char - np.uint8(ord('0'))
+        isDigit = inside & (digit < 10)
+        mantissa = np.where(isDigit, mantissa * 10 + digit, mantissa)
+        digits += isDigit
+        decimals += isDigit & (dots > 0)
+        isDot = inside & (char == ord('.'))
+        dots += isDot
+        # Anything else is a sign, which may only come first
+        if column:
+            misplacedSigns |= inside & ~isDigit & ~isDot
+
+    if ((dots > 1) | misplacedSigns | (digits == 0) | (digits > MAX_DIGITS)).any():
+        return None
+    return np.where(buf[spanStart] == ord('-'), -1.0, 1.0) * mantissa / 10.0 ** decimals
+
+
+# Replaces NaNs with the last value before them (or start)
+def forwardFill(values, start):
+    import numpy as np
+
+    if values.size == 0:
+        return values
+    index = np.where(np.isnan(values), -1, np.arange(values.size))
+    index = np.maximum.accumulate(index)
+    return np.where(index >= 0, values[np.maximum(index, 0)], start)
+
+
+# Parses one line that is not a plain move, returns its rows as (op, x, z, feed, text)
+# x, z and feed are NaN where the line leaves them unchanged
+def parseLine(line, lineNumber):
+    nan = float('nan')
+    line = line.strip()
+    if not line:
+        return []
+
+    if line[0] == '(' and line[-1] == ')' and line.count('(') == 1:
+        return [(toolpath.COMMENT, nan, nan, nan, line[1:-1])]
+
+    gcodes, words = parseWords(line, lineNumber)
+    x = words.get('X', nan)
+    z = words.get('Z', nan)
+
+    rows = []
+    if 20 in gcodes:
+        rows.append((toolpath.UNITS, nan, nan, nan, None))
+    if 'F' in words:
+        rows.append((toolpath.FEED, nan, nan, words['F'], None))
+    if 28 in gcodes:
+        rows.append((toolpath.HOME, nan, nan, nan, None))
+    elif 92 in gcodes:
+        rows.append((toolpath.SET, x, z, nan, None))
+    elif ('X' in words or 'Z' in words) and (not gcodes or gcodes[-1] in (0, 1)):
+        rows.append((toolpath.MOVE, x, z, nan, None))
+
+    # Lines that mean anything else are kept as they are
+    known = set(gcodes) <= {0, 1, 20, 28, 92} and set(words) <= {'X', 'Z', 'F'}
+    if not rows or not known:
+        rows = [(toolpath.RAW, nan, nan, nan, line)]
+    return rows
+
+
+# Splits a line into its G numbers and other words, e.g. "G01 X1.5 Z-3" -> ([1.0], {'X': 1.5, 'Z': -3.0})
+def parseWords(line, lineNumber):
+    # Strip comments
+    while '(' in line:
+        start = line.index('(')
+        end = line.find(')', start)
+        if end < 0:
+            raise GcodeError(f"Line {lineNumber}: unclosed comment")
+        line = line[:start] + line[end + 1:]
+    line = line.split(';')[0].replace(' ', '').upper()
+
+    gcodes = []
+    words = {}
+    i = 0
+    while i < len(line):
+        letter = line[i]
+        j = i + 1
+        while j < len(line) and (line[j].isdigit() or line[j] in '.-+'):
+            j += 1
+        try:
+            value = float(line[i + 1:j])
+        except ValueError:
+            raise GcodeError(f"Line {lineNumber}: cannot read {line[i:j]!r}") from None
+        if letter == 'G':
+            gcodes.append(value)
+        else:
+            words[letter] = value
+        i = j
+    return gcodes, words
@@ -0,0 +1,290 @@
+# Streams gcode to a GRBL controller
+# Uses GRBL's character-counting flow control: lines are sent as long as the characters GRBL has not yet
+# acknowledged fit in its 128 byte RX buffer, instead of waiting for an 'ok' after every line. This keeps the
+# controller's planner buffer full on short moves.
+
+# Usage:
+#   port = sender.openSerial('/dev/ttyUSB0')             # or grblsim.GrblSimulator() without hardware
+#   grbl = sender.GrblSender(port, onProgress=print)
+#   grbl.stream(machine.getToolpath())                   # a Toolpath, a Winder, a list of lines or any iterable
+# or stream while planning:
+#   planner.planWindTo(schedule, 30, sender.SenderSink(grbl))
+# or from the command line:
+#   python sender.py windGcode.nc --port /dev/ttyUSB0
+#   python sender.py windGcode.nc --simulate
+
+import argparse
+import sys
+import threading
+import time
+from collections import deque
+
+import toolpath
+import winder
+
+
+RX_BUFFER_SIZE = 128
+
+
+class GrblError(RuntimeError):
+    pass
+
+
+class GrblSender():
+
+    # port: anything with write(bytes) and readline() -> bytes, like a pyserial Serial
+    # onProgress: called with a stats dict every progressInterval seconds
+    # pingPong: send-and-wait-for-ok instead of character counting (for comparison)
+    def __init__(self, port, rxBufferSize=RX_BUFFER_SIZE, onProgress=None, progressInterval=0.5,
+                 pingPong=False, stopOnError=True):
+        self.port = port
+        self.rxBufferSize = rxBufferSize
+        self.onProgress = onProgress
+        self.progressInterval = progressInterval
+        self.pingPong = pingPong
+        self.stopOnError = stopOnError
+
+        # Lengths of the lines GRBL has not acknowledged yet
+        self.pending = deque()
+        self.pendingBytes = 0
+
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.stopped = False
+
+        self.linesSent = 0
+        self.bytesSent = 0
+        self.linesAcked = 0
+        self.errors = []
+        self.messages = []
+        self.maxPendingBytes = 0
+        self.startTime = None
+        self.lastProgress = 0.0
+
+
+    # ---------------- controls ----------------
+    # Feed hold: GRBL decelerates to a stop, and no more lines are sent until resume()
+    def pause(self):
+        self.resumed.clear()
+        self.port.write(b'!')
+
+
+    def resume(self):
+        self.port.write(b'~')
+        self.resumed.set()
+
+
+    # Stops sending after the current line; stream() returns once GRBL has answered what was already sent
+    def stop(self):
+        self.stopped = True
+        self.resumed.set()
+
+
+    def isPaused(self) -> bool:
+        return not self.resumed.is_set()
+
+
+    # ---------------- sending ----------------
+    # Sends one line, waiting for room in GRBL's RX buffer first
+    def sendLine(self, line):
+        line = cleanLine(line)
+        if not line or self.stopped:
+            return
+
+        if self.startTime is None:
+            self.startTime = time.monotonic()
+
+        data = (line + '\n').encode()
+        if len(data) >= self.rxBufferSize:
+            raise GrblError(f"Line longer than the RX buffer: {line}")
+
+        # Like GRBL's own stream.py, one byte of the buffer is kept free
+        limit = 1 if self.pingPong else self.rxBufferSize
+        while self.pending and (self.pendingBytes + len(data) >= self.rxBufferSize or len(self.pending) >= limit):
+            self.readResponse()
+
+        while not self.resumed.is_set():
+            self.resumed.wait(0.1)
+        if self.stopped:
+            return
+
+        self.port.write(data)
+        self.pending.append(len(data))
+        self.pendingBytes += len(data)
+        self.maxPendingBytes = max(self.maxPendingBytes, self.pendingBytes)
+        self.linesSent += 1
+        self.bytesSent += len(data)
+        self.reportProgress()
+
+
+    def sendLines(self, lines):
+        for line in lines:
+            self.sendLine(line)
+
+
+    # Waits until GRBL has acknowledged every line sent so far
+    def drain(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if deadline is not None and time.monotonic() > deadline:
+                raise GrblError("Timed out waiting for GRBL to acknowledge")
+            self.readResponse()
+        self.reportProgress(force=True)
+
+
+    # Streams a whole program and returns the final stats
+    def stream(self, source):
+        self.sendLines(iterLines(source))
+        self.drain()
+        return self.stats()
+
+
+    def readResponse(self):
+        response = self.port.readline()
+        if not response:
+            return
+        response = response.decode(errors='replace').strip()
+
+        if response.startswith('ok') or response.startswith('error'):
+            length = self.pending.popleft()
+            self.pendingBytes -= length
+            self.linesAcked += 1
+            if response.startswith('error'):
+                self.errors.append((self.linesAcked, response))
+                if self.stopOnError:
+                    self.stopped = True
+        elif response.startswith('ALARM'):
+            self.errors.append((self.linesAcked, response))
+            self.stopped = True
+            raise GrblError(f"GRBL alarm: {response}")
+        elif response:
+            self.messages.append(response)
+
+
+    # ---------------- reporting ----------------
+    def stats(self):
+        elapsed = time.monotonic() - self.startTime if self.startTime is not None else 0.0
+        return {'linesSent': self.linesSent,
+                'linesAcked': self.linesAcked,
+                'bytesSent': self.bytesSent,
+                'queuedLines': len(self.pending),
+                'queuedBytes': self.pendingBytes,
+                'maxQueuedBytes': self.maxPendingBytes,
+                'seconds': elapsed,
+                'linesPerSecond': self.linesAcked / elapsed if elapsed > 0 else 0.0,
+                'bytesPerSecond': self.bytesSent / elapsed if elapsed > 0 else 0.0,
+                'paused': self.isPaused(),
+                'errors': list(self.errors)}
+
+
+    def reportProgress(self, force=False):
+        if self.onProgress is None:
+            return
+        now = time.monotonic()
+        if force or now - self.lastProgress >= self.progressInterval:
+            self.lastProgress = now
+            self.onProgress(self.stats())
+
+
+# Sink (see sinks.py) that sends commands to GRBL as the planner generates them
+class SenderSink():
+
+    def __init__(self, grblSender: GrblSender):
+        self.sender = grblSender
+
+    def push(self, line):
+        self.sender.sendLine(line)
+
+    def pushLines(self, lines):
+        self.sender.sendLines(lines)
+
+    def close(self):
+        self.sender.drain()
+
+    def result(self):
+        return self.sender.stats()
+
+
+# Strips comments and whitespace; GRBL ignores comments but they would still take up buffer space
+def cleanLine(line):
+    if '(' in line:
+        out = []
+        depth = 0
+        for char in line:
+            if char == '(':
+                depth += 1
+            elif char == ')' and depth:
+                depth -= 1
+            elif not depth:
+                out.append(char)
+        line = ''.join(out)
+    return line.split(';')[0].strip()
+
+
+# Lines of gcode from a Toolpath, a Winder, a file path or any iterable of lines
+def iterLines(source):
+    if isinstance(source, winder.Winder):
+        source = source.getToolpath()
+    if isinstance(source, toolpath.Toolpath):
+        for lines in source.iterChunks():
+            yield from lines
+    elif isinstance(source, str):
+        with open(source) as f:
+            for line in f:
+                yield line.rstrip('\n')
+    else:
+        yield from source
+
+
+# Opens a serial port to GRBL (needs pyserial) and waits for it to start up
+def openSerial(portName, baudRate=115200, timeout=1.0):
+    import serial
+
+    port = serial.Serial(portName, baudRate, timeout=timeout)
+    port.write(b"\r\n\r\n")
+    time.sleep(2)
+    port.reset_input_buffer()
+    return port
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a gcode file to GRBL")
+    parser.add_argument('file', help="gcode file to send")
+    parser.add_argument('--port', default=None, help="serial port of the controller")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--simulate', action='store_true', help="send to the built-in GRBL simulator instead")
+    parser.add_argument('--time-scale', type=float, default=0.0, help="simulator: fraction of real move time to take")
+    parser.add_argument('--ping-pong', action='store_true', help="wait for 'ok' after every line")
+    args = parser.parse_args(argv)
+
+    if args.simulate:
+        import grblsim
+        port = grblsim.GrblSimulator(timeScale=args.time_scale)
+    elif args.port:
+        port = openSerial(args.port, args.baud)
+    else:
+        parser.error("either --port or --simulate is required")
+
+    def progress(stats):
+        print(f"\r{stats['linesAcked']} lines | {stats['linesPerSecond']:.0f} lines/s | "
+              f"{stats['bytesPerSecond']:.0f} B/s | queue {stats['queuedLines']} lines / {stats['queuedBytes']} B",
+              end='', flush=True)
+
+    grbl = GrblSender(port, onProgress=progress, pingPong=args.ping_pong)
+    try:
+        stats = grbl.stream(args.file)
+    except KeyboardInterrupt:
+        grbl.stop()
+        stats = grbl.stats()
+    finally:
+        print()
+        port.close()
+
+    for line, error in stats['errors']:
+        print(f"Line {line}: {error}")
+    print(f"Sent {stats['linesSent']} lines in {stats['seconds']:.2f} s")
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
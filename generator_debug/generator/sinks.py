@@ -0,0 +1,124 @@
+# Destinations for generated gcode
+# The winder pushes each command into a sink as soon as it is generated, so a job does not have to
+# sit in memory as one big list before it reaches the disk.
+
+# Every sink provides:
+#   - push(line): accept a single gcode command (no trailing newline)
+#   - pushLines(lines): accept an iterable of commands
+#   - close(): flush anything still buffered
+#   - result(): whatever the sink produced (a list, a path, counts...)
+
+
+# Keeps every command in memory, the original behaviour of the winder
+class ListSink():
+
+    def __init__(self):
+        self.lines = []
+
+    def push(self, line):
+        self.lines.append(line)
+
+    def pushLines(self, lines):
+        self.lines.extend(lines)
+
+    def close(self):
+        pass
+
+    def result(self):
+        return self.lines
+
+
+# Writes commands straight to a file through a buffered writer
+# Accepts either a path or an already opened text file
+class FileSink():
+
+    def __init__(self, file, bufferSize=1 << 16):
+        if isinstance(file, str):
+            self.path = file
+            self.file = open(file, 'w', buffering=bufferSize)
+            self.ownsFile = True
+        else:
+            self.path = getattr(file, 'name', None)
+            self.file = file
+            self.ownsFile = False
+
+        self.lineCount = 0
+
+    def push(self, line):
+        self.file.write(line + '\n')
+        self.lineCount += 1
+
+    def pushLines(self, lines):
+        lines = list(lines)
+        if lines:
+            self.file.write('\n'.join(lines) + '\n')
+            self.lineCount += len(lines)
+
+    def close(self):
+        if self.ownsFile:
+            if not self.file.closed:
+                self.file.close()
+        else:
+            self.file.flush()
+
+    def result(self):
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Only counts what would have been written, useful for dry runs and sizing a job
+class CountSink():
+
+    def __init__(self):
+        self.lineCount = 0
+        self.byteCount = 0
+
+    def push(self, line):
+        self.lineCount += 1
+        self.byteCount += len(line) + 1
+
+    def pushLines(self, lines):
+        for line in lines:
+            self.lineCount += 1
+            self.byteCount += len(line) + 1
+
+    def close(self):
+        pass
+
+    def result(self):
+        return {'lines': self.lineCount, 'bytes': self.byteCount}
+
+
+# Sends every command to several sinks at once (e.g. a file and a counter)
+class TeeSink():
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def push(self, line):
+        for sink in self.sinks:
+            sink.push(line)
+
+    def pushLines(self, lines):
+        lines = list(lines)
+        for sink in self.sinks:
+            sink.pushLines(lines)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def result(self):
+        return [sink.result() for sink in self.sinks]
+
+
+# Writes a list of commands to a file, one per line
+def writeGcode(lines, path):
+    with FileSink(path) as sink:
+        sink.pushLines(lines)
+    return path
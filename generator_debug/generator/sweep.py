@@ -0,0 +1,193 @@
+# Design-space sweep for the wind calculator
+# Computes circuits, valid start counts and pattern counts for whole grids of mandrel diameter,
+# tow width and wind angle at once, instead of one hand-typed calculator run per combination.
+
+# Usage:
+#   table = sweep.sweep(6.0, np.arange(0.25, 0.5, 0.025), np.arange(20, 60, 1))
+#   table.where('numPatterns', 10, 40).where('numStarts', 2, 2).toCsv('layups.csv')
+# or from the command line:
+#   python sweep.py --diameter 6 --tow 0.25:0.5:0.025 --angle 20:60:1 --out layups.csv
+
+import argparse
+import csv
+import math
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+import definitions
+
+
+# Number of circuits needed to cover the mandrel once (the planner's, see definitions.circuitGeometry)
+def numCircuits(mandrelDiameter, towWidth, windAngle) -> int:
+    return definitions.circuitGeometry(mandrelDiameter, towWidth, windAngle).numCircuits
+
+
+# Prime factorization by trial division, e.g. 60 -> {2: 2, 3: 1, 5: 1}
+@lru_cache(maxsize=None)
+def primeFactors(n):
+    factors = {}
+    while n % 2 == 0 and n > 1:
+        factors[2] = factors.get(2, 0) + 1
+        n //= 2
+    p = 3
+    while p * p <= n:
+        while n % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            n //= p
+        p += 2
+    if n > 1:
+        factors[n] = factors.get(n, 0) + 1
+    return factors
+
+
+# All divisors of n in increasing order, built from its prime factors
+# These are the valid numbers of start positions for a layer with n circuits
+@lru_cache(maxsize=None)
+def divisors(n):
+    if n < 1:
+        return ()
+    result = [1]
+    for p, k in primeFactors(n).items():
+        result = [d * p ** e for d in result for e in range(k + 1)]
+    return tuple(sorted(result))
+
+
+# Table of sweep results: one row per (diameter, tow width, wind angle, number of starts)
+# Every column is a numpy array of the same length
+class SweepTable():
+
+    COLUMNS = ('mandrelDiameter', 'towWidth', 'windAngle', 'mandrelCircumference', 'effectiveTowWidth',
+               'numCircuits', 'numStarts', 'numPatterns', 'passStepAngle', 'passAngle')
+
+    def __init__(self, columns):
+        self.columns = columns
+
+
+    def __len__(self):
+        return len(self.columns['numCircuits'])
+
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+
+    # Rows where mask is true
+    def filter(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        return SweepTable({name: values[mask] for name, values in self.columns.items()})
+
+
+    # Rows where low <= column <= high (either bound can be None)
+    def where(self, name, low=None, high=None):
+        values = self.columns[name]
+        mask = np.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return self.filter(mask)
+
+
+    # Rows sorted by one of the columns
+    def sortBy(self, name, descending=False):
+        order = np.argsort(self.columns[name], kind='stable')
+        if descending:
+            order = order[::-1]
+        return SweepTable({column: values[order] for column, values in self.columns.items()})
+
+
+    def rows(self):
+        names = [name for name in SweepTable.COLUMNS if name in self.columns]
+        for values in zip(*(self.columns[name].tolist() for name in names)):
+            yield dict(zip(names, values))
+
+
+    def toCsv(self, path):
+        names = [name for name in SweepTable.COLUMNS if name in self.columns]
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            writer.writerows(zip(*(self.columns[name].tolist() for name in names)))
+        return path
+
+
+# Sweeps every combination of the given diameters, tow widths and wind angles (scalars or arrays)
+# If windLength is given the pass angle of each combination is included as well
+def sweep(mandrelDiameters, towWidths, windAngles, windLength=None) -> SweepTable:
+    diameter, tow, angle = (grid.ravel() for grid in np.meshgrid(
+        np.atleast_1d(np.asarray(mandrelDiameters, dtype=np.float64)),
+        np.atleast_1d(np.asarray(towWidths, dtype=np.float64)),
+        np.atleast_1d(np.asarray(windAngles, dtype=np.float64)),
+        indexing='ij'))
+
+    circumference = np.pi * diameter
+    effectiveTowWidth = tow / np.cos(np.radians(angle))
+    circuits = np.ceil(circumference / effectiveTowWidth).astype(np.int64)
+
+    # Divisors only depend on the circuit count, so they are found once per distinct count
+    uniqueCircuits, inverse = np.unique(circuits, return_inverse=True)
+    divisorLists = [np.array(divisors(int(n)), dtype=np.int64) for n in uniqueCircuits]
+    counts = np.array([len(d) for d in divisorLists], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    allDivisors = np.concatenate(divisorLists) if divisorLists else np.zeros(0, dtype=np.int64)
+
+    # Expand every combination into one row per valid number of starts
+    rowCounts = counts[inverse]
+    source = np.repeat(np.arange(circuits.size), rowCounts)
+    position = np.arange(source.size) - np.repeat(np.cumsum(rowCounts) - rowCounts, rowCounts)
+    starts = allDivisors[offsets[inverse][source] + position]
+
+    columns = {'mandrelDiameter': diameter[source],
+               'towWidth': tow[source],
+               'windAngle': angle[source],
+               'mandrelCircumference': circumference[source],
+               'effectiveTowWidth': effectiveTowWidth[source],
+               'numCircuits': circuits[source],
+               'numStarts': starts,
+               'numPatterns': circuits[source] // starts,
+               'passStepAngle': 360 / circuits[source]}
+
+    if windLength is not None:
+        columns['passAngle'] = (windLength * np.tan(np.radians(angle[source]))) * (360 / circumference[source])
+
+    return SweepTable(columns)
+
+
+# Parses "start:stop:step" (stop included) or a single number
+def parseRange(text):
+    parts = [float(p) for p in text.split(':')]
+    if len(parts) == 1:
+        return np.array(parts)
+    if len(parts) != 3 or parts[2] <= 0:
+        raise argparse.ArgumentTypeError(f"expected start:stop:step, got {text!r}")
+    start, stop, step = parts
+    return start + step * np.arange(int(math.floor((stop - start) / step + 1e-9)) + 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep mandrel diameter, tow width and wind angle")
+    parser.add_argument('--diameter', type=parseRange, required=True, help="mandrel diameter, value or start:stop:step")
+    parser.add_argument('--tow', type=parseRange, required=True, help="tow width, value or start:stop:step")
+    parser.add_argument('--angle', type=parseRange, required=True, help="wind angle [deg], value or start:stop:step")
+    parser.add_argument('--length', type=float, default=None, help="wind length, to include pass angles")
+    parser.add_argument('--starts', type=int, default=None, help="only keep this number of starts")
+    parser.add_argument('--out', default=None, help="write the table to this CSV file")
+    args = parser.parse_args(argv)
+
+    table = sweep(args.diameter, args.tow, args.angle, args.length)
+    if args.starts is not None:
+        table = table.where('numStarts', args.starts, args.starts)
+
+    if args.out:
+        table.toCsv(args.out)
+        print(f"{len(table)} rows written to {args.out}")
+    else:
+        for row in table.rows():
+            print(row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
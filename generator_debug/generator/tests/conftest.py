@@ -0,0 +1,25 @@
+# Shared setup of the tests
+# The generator's modules import each other by name and its scripts are run from the generator directory,
+# so the tests put the generator directory on the path and run from it
+
+import os
+import sys
+
+import pytest
+
+GENERATOR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GENERATOR)
+
+import config
+
+
+@pytest.fixture(autouse=True)
+def generatorDirectory(monkeypatch):
+    monkeypatch.chdir(GENERATOR)
+
+
+# A machine with the given mandrel, not read from any file
+def machineConfig(mandrelDiameter=6.0, mandrelLength=54.0, xLimit=54.0):
+    return config.parseConfig({'mandrel_diameter': mandrelDiameter,
+                               'mandrel_length': mandrelLength,
+                               'x_limit': xLimit}, '<test>')
@@ -0,0 +1,80 @@
+# Indexed, resumable programs (archive.py)
+
+import os
+
+import numpy as np
+import pytest
+
+import archive
+import definitions
+import planner
+import reader
+import winder
+from conftest import GENERATOR, machineConfig
+
+
+# The default machine config is the one next to the scripts, so they work from any directory
+def test_writeFromAnotherDirectory(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    assert archive.main(['write', os.path.join(GENERATOR, 'TEST.wind'), 'out.nc']) == 0
+    assert "Written out.nc" in capsys.readouterr().out
+    assert (tmp_path / 'out.nc').stat().st_size == archive.openIndex('out.nc')[0]['offset']
+
+
+def archived(tmp_path):
+    machine = winder.Winder(30.0, machineConfig=machineConfig())
+    machine.setFeedRate(30.0, force=True)
+    planner.planWind([definitions.HoopWind(54.0, 0.5, 0.05, False),
+                      definitions.HelicalWind(54.0, 0.5, 0.1, 54.7, 2, 0, 180, 0, 0, False),
+                      definitions.HelicalWind(54.0, 0.375, 0.1, 30, 1, 0, 360, 0, 0, False)], machine)
+    file = str(tmp_path / 'wind.nc')
+    archive.writeArchive(machine.getToolpath(), file)
+    return machine.getToolpath(), file
+
+
+# After the preamble the machine is where it was just before the boundary (Z within a turn), and from there
+# the resumed program makes the same moves as the original
+@pytest.mark.parametrize('where', ({'layer': 0}, {'layer': 1, 'pattern': 3}, {'layer': 2, 'pattern': 5, 'circuit': 0},
+                                   {'layer': 2, 'pattern': 12}))
+def test_resumeReachesBoundaryState(tmp_path, where):
+    original, file = archived(tmp_path)
+    out = str(tmp_path / 'resume.nc')
+    record = archive.resume(file, out, **where)
+    row = int(record['row'])
+    assert (int(record['layer']), int(record['pattern']), int(record['circuit'])) == \
+        (where['layer'], where.get('pattern', -1), where.get('circuit', -1))
+
+    resumed = reader.readGcode(out)
+    preambleRows = len(resumed) - (len(original) - row)
+    assert preambleRows == len(archive.preamble(record))
+
+    before, after = original.arrays(), resumed.arrays()
+    machineX, machineZ = original.machinePositions()
+    resumedX, resumedZ = resumed.machinePositions()
+    end = preambleRows - 1
+    assert (after['x'][end], after['z'][end], after['feed'][end]) == \
+        pytest.approx((before['x'][row - 1], before['z'][row - 1], before['feed'][row - 1]))
+    assert resumedX[end] == pytest.approx(machineX[row - 1], abs=1e-3)
+    assert (resumedZ[end] - machineZ[row - 1]) / 360 == pytest.approx(round((resumedZ[end] - machineZ[row - 1]) / 360), abs=1e-5)
+
+    for name in ('op', 'x', 'z', 'feed'):
+        assert np.allclose(after[name][preambleRows:], before[name][row:]), name
+    assert np.allclose(np.diff(resumedX[end:]), np.diff(machineX[row - 1:]))
+    assert np.allclose(np.diff(resumedZ[end:]), np.diff(machineZ[row - 1:]))
+
+
+# A line resumes from the last boundary at or before it
+def test_resumeFromLine(tmp_path):
+    _, file = archived(tmp_path)
+    second = archive.lookup(file, layer=1, pattern=3, circuit=1)
+    first = archive.lookup(file, layer=1, pattern=3, circuit=0)
+    assert archive.lookup(file, line=int(second['line']))['row'] == second['row']
+    assert archive.lookup(file, line=int(second['line']) - 1)['row'] == first['row']
+
+
+def test_changedProgramRefused(tmp_path):
+    _, file = archived(tmp_path)
+    with open(file, 'a') as f:
+        f.write('G01 X0 Z0\n')
+    with pytest.raises(archive.ArchiveError, match="has been changed"):
+        archive.resume(file, str(tmp_path / 'resume.nc'), layer=1)
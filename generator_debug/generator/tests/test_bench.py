@@ -0,0 +1,38 @@
+# Benchmark runs and regression comparison (bench.py)
+
+import pytest
+
+import bench
+
+
+def results(*rows):
+    return {'results': [{'case': case, 'benchmark': benchmark, 'movesPerSecond': speed, 'peakBytes': peak}
+                        for case, benchmark, speed, peak in rows]}
+
+
+def test_compare():
+    old = results(('a', 'plan', 1000.0, 100), ('a', 'render', 1000.0, 100), ('b', 'plan', 1000.0, 100))
+    new = results(('a', 'plan', 850.0, 100), ('a', 'render', 950.0, 120), ('b', 'plan', 2000.0, 50),
+                  ('c', 'plan', 1.0, 1))
+    regressions = bench.compare(old, new, threshold=0.1)
+    assert [(r['case'], r['benchmark'], r['metric']) for r in regressions] == [('a', 'plan', 'movesPerSecond'),
+                                                                              ('a', 'render', 'peakBytes')]
+    assert regressions[0]['change'] == pytest.approx(-0.15)
+    assert bench.compare(old, new, threshold=0.25) == []
+
+
+def test_compareFiles(tmp_path):
+    old, new = str(tmp_path / 'old.json'), str(tmp_path / 'new.json')
+    bench.writeResults(results(('a', 'plan', 1000.0, 100)), old)
+    bench.writeResults(results(('a', 'plan', 500.0, 100)), new)
+    assert bench.main(['--compare', old, new]) == 1
+    assert bench.main(['--compare', old, old]) == 0
+
+
+def test_runCase():
+    params = {'layers': 1, 'towWidth': 0.5, 'windLength': 10.0}
+    found = bench.runCase(bench.caseName(params), params, ('plan', 'write', 'parse'), repeats=1, log=lambda text: None)
+    assert [result['benchmark'] for result in found] == ['plan', 'write', 'parse']
+    for result in found:
+        assert result['moves'] > 0 and result['seconds'] > 0 and result['peakBytes'] > 0
+    assert found[1]['bytes'] > 0
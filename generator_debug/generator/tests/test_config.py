@@ -0,0 +1,57 @@
+# Machine config registry (config.py)
+
+import json
+import os
+
+import pytest
+
+import config
+
+
+def writeConfig(path, **values):
+    data = {'mandrel_diameter': 6.0, 'mandrel_length': 54.0, 'x_limit': 54.0}
+    data.update(values)
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def test_defaults(tmp_path):
+    machineConfig = config.getConfig(writeConfig(tmp_path / 'machine.json'))
+    assert (machineConfig.mandrelDiameter, machineConfig.mandrelLength, machineConfig.xLimit) == (6.0, 54.0, 54.0)
+    assert (machineConfig.maxFeedX, machineConfig.maxFeedZ) == (200.0, 36000.0)
+
+
+# Every bad key is reported at once
+def test_badKeys(tmp_path):
+    path = tmp_path / 'machine.json'
+    path.write_text(json.dumps({'mandrel_diameter': '6', 'x_limit': -1, 'accel_z': True, 'layers': []}))
+    with pytest.raises(config.ConfigError) as error:
+        config.getConfig(str(path))
+    message = str(error.value)
+    for problem in ("'mandrel_diameter' must be a number, got '6'", "missing 'mandrel_length'",
+                    "'x_limit' must be positive, got -1", "'accel_z' must be a number, got True"):
+        assert problem in message
+
+
+def test_notAnObject():
+    with pytest.raises(config.ConfigError, match="must be a JSON object"):
+        config.parseConfig([6.0, 54.0, 54.0], 'machine.json')
+
+
+# The file is only read again once it changes
+def test_cachedUntilChanged(tmp_path):
+    path = writeConfig(tmp_path / 'machine.json')
+    first = config.getConfig(path)
+    assert config.getConfig(path) is first
+
+    writeConfig(tmp_path / 'machine.json', mandrel_diameter=8.0)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert config.getConfig(path).mandrelDiameter == 8.0
+
+
+def test_profile(tmp_path):
+    path = writeConfig(tmp_path / 'small.json', mandrel_diameter=2.0)
+    config.registerProfile('testSmall', path)
+    assert config.getConfig('testSmall').mandrelDiameter == 2.0
+    assert config.getConfig(config.getConfig('testSmall')) is config.getConfig(path)
@@ -0,0 +1,61 @@
+# Tow coverage (coverage.py) of a layer laid out by hand
+# The mandrel is 1 inch around and the layer is N passes down and N back at 45 degrees, spaced evenly around
+# the mandrel, so each ply covers N bands of towWidth * sqrt(2) around every column and the gaps and overlaps
+# are known exactly
+
+import math
+
+import numpy as np
+import pytest
+
+import coverage
+import toolpath
+from conftest import machineConfig
+from toolpath import Toolpath
+
+
+PASSES = 10
+
+CELL_SIZE = 0.01
+
+# Start a quarter cell off the grid, so no band edge falls on a cell center
+START = CELL_SIZE / 4
+
+
+def layer(passes=PASSES):
+    path = Toolpath()
+    path.append(toolpath.FEED, 0.0, 0.0, 30.0)
+    path.mark(toolpath.LAYER, 0)
+    s = START
+    path.append(toolpath.MOVE, 0.0, 360 * s, 30.0)
+    for _ in range(passes):
+        path.append(toolpath.MOVE, 1.0, 360 * (s + 1), 30.0)
+        path.append(toolpath.MOVE, 0.0, 360 * (s + 2), 30.0)
+        # Lock at the end, which moves the next pass on by one band
+        s += 2 + 1 / passes
+        path.append(toolpath.MOVE, 0.0, 360 * s, 30.0)
+    return path
+
+
+def coverageOf(bandHeight):
+    towWidth = bandHeight / math.sqrt(2)
+    return coverage.coverageMap(layer(), towWidth, machineConfig(1 / math.pi, 2.0, 2.0), CELL_SIZE)
+
+
+@pytest.mark.parametrize('bandHeight, gap, overlap', ((0.1, 0.0, 0.0), (0.08, 0.2, 0.0), (0.12, 0.0, 0.2)))
+def test_gapAndOverlap(bandHeight, gap, overlap):
+    report = coverageOf(bandHeight)
+    assert report['gap'] == pytest.approx(gap)
+    assert report['overlap'] == pytest.approx(overlap)
+
+    entry, = report['layers']
+    assert (entry['layer'], entry['passes']) == (0, 2 * PASSES)
+    assert (entry['gap'], entry['overlap']) == pytest.approx((gap, overlap))
+
+
+def test_counts():
+    report = coverageOf(0.1)
+    assert report['layerCount'].shape == (100, 100)
+    # Both plies cover every cell once, away from the locks at X = 0
+    assert np.all(report['towCount'][:, 10:90] == 2)
+    assert np.all(report['layerCount'] == 1)
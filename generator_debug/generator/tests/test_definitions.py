@@ -0,0 +1,42 @@
+# Reading wind files into layers (definitions.parseSchedule)
+
+import pytest
+
+import definitions
+
+
+def windFile(**layer):
+    return {'length': 54, 'defaultFeedRate': 30,
+            'layers': [dict({'windType': 'hoop', 'towWidth': 0.5, 'towThickness': 0.2, 'terminal': False}, **layer)]}
+
+
+def test_validFile():
+    schedule, defaultFeedRate = definitions.parseSchedule(windFile(terminal=True), 'a.wind')
+    assert schedule == [definitions.HoopWind(54.0, 0.5, 0.2, True)]
+    assert defaultFeedRate == 30.0
+
+
+# 0 and 1 are read as false and true
+@pytest.mark.parametrize('value, expected', ((1, True), (0, False), (True, True), (False, False)))
+def test_flagsAcceptZeroAndOne(value, expected):
+    schedule, _ = definitions.parseSchedule(windFile(terminal=value), 'a.wind')
+    assert schedule[0].isSinglePass is expected
+
+
+@pytest.mark.parametrize('value', (2, 0.5, 'true', None))
+def test_flagsMustBeBooleans(value):
+    with pytest.raises(definitions.ScheduleError, match="'terminal'"):
+        definitions.parseSchedule(windFile(terminal=value), 'a.wind')
+
+
+# Every problem of the file is reported at once
+def test_allProblemsReported():
+    data = windFile(towWidth=-1, terminal=2)
+    data['layers'].append({'windType': 'spiral'})
+    del data['defaultFeedRate']
+    with pytest.raises(definitions.ScheduleError) as error:
+        definitions.parseSchedule(data, 'a.wind')
+    message = str(error.value)
+    for problem in ("missing 'defaultFeedRate'", "layer 0: 'towWidth' must be positive",
+                    "layer 0: 'terminal' must be true or false", "layer 1: invalid wind type 'spiral'"):
+        assert problem in message
@@ -0,0 +1,73 @@
+# Wind time estimates (estimator.py) on moves whose time can be worked out by hand
+# The test machine has the default limits: X 200 in/min and 10 in/s^2, Z 36000 deg/min and 3600 deg/s^2
+
+import math
+
+import pytest
+
+import estimator
+import toolpath
+from conftest import machineConfig
+from toolpath import Toolpath
+
+
+def program(*moves, feed=60.0):
+    path = Toolpath()
+    path.append(toolpath.UNITS, 0.0, 0.0, 0.0)
+    path.append(toolpath.FEED, 0.0, 0.0, feed)
+    for x, z in moves:
+        path.append(toolpath.MOVE, x, z, feed)
+    return path
+
+
+def seconds(path):
+    return estimator.estimate(path, machineConfig())['seconds']
+
+
+# 10 in at 1 in/s: 0.1 s to speed up over 0.05 in, 9.9 in cruising, 0.1 s to stop
+def test_trapezoid():
+    assert seconds(program((10.0, 0.0))) == pytest.approx(10.1)
+
+
+# 0.05 in is too short to reach the feed rate: half the way speeding up, half slowing down
+def test_triangle():
+    assert seconds(program((0.05, 0.0))) == pytest.approx(2 * math.sqrt(2 * 0.025 / 10))
+
+
+# F600 is over the X limit, so the move runs at 200 in/min
+def test_feedCapped():
+    speed = 200 / 60
+    rampTime = speed / 10
+    expected = 2 * rampTime + (20.0 - speed * rampTime) / speed
+    assert seconds(program((20.0, 0.0), feed=600.0)) == pytest.approx(expected)
+
+
+# Straight on through a junction does not slow down, so two halves take as long as the whole
+def test_straightJunction():
+    assert seconds(program((5.0, 0.0), (10.0, 0.0))) == pytest.approx(seconds(program((10.0, 0.0))))
+
+
+# A reversal comes to a full stop
+def test_reversal():
+    assert seconds(program((10.0, 0.0), (0.0, 0.0))) == pytest.approx(2 * 10.1)
+
+
+# G92 does not move the machine
+def test_setDoesNotMove():
+    path = program((10.0, 0.0))
+    path.append(toolpath.SET, 0.0, 0.0, 60.0)
+    path.append(toolpath.MOVE, 10.0, 0.0, 60.0)
+    assert seconds(path) == pytest.approx(seconds(program((10.0, 0.0), (20.0, 0.0))))
+
+
+def test_perLayer():
+    path = Toolpath()
+    path.append(toolpath.FEED, 0.0, 0.0, 60.0)
+    path.mark(toolpath.LAYER, 0)
+    path.append(toolpath.MOVE, 10.0, 0.0, 60.0)
+    path.mark(toolpath.LAYER, 1)
+    path.append(toolpath.MOVE, 0.0, 0.0, 60.0)
+    report = estimator.estimate(path, machineConfig())
+    assert [layer['layer'] for layer in report['layers']] == [0, 1]
+    assert [layer['seconds'] for layer in report['layers']] == pytest.approx([10.1, 10.1])
+    assert report['setupSeconds'] == 0.0
@@ -0,0 +1,99 @@
+# The semantic gcode diff of the golden check (golden.diff)
+# Programs that make the machine move the same way compare equal however they are written; the first move
+# that does not is reported with its line in both files and where it is in the schedule
+
+import pytest
+
+import golden
+
+
+PROGRAM = """G20
+G01 F30.0
+G92 X0 Z0
+(Pattern: 0/2 Circuit: 0/1)
+G01 X54.0 Z595.435
+G01 X0.0 Z955.435
+G92 X0.0 Z0
+(Pattern: 1/2 Circuit: 0/1)
+G01 X54.0 Z595.435
+G01 X0.0 Z955.435
+"""
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def compare(tmp_path, new, tolerance=golden.TOLERANCE, chunkSize=None):
+    options = {} if chunkSize is None else {'chunkSize': chunkSize}
+    return golden.diff(write(tmp_path, 'golden.nc', PROGRAM), write(tmp_path, 'new.nc', new), tolerance, **options)
+
+
+def test_sameProgram(tmp_path):
+    report = compare(tmp_path, PROGRAM)
+    assert report == {'equal': True, 'moves': 4, 'divergence': None}
+
+
+# No comments, blank lines, other number formatting and the feed rate on a move line
+def test_formattingIgnored(tmp_path):
+    new = """G20
+G92 X0 Z0
+
+G01 X54 Z595.4350 F30
+G01 X0 Z955.435
+G92 X0 Z0.000
+G01 X54.00 Z595.435
+
+G01 X0 Z955.43500
+"""
+    assert compare(tmp_path, new)['equal']
+
+
+# Z brought back within a turn by the G92 goes to the same machine positions
+def test_renormalizedZ(tmp_path):
+    new = PROGRAM.replace("G92 X0.0 Z0\n", "G92 X0.0 Z235.435\n")
+    new = new.replace("(Pattern: 1/2 Circuit: 0/1)\nG01 X54.0 Z595.435\nG01 X0.0 Z955.435",
+                      "(Pattern: 1/2 Circuit: 0/1)\nG01 X54.0 Z830.87\nG01 X0.0 Z1190.87")
+    assert new != PROGRAM
+    assert compare(tmp_path, new)['equal']
+
+
+@pytest.mark.parametrize('z, equal', (('595.436', True), ('595.434', True), ('595.437', False), ('595.5', False)))
+def test_tolerance(tmp_path, z, equal):
+    new = PROGRAM.replace("G01 X54.0 Z595.435\nG01 X0.0 Z955.435\n", f"G01 X54.0 Z{z}\nG01 X0.0 Z955.435\n", 1)
+    assert compare(tmp_path, new)['equal'] == equal
+
+
+# The first move that differs, in the second pattern, is reported with its line in each file
+@pytest.mark.parametrize('chunkSize', (None, 16))
+def test_firstDivergence(tmp_path, chunkSize):
+    lines = PROGRAM.splitlines()
+    lines[8] = "G01 X54.0 Z596.0"
+    lines[9] = "G01 X1.0 Z955.435"
+    lines.insert(0, "(moved down a line)")
+    report = compare(tmp_path, "\n".join(lines) + "\n", chunkSize=chunkSize)
+
+    assert not report['equal']
+    assert report['moves'] == 2
+    divergence = report['divergence']
+    assert (divergence['move'], divergence['reason']) == (2, 'position')
+    assert (divergence['golden']['line'], divergence['new']['line']) == (9, 10)
+    assert divergence['golden']['z'] == pytest.approx(1550.87)
+    assert divergence['new']['z'] == pytest.approx(1551.435)
+    assert (divergence['new']['pattern'], divergence['new']['circuit']) == (1, 0)
+
+
+def test_differentFeed(tmp_path):
+    new = PROGRAM.replace("G92 X0.0 Z0\n", "G92 X0.0 Z0\nG01 F40.0\n")
+    divergence = compare(tmp_path, new)['divergence']
+    assert (divergence['move'], divergence['reason']) == (2, 'feed')
+
+
+def test_programCutShort(tmp_path):
+    new = PROGRAM.rsplit("G01", 1)[0]
+    report = compare(tmp_path, new)
+    assert report['divergence']['reason'] == 'length'
+    assert report['moves'] == 3
+    assert report['divergence']['new'] is None
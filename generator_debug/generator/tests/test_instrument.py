@@ -0,0 +1,72 @@
+# Metrics observer (instrument.Metrics) on planned winds
+
+import pytest
+
+import definitions
+import instrument
+import planner
+import sinks
+import toolpath
+import winder
+from conftest import machineConfig
+
+
+FEED_RATE = 30.0
+
+SCHEDULE = [definitions.HoopWind(54.0, 0.5, 0.05, False),
+            definitions.HelicalWind(54.0, 0.5, 0.1, 54.7, 2, 0, 180, 0, 0, False)]
+
+
+def plan(metrics, sink=None, flushEvery=toolpath.RENDER_CHUNK, xLimit=54.0):
+    machine = winder.Winder(FEED_RATE, sink, flushEvery, machineConfig=machineConfig(xLimit=xLimit), observers=[metrics])
+    machine.setFeedRate(FEED_RATE, force=True)
+    planner.planWind(SCHEDULE, machine)
+    return machine
+
+
+def test_countsMatchToolpath():
+    metrics = instrument.Metrics()
+    machine = plan(metrics)
+    lines = machine.getGcode()
+    path = machine.getToolpath()
+
+    report = metrics.toDict()
+    assert report['moves'] == path.op.count(toolpath.MOVE)
+    assert report['moves'] == report['setupMoves'] + sum(layer['moves'] for layer in report['layers'])
+    assert [layer['layer'] for layer in report['layers']] == [0, 1]
+    assert (report['lines'], report['bytes']) == (len(lines), sum(len(line) + 1 for line in lines))
+    assert report['peakRows'] == len(path)
+    assert report['rejectedMoves'] == 0
+
+
+# Streaming into a sink, with the toolpath cleared on every flush, counts the same
+def test_countsWhenStreaming():
+    inMemory = instrument.Metrics()
+    plan(inMemory).getGcode()
+    streamed = instrument.Metrics()
+    counter = plan(streamed, sinks.CountSink(), flushEvery=16).finish()
+
+    for key in ('moves', 'setupMoves', 'lines', 'bytes'):
+        assert streamed.toDict()[key] == inMemory.toDict()[key], key
+    assert (streamed.lines, streamed.bytes) == (counter['lines'], counter['bytes'])
+
+
+# Moves past the X limit are dropped and reported per layer
+def test_rejectedMoves():
+    metrics = instrument.Metrics()
+    plan(metrics, xLimit=20.0)
+    report = metrics.toDict()
+    assert report['rejectedMoves'] > 0
+    assert report['rejectedMoves'] == sum(layer['rejectedMoves'] for layer in report['layers'])
+    assert all(abs(rejection['x']) > 20.0 for rejection in report['rejections'])
+
+
+def test_profiler():
+    with instrument.Profiler(memory=True) as profiler:
+        plan(instrument.Metrics())
+    text = profiler.report(5)
+    assert "planWind" in text and profiler.peakBytes > 0
+
+    with instrument.Profiler(memory=True, enabled=False) as profiler:
+        plan(instrument.Metrics())
+    assert profiler.profile is None and profiler.snapshot is None
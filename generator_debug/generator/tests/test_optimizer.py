@@ -0,0 +1,58 @@
+# The optimization pass (optimizer.optimize) on a planned wind
+# The optimized program has to end where the original does and keep its layer, pattern and circuit marks
+
+import numpy as np
+import pytest
+
+import definitions
+import optimizer
+import planner
+import toolpath
+import winder
+from conftest import machineConfig
+
+
+FEED_RATE = 30.0
+
+
+def planned():
+    machine = winder.Winder(FEED_RATE, machineConfig=machineConfig())
+    machine.setFeedRate(FEED_RATE, force=True)
+    schedule = [definitions.HoopWind(54.0, 0.5, 0.05, False),
+                definitions.HelicalWind(54.0, 0.5, 0.1, 54.7, 2, 0, 180, 0, 0, False),
+                definitions.HoopWind(54.0, 0.5, 0.05, True)]
+    planner.planWind(schedule, machine)
+    return machine.getToolpath()
+
+
+@pytest.mark.parametrize('stripComments', (False, True))
+def test_sameFinalState(stripComments):
+    path = planned()
+    optimized, report = optimizer.optimize(path, stripComments)
+
+    assert report['linesAfter'] < report['linesBefore']
+    assert (optimized.x[-1], optimized.z[-1], optimized.feed[-1]) == (path.x[-1], path.z[-1], path.feed[-1])
+    for before, after in zip(path.machinePositions(), optimized.machinePositions()):
+        assert after[-1] == pytest.approx(before[-1])
+
+
+# Every mark is still there, on a row of the same layer, pattern and circuit as before
+@pytest.mark.parametrize('stripComments', (False, True))
+def test_marksKept(stripComments):
+    path = planned()
+    optimized, _ = optimizer.optimize(path, stripComments)
+
+    before = path.marks()
+    after = optimized.marks()
+    for name in ('kind', 'layer', 'pattern', 'circuit'):
+        assert np.array_equal(before[name], after[name]), name
+    assert np.all(np.diff(after['row']) >= 0)
+    assert np.all(after['row'] <= len(optimized))
+
+    # Every layer, pattern and circuit still has its moves
+    assert moveLocations(optimized) == moveLocations(path)
+
+
+def moveLocations(path):
+    rows = np.flatnonzero(path.arrays()['op'] == toolpath.MOVE)
+    return set(zip(*(column.tolist() for column in path.locate(rows))))
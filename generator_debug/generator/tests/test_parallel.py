@@ -0,0 +1,63 @@
+# Layers planned in worker processes (parallel.planLayers) against planning them one after another
+# The toolpath, its marks, what the planner printed and the moves rejected all have to be the same
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import definitions
+import instrument
+import layercache
+import planner
+import winder
+from conftest import machineConfig
+
+
+FEED_RATE = 30.0
+
+# Hoop and helical layers, one too long for the machine (its moves are rejected) and one with an invalid
+# number of starts (skipped with a message)
+SCHEDULE = [definitions.HoopWind(18.0, 1.0, 0.05, False),
+            definitions.HelicalWind(30.0, 0.375, 0.1, 30, 4, 0, 720, 0, 0, False),
+            definitions.HelicalWind(18.0, 0.375, 0.1, 30, 5, 0, 720, 0, 0, False),
+            definitions.HelicalWind(18.0, 0.5, 0.1, 54.7, 2, 0, 180, 0, 0, False, feedRates={'pass': 20}),
+            definitions.HoopWind(18.0, 0.5, 0.05, True)]
+
+
+def plan(workers, cache=None):
+    metrics = instrument.Metrics()
+    machine = winder.Winder(FEED_RATE, machineConfig=machineConfig(6.0, 20.0, 20.0), observers=[metrics])
+    machine.setFeedRate(FEED_RATE, force=True)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        planner.planWind(SCHEDULE, machine, cache=cache, workers=workers)
+    return machine.getToolpath(), output.getvalue(), metrics.rejectedMoves
+
+
+def assertSame(serial, parallel):
+    (serialPath, serialOutput, serialRejected), (path, output, rejected) = serial, parallel
+    for name, column in serialPath.arrays().items():
+        assert np.array_equal(column, path.arrays()[name]), name
+    for name, column in serialPath.marks().items():
+        assert np.array_equal(column, path.marks()[name]), name
+    assert serialPath.render() == path.render()
+    assert output == serialOutput
+    assert rejected == serialRejected
+
+
+@pytest.mark.parametrize('workers', (2, 0))
+def test_sameAsSerial(workers):
+    serial = plan(1)
+    assert serial[2] > 0 and "Error" in serial[1]
+    assertSame(serial, plan(workers))
+
+
+# Layers taken from the cache print and reject the same as planned ones
+def test_withCache(tmp_path):
+    serial = plan(1)
+    cache = layercache.LayerCache(str(tmp_path))
+    assertSame(serial, plan(2, cache))
+    assertSame(serial, plan(2, cache))
+    assert cache.hits == len(SCHEDULE)
@@ -0,0 +1,122 @@
+# The vectorized helical planner (planHelicalPatterns) against the plain loop through Winder.moveBy
+# Both have to produce the same toolpath, column for column, and the same gcode
+
+import random
+
+import numpy as np
+import pytest
+
+import definitions
+import planner
+import toolpath
+import winder
+from conftest import machineConfig
+
+
+FEED_RATE = 30.0
+
+PROFILES = ({}, {'pass': 20}, {'lock': 400, 'step': 500}, {'pass': 25, 'lock': 400, 'step': 400})
+
+
+def plan(schedule, vectorized, machine=None, x0=0.0, z0=0.0):
+    machine = machine or machineConfig()
+    winding = winder.Winder(FEED_RATE, machineConfig=machine)
+    winding.setFeedRate(FEED_RATE, force=True)
+    if x0 or z0:
+        winding.moveBy(x0, z0)
+    planner.planWind(schedule, winding, vectorized)
+    return winding
+
+
+def assertSameToolpath(loop: toolpath.Toolpath, vectorized: toolpath.Toolpath):
+    for name, column in loop.arrays().items():
+        assert np.array_equal(column, vectorized.arrays()[name]), name
+    for name, column in loop.marks().items():
+        assert np.array_equal(column, vectorized.marks()[name]), name
+    assert loop.strings == vectorized.strings
+    assert loop.render() == vectorized.render()
+
+
+# A valid number of starts for the layer, or (with invalid=True) one that does not divide the circuits
+def numStarts(rng, towWidth, windAngle, mandrelDiameter, invalid=False):
+    numCircuits = definitions.circuitGeometry(mandrelDiameter, towWidth, windAngle).numCircuits
+    divisors = [n for n in range(1, numCircuits + 1) if numCircuits % n == 0]
+    if invalid:
+        others = [n for n in range(2, numCircuits) if numCircuits % n != 0]
+        return rng.choice(others) if others else numCircuits + 1
+    return rng.choice(divisors)
+
+
+def randomLayer(rng, windLength, mandrelDiameter):
+    feedRates = rng.choice(PROFILES)
+    towWidth = rng.choice((0.05, 0.11, 0.375, 1.0))
+    if rng.random() < 0.25:
+        return definitions.HoopWind(windLength, towWidth, 0.05, rng.random() < 0.5, feedRates=feedRates)
+
+    windAngle = rng.choice((10, 30, 54.7, 70))
+    starts = numStarts(rng, towWidth, windAngle, mandrelDiameter, invalid=rng.random() < 0.15)
+    return definitions.HelicalWind(windLength, towWidth, 0.1, windAngle, starts, 0, rng.choice((0, 180, 360, 725.3)),
+                                   0, 0, rng.random() < 0.5, feedRates=feedRates)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_randomSchedules(seed, capsys):
+    rng = random.Random(seed)
+    mandrelDiameter = rng.choice((4.0, 6.0))
+    windLength = rng.choice((18.0, 50.9, 54.0))
+    # Now and then a layer runs past the X limit, where the vectorized planner hands over to the loop
+    machine = machineConfig(mandrelDiameter, 54.0, rng.choice((54.0, 54.0, 40.0)))
+    schedule = [randomLayer(rng, windLength, mandrelDiameter) for _ in range(rng.randint(1, 4))]
+    x0, z0 = rng.choice((0.0, 3.3)), rng.choice((0.0, 12.5))
+
+    loop = plan(schedule, False, machine, x0, z0)
+    loopOutput = capsys.readouterr().out
+    vectorized = plan(schedule, True, machine, x0, z0)
+    assert capsys.readouterr().out == loopOutput
+
+    assertSameToolpath(loop.getToolpath(), vectorized.getToolpath())
+    assert loop.state() == vectorized.state()
+
+
+# Feed rate profiles change the feed between the moves of a circuit; an F line goes in only where it changes
+@pytest.mark.parametrize('feedRates', PROFILES)
+def test_feedRateProfiles(feedRates):
+    layer = definitions.HelicalWind(54, 0.375, 0.1, 30, 2, 0, 720, 0, 0, False, feedRates=feedRates)
+    loop, vectorized = plan([layer], False), plan([layer], True)
+    assertSameToolpath(loop.getToolpath(), vectorized.getToolpath())
+
+    path = vectorized.getToolpath()
+    moves = np.flatnonzero(path.arrays()['op'] == toolpath.MOVE)
+    feeds = path.arrays()['feed'][moves[path.locate(moves)[0] == 0]]
+    assert set(np.unique(feeds).tolist()) == set(feedRates.values()) | ({FEED_RATE} if len(feedRates) < 3 else set())
+
+
+# A steep angle on a long mandrel winds Z past RENORMALIZE_Z within a pattern, so circuits start with a G92
+def test_renormalization():
+    layer = definitions.HelicalWind(54, 0.375, 0.1, 70, 9, 0, 725.3, 0, 0, False)
+    loop, vectorized = plan([layer], False), plan([layer], True)
+    assertSameToolpath(loop.getToolpath(), vectorized.getToolpath())
+
+    cols = vectorized.getToolpath().arrays()
+    sets = np.flatnonzero(cols['op'] == toolpath.SET)
+    renormalized = sets[np.abs(cols['z'][sets - 1]) >= winder.RENORMALIZE_Z]
+    assert renormalized.size > 0
+
+
+# A number of starts that does not divide the circuits skips the layer, the same way in both planners
+def test_invalidStartsSkipped(capsys):
+    valid = definitions.HelicalWind(54, 0.375, 0.1, 30, 2, 0, 720, 0, 0, False)
+    invalid = definitions.HelicalWind(54, 0.375, 0.1, 30, 5, 0, 720, 0, 0, False)
+    schedule = [valid, invalid, valid]
+
+    loop = plan(schedule, False)
+    assert 'This layer will be skipped.' in capsys.readouterr().out
+    vectorized = plan(schedule, True)
+    assert 'This layer will be skipped.' in capsys.readouterr().out
+    assertSameToolpath(loop.getToolpath(), vectorized.getToolpath())
+
+    path = vectorized.getToolpath()
+    moves = np.flatnonzero(path.arrays()['op'] == toolpath.MOVE)
+    layers = path.locate(moves)[0]
+    assert not np.any(layers == 1)
+    assert np.any(layers == 0) and np.any(layers == 2)
@@ -0,0 +1,64 @@
+# Level of detail of the toolpath plots (plotter.py)
+
+import numpy as np
+import pytest
+
+import definitions
+import planner
+import plotter
+import winder
+from conftest import machineConfig
+
+
+def planned():
+    machine = winder.Winder(30.0, machineConfig=machineConfig())
+    machine.setFeedRate(30.0, force=True)
+    planner.planWind([definitions.HoopWind(54.0, 0.5, 0.05, False),
+                      definitions.HelicalWind(54.0, 0.25, 0.1, 54.7, 1, 0, 180, 0, 0, False)], machine)
+    return machine.getToolpath()
+
+
+# Whole groups are kept, every stride-th one, and what is kept stays under the budget
+@pytest.mark.parametrize('maxSegments', (10, 100, 1000))
+def test_levelOfDetail(maxSegments):
+    group = np.repeat(np.arange(200), 6)
+    cost = np.ones(group.size)
+    keep, stride = plotter.levelOfDetail(group, cost, maxSegments)
+
+    assert cost[keep].sum() <= maxSegments
+    if cost.sum() <= maxSegments:
+        assert keep.all() and stride == 1
+    else:
+        assert np.array_equal(np.unique(group[keep]), np.arange(0, 200, stride))
+
+
+# A few huge groups are thinned out within the groups as well
+def test_levelOfDetailHugeGroups():
+    group = np.repeat(np.arange(3), 5000)
+    keep, _ = plotter.levelOfDetail(group, np.ones(group.size), 100)
+    assert 0 < np.count_nonzero(keep) <= 100
+
+
+# Moves are split at every full turn, the pieces cover the same angles and X follows the move
+def test_unroll():
+    x0, z0, x1, z1 = np.array([0.0, 1.0]), np.array([350.0, 30.0]), np.array([10.0, 1.0]), np.array([1090.0, 20.0])
+    (xStart, aStart, xEnd, aEnd), move = plotter.unroll(x0, z0, x1, z1)
+
+    assert move.tolist() == [0, 0, 0, 0, 1]
+    assert np.all((aStart >= 0) & (aEnd <= 360) & (aStart <= aEnd))
+    assert np.sum(aEnd - aStart) == pytest.approx(740.0 + 10.0)
+    assert (xStart[0], xEnd[-2]) == pytest.approx((0.0, 10.0))
+    assert np.allclose(xEnd[:-2], xStart[1:-1])
+
+
+def test_plotToolpath():
+    from matplotlib.figure import Figure
+
+    path = planned()
+    segments = plotter.moveSegments(path)
+    figure = plotter.plotToolpath(path, machineConfig(), maxSegments=200, figure=Figure())
+
+    unrolled, cylinder = figure.axes
+    assert sum(len(collection.get_segments()) for collection in unrolled.collections) <= 200
+    assert "circuits shown" in unrolled.get_title()
+    assert f"{segments['x0'].size} moves" in figure.get_suptitle()
@@ -0,0 +1,42 @@
+# Reading a generated program back (reader.readGcode) gives the toolpath it was rendered from
+
+import numpy as np
+import pytest
+
+import definitions
+import planner
+import reader
+import toolpath
+import winder
+from conftest import machineConfig
+
+
+def plan(schedule):
+    winding = winder.Winder(30.0, machineConfig=machineConfig())
+    winding.setFeedRate(30.0, force=True)
+    planner.planWind(schedule, winding)
+    return winding.getToolpath()
+
+
+# Hoop layers between helical ones keep their own layer number, from the "Hoop pass" comments
+# The reader starts a layer where its first pattern starts, so only the pattern and circuit marks are compared
+# exactly; a layer's initial lock counts towards the layer before
+@pytest.mark.parametrize('chunkSize', (reader.CHUNK_SIZE, 256))
+def test_roundTripMarks(tmp_path, chunkSize):
+    schedule = [definitions.HoopWind(54, 1.0, 0.05, False),
+                definitions.HelicalWind(54, 0.375, 0.1, 30, 2, 0, 720, 0, 0, False),
+                definitions.HoopWind(54, 0.5, 0.05, False),
+                definitions.HelicalWind(54, 0.375, 0.1, 54.7, 1, 0, 725.3, 0, 0, True),
+                definitions.HoopWind(54, 0.5, 0.05, True)]
+    path = plan(schedule)
+    nc = tmp_path / 'wind.nc'
+    nc.write_text('\n'.join(path.render()) + '\n', encoding='utf-8')
+
+    loaded = reader.readGcode(str(nc), chunkSize)
+    assert loaded.render() == path.render()
+    marks, loadedMarks = path.marks(), loaded.marks()
+    planned = marks['kind'] != toolpath.LAYER
+    read = loadedMarks['kind'] != toolpath.LAYER
+    for name in marks:
+        assert np.array_equal(loadedMarks[name][read], marks[name][planned]), name
+    assert loadedMarks['layer'][loadedMarks['kind'] == toolpath.LAYER].tolist() == [0, 1, 2, 3, 4]
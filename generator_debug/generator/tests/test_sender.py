@@ -0,0 +1,79 @@
+# Character-counting streaming (sender.py) against the GRBL simulator (grblsim.py)
+
+import pytest
+
+import definitions
+import grblsim
+import planner
+import sender
+import winder
+from conftest import machineConfig
+
+
+FEED_RATE = 30.0
+
+
+@pytest.fixture
+def grbl():
+    simulator = grblsim.GrblSimulator()
+    yield simulator
+    simulator.close()
+
+
+def planned():
+    machine = winder.Winder(FEED_RATE, machineConfig=machineConfig())
+    machine.setFeedRate(FEED_RATE, force=True)
+    planner.planWind([definitions.HoopWind(54.0, 0.5, 0.05, False),
+                      definitions.HelicalWind(54.0, 0.5, 0.1, 54.7, 2, 0, 180, 0, 0, False)], machine)
+    return machine.getToolpath()
+
+
+# Every line is sent and acknowledged, the RX buffer never overflows and the machine ends where the program does
+def test_streamProgram(grbl):
+    path = planned()
+    stats = sender.GrblSender(grbl).stream(path)
+
+    lines = [line for line in map(sender.cleanLine, path.render()) if line]
+    assert stats['linesSent'] == stats['linesAcked'] == grbl.linesReceived == len(lines)
+    assert stats['bytesSent'] == sum(len(line) + 1 for line in lines)
+    assert stats['errors'] == [] and grbl.errors == 0
+    assert stats['queuedBytes'] == 0
+    assert not grbl.overflowed
+
+    machineX, machineZ = path.machinePositions()
+    assert grbl.position == pytest.approx([machineX[-1], machineZ[-1]])
+
+
+# With a controller slower than the sender, the unacknowledged lines fill the RX buffer right up to its size
+def test_rxBufferAccounting(grbl):
+    grbl.lineTime = 0.001
+    lines = [f"G01 X{i % 50}.125 Z{i * 10}.5" for i in range(400)]
+    grblSender = sender.GrblSender(grbl)
+    stats = grblSender.stream(lines)
+
+    assert stats['linesAcked'] == 400
+    assert not grbl.overflowed
+    assert grbl.maxRxUsed <= grblsim.RX_BUFFER_SIZE
+    longest = max(len(line) + 1 for line in lines)
+    assert grblsim.RX_BUFFER_SIZE - longest <= stats['maxQueuedBytes'] < grblsim.RX_BUFFER_SIZE
+
+
+# Send and wait for ok never has more than one line outstanding
+def test_pingPong(grbl):
+    lines = [f"G01 X{i}.0 Z{i}.0" for i in range(50)]
+    stats = sender.GrblSender(grbl, pingPong=True).stream(lines)
+    assert stats['linesAcked'] == 50
+    assert stats['maxQueuedBytes'] == max(len(line) + 1 for line in lines)
+
+
+# A sender that thinks the buffer is bigger than it is overruns it
+def test_overflowDetected(grbl):
+    grbl.lineTime = 0.001
+    lines = [f"G01 X{i % 50}.125 Z{i * 10}.5" for i in range(200)]
+    sender.GrblSender(grbl, rxBufferSize=1024).stream(lines)
+    assert grbl.overflowed
+
+
+def test_cleanLine():
+    assert sender.cleanLine("G01 X1.0 (lock) Z2.0 ; comment ") == "G01 X1.0  Z2.0"
+    assert sender.cleanLine("(Pattern: 1/2 Circuit: 0/1)") == ""
@@ -0,0 +1,58 @@
+# Streaming gcode into sinks (sinks.py)
+# A wind streamed into a sink, however often the winder flushes, has to give the same lines as render()
+
+import pytest
+
+import definitions
+import planner
+import sinks
+import winder
+from conftest import machineConfig
+
+
+FEED_RATE = 30.0
+
+SCHEDULE = [definitions.HoopWind(54.0, 0.5, 0.05, False),
+            definitions.HelicalWind(54.0, 0.5, 0.1, 54.7, 2, 0, 180, 0, 0, False),
+            definitions.HelicalWind(54.0, 0.25, 0.1, 30, 1, 0, 360, 0, 0, True)]
+
+
+def plan(sink=None, flushEvery=None):
+    options = {} if flushEvery is None else {'flushEvery': flushEvery}
+    machine = winder.Winder(FEED_RATE, sink, machineConfig=machineConfig(), **options)
+    machine.setFeedRate(FEED_RATE, force=True)
+    planner.planWind(SCHEDULE, machine)
+    return machine
+
+
+def rendered():
+    return plan().getToolpath().render()
+
+
+@pytest.mark.parametrize('flushEvery', (None, 1, 7))
+def test_listSink(flushEvery):
+    assert plan(sinks.ListSink(), flushEvery).finish() == rendered()
+
+
+@pytest.mark.parametrize('flushEvery', (None, 1, 7))
+def test_fileSink(tmp_path, flushEvery):
+    path = str(tmp_path / 'wind.nc')
+    assert plan(sinks.FileSink(path), flushEvery).finish() == path
+    with open(path) as f:
+        assert f.read() == '\n'.join(rendered()) + '\n'
+
+
+def test_countAndTee(tmp_path):
+    lines = rendered()
+    path = str(tmp_path / 'wind.nc')
+    listed, counted, written = plan(sinks.TeeSink(sinks.ListSink(), sinks.CountSink(), sinks.FileSink(path)), 5).finish()
+    assert listed == lines
+    assert counted == {'lines': len(lines), 'bytes': sum(len(line) + 1 for line in lines)}
+    assert written == path
+
+
+def test_planWindTo(tmp_path):
+    path = str(tmp_path / 'wind.nc')
+    planner.writeWind(SCHEDULE, FEED_RATE, path, machineConfig())
+    with open(path) as f:
+        assert f.read().splitlines() == rendered()
@@ -0,0 +1,31 @@
+# Start-up: planning, loading and the CLI helpers must not need tkinter (load.py only imports it for a dialog)
+# and have to import quickly
+
+import json
+import subprocess
+import sys
+
+from conftest import GENERATOR
+
+
+# Most the imports may take [s]; they take a small fraction of that
+STARTUP_LIMIT = 1.0
+
+# Runs in a fresh interpreter where importing tkinter fails, as on a machine without it
+SCRIPT = """
+import json, sys, time
+sys.modules['tkinter'] = None
+start = time.perf_counter()
+import definitions, planner, winder, load, helper
+seconds = time.perf_counter() - start
+loaded = sorted(name for name, module in sys.modules.items() if 'tkinter' in name and module is not None)
+print(json.dumps({'seconds': seconds, 'tkinter': loaded}))
+"""
+
+
+def test_importsWithoutTkinter():
+    result = subprocess.run([sys.executable, '-c', SCRIPT], cwd=GENERATOR, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report['tkinter'] == []
+    assert report['seconds'] < STARTUP_LIMIT
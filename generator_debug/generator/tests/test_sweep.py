@@ -0,0 +1,52 @@
+# The design-space sweep (sweep.py) against the planner's geometry for one layer at a time
+
+import numpy as np
+import pytest
+
+import definitions
+import sweep
+
+
+def test_sameAsLayerGeometry():
+    table = sweep.sweep((4.0, 6.0), np.arange(0.25, 0.5, 0.05), np.arange(10, 80, 7), windLength=54.0)
+
+    expected = []
+    for diameter in (4.0, 6.0):
+        for tow in np.arange(0.25, 0.5, 0.05):
+            for angle in np.arange(10, 80, 7):
+                numCircuits = definitions.circuitGeometry(diameter, tow, angle).numCircuits
+                for starts in (n for n in range(1, numCircuits + 1) if numCircuits % n == 0):
+                    layer = definitions.HelicalWind(54.0, tow, 0.1, angle, starts, 0, 0, 0, 0, False)
+                    geometry = definitions.helicalGeometry(layer, diameter)
+                    expected.append((diameter, tow, angle, numCircuits, starts, geometry.numPatterns,
+                                     geometry.passStepAngle, geometry.passAngle))
+
+    assert len(table) == len(expected)
+    names = ('mandrelDiameter', 'towWidth', 'windAngle', 'numCircuits', 'numStarts', 'numPatterns',
+             'passStepAngle', 'passAngle')
+    for name, column in zip(names, zip(*expected)):
+        assert np.allclose(table[name], column), name
+
+
+@pytest.mark.parametrize('n', (1, 2, 12, 97, 360, 1024))
+def test_divisors(n):
+    assert sweep.divisors(n) == tuple(d for d in range(1, n + 1) if n % d == 0)
+
+
+def test_filters(tmp_path):
+    table = sweep.sweep(6.0, 0.3, np.arange(20, 61, 1)).where('numPatterns', 10, 40).where('numStarts', 2, 2)
+    assert len(table) > 0
+    assert np.all(table['numStarts'] == 2)
+    assert np.all((table['numPatterns'] >= 10) & (table['numPatterns'] <= 40))
+
+    ordered = table.sortBy('numPatterns', descending=True)
+    assert np.all(np.diff(ordered['numPatterns']) <= 0)
+
+    path = table.toCsv(str(tmp_path / 'layups.csv'))
+    with open(path) as f:
+        assert len(f.read().splitlines()) == len(table) + 1
+
+
+def test_parseRange():
+    assert np.allclose(sweep.parseRange('0.25:0.5:0.025'), np.arange(11) * 0.025 + 0.25)
+    assert np.allclose(sweep.parseRange('6'), [6.0])
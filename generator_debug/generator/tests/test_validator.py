@@ -0,0 +1,77 @@
+# Pre-flight validation (validator.py) of toolpaths made up by hand
+# The test machine: a 40 inch mandrel, 50 inches of X travel, X at most 200 in/min and the mandrel at most 100 rpm
+
+import definitions
+import toolpath
+import validator
+from conftest import machineConfig
+from toolpath import Toolpath
+
+
+def machine():
+    return machineConfig(6.0, 40.0, 50.0)
+
+
+def move(path, x, z, feed=30.0):
+    path.append(toolpath.MOVE, x, z, feed)
+    return len(path) - 1
+
+
+def test_violations():
+    path = Toolpath()
+    path.append(toolpath.FEED, 0.0, 0.0, 30.0)
+    path.mark(toolpath.LAYER, 0)
+    path.mark(toolpath.PATTERN, 0, 0)
+    move(path, 10.0, 0.0)
+    pastMandrel = move(path, 45.0, 0.0)
+    pastLimit = move(path, 55.0, 0.0)
+    move(path, 10.0, 0.0)
+    path.mark(toolpath.PATTERN, 0, 1)
+    tooFastX = move(path, 20.0, 0.0, 300.0)
+    tooFastZ = move(path, 20.0, 36000.0, 50000.0)
+    # G92 X0 Z0 with the carriage at 20 in, so X35 goes to 55 in
+    path.append(toolpath.SET, 0.0, 0.0, 30.0)
+    offsetPastLimit = move(path, 35.0, 0.0)
+
+    report = validator.validate(path, machine())
+    assert not report['ok']
+    assert report['counts'] == {'xLimit': 2, 'mandrelLength': 1, 'zRpm': 1, 'feedX': 1}
+    assert [(v['kind'], v['row']) for v in report['violations']] == [
+        ('mandrelLength', pastMandrel), ('xLimit', pastLimit), ('feedX', tooFastX), ('zRpm', tooFastZ),
+        ('xLimit', offsetPastLimit)]
+
+    byKind = {(v['kind'], v['row']): v for v in report['violations']}
+    assert byKind['xLimit', offsetPastLimit]['value'] == 55.0
+    assert byKind['xLimit', offsetPastLimit]['limit'] == 50.0
+    assert abs(byKind['zRpm', tooFastZ]['value'] - 50000 / 360) < 1e-9
+    assert [(v['layer'], v['pattern']) for v in report['violations']] == [(0, 0), (0, 0), (0, 1), (0, 1), (0, 1)]
+
+
+def test_leadInAndOut():
+    path = Toolpath()
+    path.append(toolpath.FEED, 0.0, 0.0, 30.0)
+    path.mark(toolpath.LAYER, 0)
+    # Lead-in 5 in, lead-out 15 in: passes have to start 5 in from the end they leave and stop 15 in short of
+    # the end they go to (measured from 0 and x_limit)
+    fromZero = move(path, 2.0, 0.0)
+    fromTwo = move(path, 30.0, 360.0)
+    toTwelve = move(path, 38.0, 720.0)
+    move(path, 20.0, 1080.0)
+    toOne = move(path, 1.0, 1440.0)
+    schedule = [definitions.HelicalWind(36.0, 0.5, 0.1, 30, 1, 0, 0, 5.0, 15.0, False)]
+
+    report = validator.validate(path, machine(), schedule)
+    leads = [(v['kind'], v['row'], v['value']) for v in report['violations'] if v['kind'] in ('leadIn', 'leadOut')]
+    assert leads == [('leadIn', fromZero, 0.0), ('leadIn', fromTwo, 2.0), ('leadOut', toTwelve, 12.0),
+                     ('leadOut', toOne, 1.0)]
+
+    # Without the schedule the lead lengths are not known
+    assert validator.validate(path, machine())['ok']
+
+
+def test_maxViolations():
+    path = Toolpath()
+    for i in range(10):
+        move(path, 60.0 + i, 0.0)
+    report = validator.validate(path, machine(), maxViolations=3)
+    assert report['total'] == 9 and len(report['violations']) == 3
@@ -0,0 +1,48 @@
+# Fixed point positions (winder.FixedAxis): rounding to steps must not build up over a long wind
+
+import numpy as np
+import pytest
+
+import definitions
+import planner
+import toolpath
+import winder
+from conftest import machineConfig
+
+
+# Half a step, the most a commanded position may be off the ideal one
+HALF_STEP = 0.5 / toolpath.SCALE
+
+
+# A narrow tow at one start gives a pattern per circuit, over a thousand of them; the angles are not whole steps
+@pytest.mark.parametrize('vectorized', (True, False))
+def test_noDriftAtPatternEnds(vectorized):
+    machine = machineConfig()
+    layer = definitions.HelicalWind(54, 0.0125, 0.1, 30, 1, 0, 725.3, 0, 0, False)
+    geometry = layer.geometry(machine)
+    assert geometry.numPatterns > 1000
+
+    winding = winder.Winder(30.0, machineConfig=machine)
+    winding.setFeedRate(30.0, force=True)
+    planner.planWind([layer], winding, vectorized)
+    path = winding.getToolpath()
+    machineX, machineZ = path.machinePositions()
+
+    # Exact mandrel angle at the start of each pattern: the initial lock, then whole patterns of five moves per
+    # start (pass, lock, return pass, lock, step to the next start) and the step to the next pattern
+    passAngle = geometry.passAngle
+    lockMove = layer.getLockAngle() - (passAngle % 360)
+    startStep = geometry.passStepAngle * geometry.numCircuits / layer.getNumStarts()
+    patternAngle = layer.getNumStarts() * (2 * passAngle + 2 * lockMove + startStep) + geometry.passStepAngle
+    exactZ = layer.getLockAngle() + patternAngle * np.arange(geometry.numPatterns + 1)
+
+    marks = path.marks()
+    rows = marks['row'][marks['kind'] == toolpath.PATTERN]
+    assert rows.size == geometry.numPatterns
+    atZ = machineZ[rows - 1]
+    assert np.max(np.abs(atZ - exactZ[:-1])) <= HALF_STEP + 1e-9
+    assert np.max(np.abs(machineX[rows - 1])) <= 1e-9
+
+    # The wind ends on the step nearest to the exact angle
+    assert round(machineZ[-1] * toolpath.SCALE) == round(exactZ[-1] * toolpath.SCALE)
+    assert round(machineX[-1] * toolpath.SCALE) == 0
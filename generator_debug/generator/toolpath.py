@@ -0,0 +1,377 @@
+# Compact storage for the commands the winder generates
+# Every command is one row of a few typed arrays instead of a formatted string, so the numbers can be
+# used directly (plotting, time estimates, validation) and gcode text is only produced when exporting.
+
+# Columns:
+#   - op: what kind of command the row is (see the opcodes below)
+#   - x, z: logical position of the axes after the row has run (carried through rows that do not move)
+#   - feed: feed rate in effect after the row
+#   - text: index into the text table for comments and raw commands, -1 otherwise
+# Marks sit next to the rows and record where each layer, pattern and circuit starts, so anything working
+# on the toolpath (time estimates, validation, resume points...) can tell where a row belongs.
+
+from array import array
+
+
+# Opcodes
+UNITS = 0       # G20
+HOME = 1        # G28
+SET = 2         # G92 X Z
+MOVE = 3        # G01 X Z
+FEED = 4        # G01 F
+COMMENT = 5     # (text)
+RAW = 6         # text written out as-is
+
+# Kinds of marks
+LAYER = 0
+PATTERN = 1
+CIRCUIT = 2
+
+# Number of rows rendered at a time when exporting
+RENDER_CHUNK = 1 << 14
+
+# Typed arrays of a toolpath, rows then marks
+COLUMNS = ('op', 'x', 'z', 'feed', 'text', 'markRow', 'markKind', 'markLayer', 'markPattern', 'markCircuit')
+
+# Fixed point steps per inch / degree (see winder.FixedAxis); coordinates are written to this many decimals
+SCALE = 1000
+
+# Largest number of steps formatted without going through float formatting
+MAX_UNITS = 10 ** 15
+
+# Decimals of every number of steps within a unit, the way str() writes them ('.5', '.125', '.0')
+FRACTIONS = ['.' + (f"{r:03d}".rstrip('0') or '0') for r in range(SCALE)]
+
+
+class Toolpath():
+
+    def __init__(self):
+        self.op = array('B')
+        self.x = array('d')
+        self.z = array('d')
+        self.feed = array('d')
+        self.text = array('i')
+        self.strings = []
+
+        # Marks: first row, kind, and layer/pattern/circuit numbers (-1 where not applicable)
+        self.markRow = array('q')
+        self.markKind = array('B')
+        self.markLayer = array('i')
+        self.markPattern = array('i')
+        self.markCircuit = array('i')
+
+
+    def __len__(self):
+        return len(self.op)
+
+
+    # Adds one row
+    def append(self, op, x, z, feed, text=None):
+        self.op.append(op)
+        self.x.append(x)
+        self.z.append(z)
+        self.feed.append(feed)
+        if text is None:
+            self.text.append(-1)
+        else:
+            self.text.append(len(self.strings))
+            self.strings.append(text)
+
+
+    # Marks the start of a layer, pattern or circuit at the next row to be added
+    def mark(self, kind, layer, pattern=-1, circuit=-1):
+        self.markRow.append(len(self.op))
+        self.markKind.append(kind)
+        self.markLayer.append(layer)
+        self.markPattern.append(pattern)
+        self.markCircuit.append(circuit)
+
+
+    # Adds many marks at once; rows are relative to the current end of the toolpath
+    # kinds, layers, patterns and circuits can each be a single value or one per mark
+    def appendMarks(self, rows, kinds, layers, patterns, circuits):
+        import numpy as np
+
+        rows = np.asarray(rows, dtype=np.int64)
+        self.markRow.frombytes((rows + len(self.op)).tobytes())
+        self.markKind.frombytes(np.broadcast_to(np.asarray(kinds, dtype=np.uint8), rows.shape).tobytes())
+        self.markLayer.frombytes(np.broadcast_to(np.asarray(layers, dtype=np.int32), rows.shape).tobytes())
+        self.markPattern.frombytes(np.broadcast_to(np.asarray(patterns, dtype=np.int32), rows.shape).tobytes())
+        self.markCircuit.frombytes(np.broadcast_to(np.asarray(circuits, dtype=np.int32), rows.shape).tobytes())
+
+
+    # Appends all rows of another toolpath
+    # layer, if given, replaces the layer number of the other toolpath's marks (see layercache.py)
+    def extend(self, other, layer=None):
+        import numpy as np
+
+        otherMarks = other.marks()
+        self.markRow.frombytes((otherMarks['row'] + len(self.op)).tobytes())
+        self.markKind.extend(other.markKind)
+        if layer is None:
+            self.markLayer.extend(other.markLayer)
+        else:
+            self.markLayer.frombytes(np.full(len(other.markLayer), layer, dtype=np.int32).tobytes())
+        self.markPattern.extend(other.markPattern)
+        self.markCircuit.extend(other.markCircuit)
+
+        offset = len(self.strings)
+        self.op.extend(other.op)
+        self.x.extend(other.x)
+        self.z.extend(other.z)
+        self.feed.extend(other.feed)
+        if offset == 0:
+            self.text.extend(other.text)
+        else:
+            text = other.arrays()['text']
+            self.text.frombytes(np.where(text >= 0, text + offset, -1).astype(np.int32).tobytes())
+        self.strings.extend(other.strings)
+
+
+    # Adds many rows at once from numpy arrays (ops, x, z, feed)
+    # texts holds the strings of the COMMENT/RAW rows, in order
+    def appendRows(self, ops, xs, zs, feeds, texts=()):
+        import numpy as np
+
+        ops = np.ascontiguousarray(ops, dtype=np.uint8)
+        hasText = (ops == COMMENT) | (ops == RAW)
+        text = np.full(ops.size, -1, dtype=np.int32)
+        text[hasText] = np.arange(len(self.strings), len(self.strings) + int(hasText.sum()), dtype=np.int32)
+        if int(hasText.sum()) != len(texts):
+            raise ValueError("Number of texts does not match the number of comment rows")
+
+        self.op.frombytes(ops.tobytes())
+        self.x.frombytes(np.ascontiguousarray(xs, dtype=np.float64).tobytes())
+        self.z.frombytes(np.ascontiguousarray(zs, dtype=np.float64).tobytes())
+        self.feed.frombytes(np.broadcast_to(np.asarray(feeds, dtype=np.float64), ops.shape).tobytes())
+        self.text.frombytes(text.tobytes())
+        self.strings.extend(texts)
+
+
+    # Copy of rows [start, end)
+    def slice(self, start=0, end=None):
+        part = Toolpath()
+        rows = slice(start, end)
+        part.op = self.op[rows]
+        part.x = self.x[rows]
+        part.z = self.z[rows]
+        part.feed = self.feed[rows]
+
+        # Re-index the text table so the slice only carries its own strings
+        for t in self.text[rows]:
+            if t >= 0:
+                part.text.append(len(part.strings))
+                part.strings.append(self.strings[t])
+            else:
+                part.text.append(-1)
+
+        first, last, _ = rows.indices(len(self.op))
+        for i, row in enumerate(self.markRow):
+            if first <= row < last:
+                part.markRow.append(row - first)
+                part.markKind.append(self.markKind[i])
+                part.markLayer.append(self.markLayer[i])
+                part.markPattern.append(self.markPattern[i])
+                part.markCircuit.append(self.markCircuit[i])
+        return part
+
+
+    def clear(self):
+        del self.op[:]
+        del self.x[:]
+        del self.z[:]
+        del self.feed[:]
+        del self.text[:]
+        self.strings = []
+        for col in (self.markRow, self.markKind, self.markLayer, self.markPattern, self.markCircuit):
+            del col[:]
+
+
+    # The toolpath as flat bytes, one string per column and the text table joined into one string, which is
+    # cheap to pickle and send to another process (see parallel.py); unpack() rebuilds it
+    def pack(self):
+        packed = {name: getattr(self, name).tobytes() for name in COLUMNS}
+        packed['strings'] = '\n'.join(self.strings)
+        packed['numStrings'] = len(self.strings)
+        return packed
+
+
+    # Memory used by the row arrays, in bytes
+    def nbytes(self):
+        return sum(len(col) * col.itemsize for col in (self.op, self.x, self.z, self.feed, self.text))
+
+
+    # Zero-copy numpy views of the columns, for vectorized analysis
+    def arrays(self):
+        import numpy as np
+
+        def view(col, dtype):
+            if len(col) == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.frombuffer(col, dtype=dtype)
+
+        return {'op': view(self.op, np.uint8),
+                'x': view(self.x, np.float64),
+                'z': view(self.z, np.float64),
+                'feed': view(self.feed, np.float64),
+                'text': view(self.text, np.int32)}
+
+
+    # Where the axes physically are after each row, as two numpy arrays
+    # G92 changes the coordinates but does not move anything, G28 takes the machine back to zero
+    def machinePositions(self):
+        import numpy as np
+
+        cols = self.arrays()
+        ops = cols['op']
+        isMove = ops == MOVE
+        dx = np.where(isMove, np.diff(cols['x'], prepend=0.0), 0.0)
+        dz = np.where(isMove, np.diff(cols['z'], prepend=0.0), 0.0)
+        travelX = np.cumsum(dx)
+        travelZ = np.cumsum(dz)
+
+        # Travel counts from the last G28 (or the start)
+        lastHome = np.maximum.accumulate(np.where(ops == HOME, np.arange(ops.size), -1)) if ops.size else np.zeros(0, dtype=np.int64)
+        homed = lastHome >= 0
+        start = np.maximum(lastHome, 0)
+        return (travelX - np.where(homed, travelX[start], 0.0),
+                travelZ - np.where(homed, travelZ[start], 0.0))
+
+
+    # Numpy views of the marks
+    def marks(self):
+        import numpy as np
+
+        def view(col, dtype):
+            if len(col) == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.frombuffer(col, dtype=dtype)
+
+        return {'row': view(self.markRow, np.int64),
+                'kind': view(self.markKind, np.uint8),
+                'layer': view(self.markLayer, np.int32),
+                'pattern': view(self.markPattern, np.int32),
+                'circuit': view(self.markCircuit, np.int32)}
+
+
+    # Layer, pattern and circuit each of the given rows belongs to (-1 where there is none)
+    # Returns three numpy arrays
+    def locate(self, rows):
+        import numpy as np
+
+        rows = np.asarray(rows, dtype=np.int64)
+        marks = self.marks()
+
+        # Index of the most recent mark of a kind at or before each row
+        def latest(kind):
+            selected = np.flatnonzero(marks['kind'] == kind)
+            if selected.size == 0:
+                return np.zeros(rows.shape, dtype=bool), np.zeros(rows.shape, dtype=np.int64)
+            index = np.searchsorted(marks['row'][selected], rows, side='right') - 1
+            return index >= 0, selected[np.maximum(index, 0)]
+
+        found, m = latest(LAYER)
+        layer = np.where(found, marks['layer'][m] if m.size and marks['layer'].size else -1, -1)
+
+        # A pattern (circuit) only counts if it was marked within the same layer (pattern)
+        found, m = latest(PATTERN)
+        if marks['pattern'].size:
+            found &= marks['layer'][m] == layer
+            pattern = np.where(found, marks['pattern'][m], -1)
+        else:
+            pattern = np.full(rows.shape, -1)
+
+        found, m = latest(CIRCUIT)
+        if marks['circuit'].size:
+            found &= (marks['layer'][m] == layer) & (marks['pattern'][m] == pattern)
+            circuit = np.where(found, marks['circuit'][m], -1)
+        else:
+            circuit = np.full(rows.shape, -1)
+
+        return layer.astype(np.int32), pattern.astype(np.int32), circuit.astype(np.int32)
+
+
+    # Renders rows [start, end) as gcode text
+    def render(self, start=0, end=None):
+        if end is None:
+            end = len(self.op)
+
+        lines = []
+        for chunkStart in range(start, end, RENDER_CHUNK):
+            lines.extend(self.renderChunk(chunkStart, min(chunkStart + RENDER_CHUNK, end)))
+        return lines
+
+
+    # Yields the gcode text in chunks of lines, without building the whole program at once
+    def iterChunks(self, start=0, end=None):
+        if end is None:
+            end = len(self.op)
+
+        for chunkStart in range(start, end, RENDER_CHUNK):
+            yield self.renderChunk(chunkStart, min(chunkStart + RENDER_CHUNK, end))
+
+
+    def renderChunk(self, start, end):
+        # Coordinates repeat a lot (wind length, lock positions...), so each distinct value is only formatted once
+        numbers = {}
+
+        def number(v):
+            s = numbers.get(v)
+            if s is None:
+                s = numbers[v] = formatNumber(v)
+            return s
+
+        strings = self.strings
+        lines = []
+        append = lines.append
+        for op, x, z, f, t in zip(self.op[start:end], self.x[start:end], self.z[start:end],
+                                  self.feed[start:end], self.text[start:end]):
+            if op == MOVE:
+                append("G01 X" + number(x) + " Z" + number(z))
+            elif op == COMMENT:
+                append("(" + strings[t] + ")")
+            elif op == SET:
+                append("G92 X" + number(x) + " Z" + number(z))
+            elif op == FEED:
+                append("G01 F" + number(f))
+            elif op == UNITS:
+                append("G20")
+            elif op == HOME:
+                append("G28")
+            elif op == RAW:
+                append(strings[t])
+        return lines
+
+
+# Toolpath from Toolpath.pack()
+def unpack(packed) -> Toolpath:
+    path = Toolpath()
+    for name in COLUMNS:
+        getattr(path, name).frombytes(packed[name])
+    path.strings = packed['strings'].split('\n') if packed['numStrings'] else []
+    return path
+
+
+# Formats a coordinate the way the winder always has (rounded to 3 decimal places, as str(round(v, 3)))
+# Coordinates from the winder are whole steps, which are formatted from the integer directly; anything else
+# (and -0.0, nan, inf) goes through float formatting
+# Every coordinate is a float here, so zero is written 0.0. The float winder wrote 0 where it was handed an
+# integer literal (the G92 X0 Z0 after homing, the Z0 of each pattern's G92) and 0.0 elsewhere; GRBL reads both
+# the same, and golden.py's diff ignores number formatting
+def formatNumber(v):
+    try:
+        n = round(v * SCALE)
+    except (ValueError, OverflowError):
+        return str(round(v, 3))
+    if n and n / SCALE == v and -MAX_UNITS < n < MAX_UNITS:
+        return formatUnits(n)
+    return str(round(v, 3))
+
+
+# Formats a number of steps as a decimal
+def formatUnits(n):
+    if n < 0:
+        q, r = divmod(-n, SCALE)
+        return '-' + str(q) + FRACTIONS[r]
+    q, r = divmod(n, SCALE)
+    return str(q) + FRACTIONS[r]
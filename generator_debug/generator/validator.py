@@ -0,0 +1,189 @@
+# Pre-flight validation of a planned toolpath
+# Checks the whole program against the machine in one vectorized pass, before anything is sent to it:
+#   - xLimit: the carriage goes below zero or past x_limit
+#   - mandrelLength: the carriage goes past the end of the mandrel (mandrel_length), within x_limit
+#   - leadIn / leadOut: a pass starts (ends) too close to an end of the travel to leave room for the
+#     layer's lead-in (lead-out) length; needs the schedule
+#   - zRpm: a move turns the mandrel faster than max_feed_z allows (MachineConfig.maxRpm)
+#   - feedX: a move drives the carriage faster than max_feed_x
+# Feed rates are along the combined X/Z vector (as GRBL and estimator.py take them), so each axis gets its share
+# of the move's feed. GRBL quietly slows such moves down, which changes the wind angle, so they are reported.
+# Positions are where the machine physically is (G92 offsets and G28 accounted for). The toolpath is only read.
+# Every violation comes with its row and the layer, pattern and circuit it is in. A million moves take a fraction
+# of a second, so it can run after every generation.
+
+# Usage:
+#   report = validator.validate(machine.getToolpath(), machine.getConfig(), schedule)
+#   validator.printReport(report)
+# or from the command line (moves the winder rejected while planning are reported too):
+#   python validator.py TEST.wind --config machine_config.json --json violations.json
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import config
+import toolpath
+from toolpath import Toolpath
+
+
+# Kinds of violations, in the order they are reported
+KINDS = ('xLimit', 'mandrelLength', 'leadIn', 'leadOut', 'zRpm', 'feedX')
+
+# What each kind means, for reports
+DESCRIPTIONS = {'xLimit': "carriage outside 0..x_limit [in]",
+                'mandrelLength': "carriage past the end of the mandrel [in]",
+                'leadIn': "room before a pass for the lead-in [in]",
+                'leadOut': "room after a pass for the lead-out [in]",
+                'zRpm': "mandrel speed over the max RPM [rpm]",
+                'feedX': "carriage feed over max_feed_x [in/min]"}
+
+# Violations listed one by one, the first ones by row; every violation is counted
+MAX_VIOLATIONS = 1000
+
+# Slack on every limit, so rounding in the positions is not reported
+TOLERANCE = 1e-6
+
+
+# Validates a toolpath against the machine
+# schedule, if given, is the list of layers the toolpath was planned from (for the lead-in/lead-out lengths)
+# Returns a dict: moves, total, counts (per kind), violations (the first maxViolations, each with kind, row,
+# layer, pattern, circuit, value and limit) and ok
+def validate(path: Toolpath, machineConfig=config.DEFAULT_CONFIG, schedule=None, maxViolations=MAX_VIOLATIONS):
+    machineConfig = config.getConfig(machineConfig)
+    cols = path.arrays()
+    machineX, machineZ = path.machinePositions()
+
+    rows = np.flatnonzero(cols['op'] == toolpath.MOVE)
+    rows = rows[rows > 0]
+    x0, x1 = machineX[rows - 1], machineX[rows]
+    dx = x1 - x0
+    dz = machineZ[rows] - machineZ[rows - 1]
+
+    found = {}
+
+    # Envelope
+    xLimit = machineConfig.xLimit
+    outside = (x1 < -TOLERANCE) | (x1 > xLimit + TOLERANCE)
+    found['xLimit'] = (outside, x1, np.where(x1 < 0, 0.0, xLimit))
+    found['mandrelLength'] = (~outside & (x1 > machineConfig.mandrelLength + TOLERANCE), x1, machineConfig.mandrelLength)
+
+    # Room for the lead-in behind where a pass starts and for the lead-out past where it ends
+    if schedule:
+        leadIn = np.array([getattr(layer, 'leadInLength', 0.0) for layer in schedule] + [0.0])
+        leadOut = np.array([getattr(layer, 'leadOutLength', 0.0) for layer in schedule] + [0.0])
+        layers = path.locate(rows)[0]
+        layers = np.where((layers >= 0) & (layers < len(schedule)), layers, len(schedule))
+        forward = dx > 0
+        isPass = np.abs(dx) > TOLERANCE
+        before = np.where(forward, x0, xLimit - x0)
+        after = np.where(forward, xLimit - x1, x1)
+        found['leadIn'] = (isPass & (before < leadIn[layers] - TOLERANCE), before, leadIn[layers])
+        found['leadOut'] = (isPass & (after < leadOut[layers] - TOLERANCE), after, leadOut[layers])
+
+    # Speed of each axis at the move's feed rate
+    length = np.hypot(dx, dz)
+    feed = cols['feed'][rows]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = feed / length
+    share = np.where(length > 0, share, 0.0)
+    rpm = np.abs(dz) * share / 360
+    feedX = np.abs(dx) * share
+    found['zRpm'] = (rpm > machineConfig.maxRpm() * (1 + TOLERANCE), rpm, machineConfig.maxRpm())
+    found['feedX'] = (feedX > machineConfig.maxFeedX * (1 + TOLERANCE), feedX, machineConfig.maxFeedX)
+
+    # Every violation, then the first ones by row get their location
+    counts = {}
+    kinds, violationRows, values, limits = [], [], [], []
+    for k, kind in enumerate(KINDS):
+        if kind not in found:
+            continue
+        mask, value, limit = found[kind]
+        selected = np.flatnonzero(mask)
+        counts[kind] = int(selected.size)
+        kinds.append(np.full(selected.size, k))
+        violationRows.append(rows[selected])
+        values.append(value[selected])
+        limits.append(np.broadcast_to(limit, mask.shape)[selected])
+
+    kinds = np.concatenate(kinds)
+    violationRows = np.concatenate(violationRows)
+    order = np.lexsort((kinds, violationRows))[:maxViolations]
+    kinds, violationRows = kinds[order], violationRows[order]
+    values, limits = np.concatenate(values)[order], np.concatenate(limits)[order]
+    layers, patterns, circuits = path.locate(violationRows)
+
+    violations = [{'kind': KINDS[k], 'row': r, 'layer': l, 'pattern': p, 'circuit': c, 'value': v, 'limit': m}
+                  for k, r, l, p, c, v, m in zip(kinds.tolist(), violationRows.tolist(), layers.tolist(),
+                                                 patterns.tolist(), circuits.tolist(), values.tolist(), limits.tolist())]
+    total = sum(counts.values())
+    return {'moves': int(rows.size), 'total': total, 'counts': counts, 'violations': violations, 'ok': total == 0}
+
+
+def describe(violation) -> str:
+    where = f"layer {violation['layer']}"
+    if violation['pattern'] >= 0:
+        where += f" pattern {violation['pattern']}"
+    if violation['circuit'] >= 0:
+        where += f" circuit {violation['circuit']}"
+    return (f"{violation['kind']} at row {violation['row']} ({where}): "
+            f"{violation['value']:.3f} against {violation['limit']:.3f}")
+
+
+def printReport(report, limit=20, printFn=print):
+    if report['ok']:
+        printFn(f"Validation: {report['moves']} moves, no violations")
+        return
+    printFn(f"Validation: {report['total']} violations in {report['moves']} moves")
+    for kind, count in report['counts'].items():
+        if count:
+            printFn(f"\t{kind}: {count} ({DESCRIPTIONS[kind]})")
+    for violation in report['violations'][:limit]:
+        printFn(f"\t{describe(violation)}")
+    if report['total'] > limit:
+        printFn(f"\t... {report['total'] - min(limit, len(report['violations']))} more")
+
+
+def main(argv=None):
+    import helper
+    import instrument
+    import load
+    import planner
+    import winder
+
+    parser = argparse.ArgumentParser(description="Check a planned wind against the machine before running it")
+    parser.add_argument('file', help="wind file to plan")
+    parser.add_argument('--config', default=config.DEFAULT_CONFIG, help="machine config file or profile")
+    parser.add_argument('--feed', type=float, default=None, help="override the default feed rate")
+    parser.add_argument('--limit', type=int, default=20, help="violations to print")
+    parser.add_argument('--json', default=None, help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    [schedule, defaultFeedRate] = helper.buildSchedule(load.read_data(args.file))
+    if args.feed is not None:
+        defaultFeedRate = args.feed
+
+    metrics = instrument.Metrics()
+    machine = winder.Winder(defaultFeedRate, machineConfig=args.config, observers=[metrics])
+    machine.setFeedRate(defaultFeedRate, force=True)
+    planner.planWind(schedule, machine)
+
+    report = validate(machine.getToolpath(), machine.getConfig(), schedule)
+    report['rejectedMoves'] = metrics.rejectedMoves
+    report['rejections'] = metrics.rejections
+    printReport(report, args.limit)
+    if metrics.rejectedMoves:
+        print(f"The winder also rejected {metrics.rejectedMoves} moves while planning (left out of the program):")
+        for rejection in metrics.rejections[:args.limit]:
+            print(f"\tlayer {rejection['layer']}: X {rejection['x']:.3f} Z {rejection['z']:.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['ok'] and not metrics.rejectedMoves else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
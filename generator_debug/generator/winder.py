@@ -7,42 +7,264 @@
 #   - The y-axis is currently unused, but could be employed in the future
 #   - GRBL does not allow for additional rotational axes. For a future expansion to a four-axis machine,
 #     a different firmware will likely be required.
+#   - Positions are kept in fixed point, in integer steps of 1/1000 inch and 1/1000 degree (toolpath.SCALE),
+#     which is also what the gcode is written with
 
-import json
+import config
+import toolpath
+from toolpath import Toolpath
+
+
+# Once Z has wound this far from zero [degrees], the next safe point brings it back within a turn with a G92
+RENORMALIZE_Z = 3600.0
+
+# One turn of the mandrel in steps
+TURN = 360 * toolpath.SCALE
+
+
+# Nearest step to a position in inches or degrees
+def toUnits(value) -> int:
+    return round(value * toolpath.SCALE)
+
+
+# One axis in fixed point
+# units is the logical position in steps, as written to the gcode. Moves are added up unrounded since the last
+# G92 (run) on top of where that G92 left the ideal position (ref), and units is always the step nearest to
+# ref + run, so rounding never builds up however many moves there are. A G92 carries over the fraction of a
+# step the axis was off by, and renormalizing only takes whole turns off (shift), so neither causes drift.
+class FixedAxis():
+
+    def __init__(self, units=0):
+        self.place(units)
+
+
+    # Puts the axis exactly at a position, nothing carried over
+    def place(self, units):
+        self.units = int(units)
+        self.ref = float(units)
+        self.run = 0.0
+        self.shift = 0
+
+
+    def value(self) -> float:
+        return self.units / toolpath.SCALE
+
+
+    # (run, units) after moving by delta, without moving
+    def advance(self, delta):
+        run = self.run + delta * toolpath.SCALE
+        return run, round(self.ref + run) - self.shift
+
+
+    def commit(self, run, units):
+        self.run = run
+        self.units = units
+
+
+    # G92: the logical position becomes value, the axis does not move
+    def set(self, value):
+        ideal = self.ref + self.run
+        self.units = toUnits(value)
+        self.ref = self.units + (ideal - round(ideal))
+        self.run = 0.0
+        self.shift = 0
+
+
+    # Takes whole periods off the position once it is at least limit steps from zero, so it ends up in [0, period)
+    # Returns True if it did
+    def renormalize(self, period, limit) -> bool:
+        if abs(self.units) < limit:
+            return False
+        turns = self.units // period
+        self.shift += turns * period
+        self.units -= turns * period
+        return True
+
+
+    def state(self):
+        return (self.units, self.ref, self.run, self.shift)
+
+
+    def restore(self, units, ref, run, shift):
+        self.units = int(units)
+        self.ref = float(ref)
+        self.run = float(run)
+        self.shift = int(shift)
 
 
 class Winder():
 
     ## Initializing the winder
-    def __init__(self, defaultFeedrate):
-        [self.mandrelDiameter, self.mandrelLength, self.xLimit] = Winder.loadMachineConfig()
+    # Commands are recorded in a compact toolpath (see toolpath.py) and only turned into gcode text on export.
+    # If a sink is given (see sinks.py), the toolpath is rendered into it in chunks as planning goes,
+    # so memory stays flat however large the job is. Without a sink the whole toolpath is kept.
+    # The machine config can be a path, a registered profile name or a MachineConfig (see config.py).
+    # Observers (see instrument.py) are told about layers, rejected moves and rendering as planning goes.
+    def __init__(self, defaultFeedrate, sink=None, flushEvery=toolpath.RENDER_CHUNK, machineConfig=config.DEFAULT_CONFIG,
+                 observers=()):
+        self.config = config.getConfig(machineConfig)
+        [self.mandrelDiameter, self.mandrelLength, self.xLimit] = Winder.loadMachineConfig(self.config)
 
         self.defaultFeedrate = defaultFeedrate
+        self.currentFeedRate = None
+
+        self.axisX = FixedAxis()
+        self.axisZ = FixedAxis()
+        self.renormalizeLimit = toUnits(RENORMALIZE_Z)
 
-        self.X = 0
-        self.Z = 0
+        # Where in the schedule the planner currently is (see startLayer/startPattern)
+        self.layerIndex = -1
+        self.patternIndex = -1
 
-        self.gcode = []
+        self.toolpath = Toolpath()
+        self.sink = sink
+        self.flushEvery = flushEvery
+        self.observers = list(observers)
 
         # Automatically defining it as inches
-        self.gcode.append("G20")
+        self.record(toolpath.UNITS)
 
 
-    # Loads information about the filament winder from a config file
-    def loadMachineConfig():
-        configFile = open('machine_config.json')
+    # Logical position in inches and degrees
+    @property
+    def X(self) -> float:
+        return self.axisX.units / toolpath.SCALE
+
+    @X.setter
+    def X(self, value):
+        self.axisX.place(toUnits(value))
 
-        machineData = json.load(configFile)
+    @property
+    def Z(self) -> float:
+        return self.axisZ.units / toolpath.SCALE
 
-        mandrelDiameter = machineData['mandrel_diameter']
-        mandrelLength = machineData['mandrel_length']
-        xLimit = machineData['x_limit']
+    @Z.setter
+    def Z(self, value):
+        self.axisZ.place(toUnits(value))
+
+
+    # Loads information about the filament winder from a config file
+    # Served from the config registry, so the file is only parsed again when it changes
+    def loadMachineConfig(machineConfig=config.DEFAULT_CONFIG):
+        machineData = config.getConfig(machineConfig)
+
+        mandrelDiameter = machineData.mandrelDiameter
+        mandrelLength = machineData.mandrelLength
+        xLimit = machineData.xLimit
 
         return [mandrelDiameter, mandrelLength, xLimit]
-    
+
+
+    # Adds a row to the toolpath at the current position and feed rate
+    def record(self, op, text=None):
+        feed = self.currentFeedRate if self.currentFeedRate is not None else self.defaultFeedrate
+        self.toolpath.append(op, self.axisX.units / toolpath.SCALE, self.axisZ.units / toolpath.SCALE, feed, text)
+
+        if self.sink is not None and len(self.toolpath) >= self.flushEvery:
+            self.flush()
+
+
+    # Adds a block of rows computed in bulk (see planner.planHelicalPatterns)
+    # marks, if given, is (rows relative to the block, kinds, patterns, circuits) within the current layer
+    # axes, if given, is the state of both axes after the block (FixedAxis.state()); otherwise the machine ends up
+    # exactly at the position of the last row
+    # feeds, if given, is the feed rate after every row (the block sets its own with FEED rows)
+    def recordRows(self, ops, xs, zs, texts=(), marks=None, axes=None, feeds=None):
+        if len(ops) == 0:
+            return
+        if feeds is None:
+            feed = self.currentFeedRate if self.currentFeedRate is not None else self.defaultFeedrate
+        else:
+            feed = feeds
+            self.currentFeedRate = float(feeds[-1])
+        if marks is not None:
+            rows, kinds, patterns, circuits = marks
+            self.toolpath.appendMarks(rows, kinds, self.layerIndex, patterns, circuits)
+            self.patternIndex = int(patterns[-1])
+        self.toolpath.appendRows(ops, xs, zs, feed, texts)
+        if axes is None:
+            self.X = float(xs[-1])
+            self.Z = float(zs[-1])
+        else:
+            self.axisX.restore(*axes[0])
+            self.axisZ.restore(*axes[1])
+
+        if self.sink is not None and len(self.toolpath) >= self.flushEvery:
+            self.flush()
+
+
+    # Appends a toolpath planned elsewhere (a cached layer, see layercache.py) to the current layer
+    # The machine carries on from the state the appended rows left it in (see state())
+    def appendToolpath(self, path: Toolpath, state):
+        self.toolpath.extend(path, layer=self.layerIndex)
+        self.setState(state)
+
+        if self.sink is not None and len(self.toolpath) >= self.flushEvery:
+            self.flush()
+
+
+    # Everything the next rows depend on: both axes (see FixedAxis.state) and the feed rate
+    def state(self):
+        return (self.axisX.state(), self.axisZ.state(), self.currentFeedRate)
+
+
+    def setState(self, state):
+        x, z, feed = state
+        self.axisX.restore(*x)
+        self.axisZ.restore(*z)
+        self.currentFeedRate = feed
+
+
+    # Marks where a layer, pattern or circuit of the schedule starts in the toolpath
+    def startLayer(self, index):
+        self.layerIndex = index
+        self.patternIndex = -1
+        self.toolpath.mark(toolpath.LAYER, index)
+        self.notify('layerStarted', index)
+
+
+    def endLayer(self):
+        self.notify('layerFinished', self.layerIndex)
+
+
+    def startPattern(self, index):
+        self.patternIndex = index
+        self.toolpath.mark(toolpath.PATTERN, self.layerIndex, index)
+
+
+    def startCircuit(self, index):
+        self.toolpath.mark(toolpath.CIRCUIT, self.layerIndex, self.patternIndex, index)
+
+
+    # Writes out a command that has no structured form
+    def emit(self, command):
+        self.record(toolpath.RAW, command)
+
+
+    # Renders everything recorded so far into the sink and drops it from memory
+    def flush(self):
+        if self.sink is None or len(self.toolpath) == 0:
+            return
+        self.notify('flushing')
+        for lines in self.toolpath.iterChunks():
+            self.sink.pushLines(lines)
+            self.notify('emitted', lines)
+        self.toolpath.clear()
+
+
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
+
+    # Calls the event on every observer
+    def notify(self, event, *args):
+        for observer in self.observers:
+            getattr(observer, event)(self, *args)
+
+
     # G28 literally sends all of the axes to their predefined home position
     def moveHome(self):
-        self.gcode.append("G28")
+        self.record(toolpath.HOME)
 
 
     # Set the axes to zero
@@ -53,25 +275,37 @@ class Winder():
     # Set the axes to the specified X and Z value
     # G92 literally sets the x/z point to whatever value they're at
     def setAxes(self, x, z) -> None:
-        self.X = x
-        self.Z = z
+        self.axisX.set(x)
+        self.axisZ.set(z)
 
-        command = "G92 X" + str(round(x, 3)) + " Z" + str(round(z, 3))
-        self.gcode.append(command)
+        self.record(toolpath.SET)
+
+
+    # Brings Z back within a turn (G92) once it has wound up past RENORMALIZE_Z, so the numbers stay short
+    # The planner calls it at the start of every circuit, where nothing depends on the absolute angle
+    def renormalize(self) -> None:
+        if self.axisZ.renormalize(TURN, self.renormalizeLimit):
+            self.record(toolpath.SET)
 
 
     # Actuates each axis by the specified amount
     # (G01 moves the steppers)
-    def moveBy(self, dx, dz) -> None:
-        if (self.outOfBounds(self.X + dx, self.Z + dz)):
+    # feed, if given, is the feed rate for this move (an F line is only written when it changes)
+    def moveBy(self, dx, dz, feed=None) -> None:
+        if feed is not None:
+            self.setFeedRate(feed)
+        axisX, axisZ = self.axisX, self.axisZ
+        runX, x = axisX.advance(dx)
+        runZ, z = axisZ.advance(dz)
+        if (self.outOfBounds(x / toolpath.SCALE, z / toolpath.SCALE)):
             print("Error: Location is out of bounds")
+            self.notify('moveRejected', x / toolpath.SCALE, z / toolpath.SCALE)
             return
         
-        self.X = self.X + dx
-        self.Z = self.Z + dz
+        axisX.run, axisX.units = runX, x
+        axisZ.run, axisZ.units = runZ, z
 
-        command = "G01 X" + str(round(self.X, 3)) + " Z" + str(round(self.Z, 3))
-        self.gcode.append(command)
+        self.record(toolpath.MOVE)
 
         return
 
@@ -80,13 +314,13 @@ class Winder():
     def moveTo(self, x, z) -> None:
         if (self.outOfBounds(x, z)):
             print("Error: Location is out of bounds")
+            self.notify('moveRejected', x, z)
             return
         
-        self.X = x
-        self.Z = z
+        self.axisX.place(toUnits(x))
+        self.axisZ.place(toUnits(z))
 
-        command = "G01 X" + str(round(self.X, 3)) + " Z" + str(round(self.Z, 3))
-        self.gcode.append(command)
+        self.record(toolpath.MOVE)
 
         return
     
@@ -94,23 +328,55 @@ class Winder():
     def setFeedRate(self, f, force=False):
     
         if force or self.currentFeedRate is None or f != self.currentFeedRate:
-            self.gcode.append("G01 F" + str(round(f, 3)))
             self.currentFeedRate = f
+            self.record(toolpath.FEED)
 
     
 
     def pushComment(self, comment):
-        self.gcode.append("(" + comment + ")")
+        self.record(toolpath.COMMENT, comment)
     
 
+    def getConfig(self) -> config.MachineConfig:
+        return self.config
+
+
     def getProperties(self):
         return {'diameter': self.mandrelDiameter,
                 'length': self.mandrelLength,
                 'xLimit': self.xLimit}
     
 
+    # Gcode text of the whole program by default, or whatever the sink produced when streaming
     def getGcode(self):
-        return self.gcode
+        if self.sink is None:
+            lines = self.toolpath.render()
+            self.notify('rendered', lines)
+            return lines
+        self.flush()
+        return self.sink.result()
+
+
+    def getToolpath(self) -> Toolpath:
+        return self.toolpath
+
+
+    # Replaces the toolpath with a loaded one (see reader.py), the machine carries on from where it ends
+    def loadToolpath(self, path: Toolpath):
+        self.toolpath = path
+        if len(path):
+            self.X = path.x[-1]
+            self.Z = path.z[-1]
+            self.currentFeedRate = path.feed[-1]
+
+
+    # Flushes and closes the sink once planning is done
+    def finish(self):
+        if self.sink is None:
+            return self.getGcode()
+        self.flush()
+        self.sink.close()
+        return self.sink.result()
     
 
     def getDiameter(self) -> float: